@@ -0,0 +1,22 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5")
+
+TOOL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "照片排版工具5a.py")
+
+
+@pytest.fixture(scope="session")
+def tool():
+    """加载照片排版工具模块（文件名为中文，不能直接import）"""
+    spec = importlib.util.spec_from_file_location("photo_layout_tool", TOOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # 注册模块，子进程执行订单时可按模块名找到其中的函数
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
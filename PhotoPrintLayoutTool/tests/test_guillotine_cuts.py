@@ -0,0 +1,76 @@
+import itertools
+
+import pytest
+
+EPS = 1e-6
+CANVASES = [(10.2, 15.2), (12.7, 17.8), (21.0, 29.7), (15.2, 10.2)]
+PHOTOS = [(2.5, 3.5), (3.3, 4.8), (3.5, 4.9), (8.9, 12.7)]
+SPACINGS = [(0.0, 0.0), (0.2, 0.3)]
+MARGINS = [0.0, 0.3]
+
+
+def replay_cuts(sheet_w, sheet_h, cuts):
+    """按顺序执行裁切，每一刀必须恰好从一块纸的一边切到对边，返回最后的纸块"""
+    pieces = [(0.0, 0.0, sheet_w, sheet_h)]
+    for axis, pos, start, end in cuts:
+        for index, (x0, y0, x1, y1) in enumerate(pieces):
+            if axis == "v":
+                fits = x0 + EPS < pos < x1 - EPS and abs(y0 - start) < EPS and abs(y1 - end) < EPS
+                parts = [(x0, y0, pos, y1), (pos, y0, x1, y1)]
+            else:
+                fits = y0 + EPS < pos < y1 - EPS and abs(x0 - start) < EPS and abs(x1 - end) < EPS
+                parts = [(x0, y0, x1, pos), (x0, pos, x1, y1)]
+            if fits:
+                pieces[index:index + 1] = parts
+                break
+        else:
+            raise AssertionError(f"无法执行的一刀: {(axis, pos, start, end)}")
+    return pieces
+
+
+@pytest.mark.parametrize("canvas,photo,spacing,margin",
+                         list(itertools.product(CANVASES, PHOTOS, SPACINGS, MARGINS)))
+def test_guillotine_cuts_can_be_performed(tool, canvas, photo, spacing, margin):
+    canvas_size = {"width": canvas[0], "height": canvas[1]}
+    photo_size = {"width": photo[0], "height": photo[1]}
+    info = tool.compute_layout(canvas_size, photo_size, spacing, 300, layout_mode=2,
+                               margin=margin)
+    sheet_w, sheet_h = info["used_canvas"]
+    pieces = replay_cuts(sheet_w, sheet_h, info["cuts"])
+    
+    placements, _ = tool.plan_guillotine_layout(
+        sheet_w - 2 * margin, sheet_h - 2 * margin, photo[0], photo[1],
+        spacing[0], spacing[1], margin
+    )
+    assert len(placements) == info["total_photos"]
+    for x, y, w, h, _ in placements:
+        # 每张照片都是单独裁下的一块，且不进入页边距
+        assert any(abs(x - p[0]) < EPS and abs(y - p[1]) < EPS and
+                   abs(x + w - p[2]) < EPS and abs(y + h - p[3]) < EPS for p in pieces)
+        assert x >= margin - EPS and y >= margin - EPS
+        assert x + w <= sheet_w - margin + EPS and y + h <= sheet_h - margin + EPS
+
+
+def test_margin_trims_replace_centering_cuts(tool):
+    placements, cuts = tool.plan_guillotine_layout(10.0, 10.0, 3.0, 3.0, 0.0, 0.0, 0.5)
+    assert len(placements) == 9
+    # 占用矩形在排列区域中居中，四边各一刀，不会先裁页边距再裁居中余量
+    assert cuts[:4] == (("v", 1.0, 0.0, 11.0), ("v", 10.0, 0.0, 11.0),
+                        ("h", 1.0, 1.0, 10.0), ("h", 10.0, 1.0, 10.0))
+    assert not any(axis == "v" and pos in (0.5, 10.5) for axis, pos, _, _ in cuts)
+
+
+def test_plan_cache_returns_immutable_results(tool):
+    first = tool.plan_guillotine_layout(15.2, 10.2, 3.5, 4.9, 0.2, 0.2)
+    assert isinstance(first[0], tuple) and isinstance(first[1], tuple)
+    assert tool.plan_guillotine_layout(15.2, 10.2, 3.5, 4.9, 0.2, 0.2) is first
+
+
+def test_timed_out_plans_are_not_cached(tool, monkeypatch):
+    # 时间预算为0，搜索立即超时
+    monkeypatch.setattr(tool.GuillotinePlanner.__init__, "__defaults__",
+                        (tool.GUILLOTINE_CUT_WEIGHT, 0))
+    args = (29.7, 21.0, 2.5, 3.5, 0.1, 0.1)
+    first = tool.plan_guillotine_layout(*args)
+    assert first[0]
+    assert tool.plan_guillotine_layout(*args) is not first
@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def qt_app():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def write_oriented_jpeg(path, orientation):
+    """写入带EXIF方向的200×100 JPEG：左边四分之一为红色，其余为蓝色"""
+    image_module = pytest.importorskip("PIL.Image")
+    image = image_module.new("RGB", (200, 100), (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, 50, 100))
+    exif = image_module.Exif()
+    exif[0x0112] = orientation
+    image.save(path, exif=exif.tobytes(), quality=95)
+
+
+def is_red(image, x, y):
+    from PyQt5.QtGui import QColor
+    red, _, blue, _ = QColor(image.pixel(x, y)).getRgb()
+    return red > 200 and blue < 60
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_loaders_agree_on_orientation(tool, qt_app, tmp_path, orientation):
+    path = str(tmp_path / f"o{orientation}.jpg")
+    write_oriented_jpeg(path, orientation)
+    full, _ = tool.read_image(path)
+    assert not full.isNull()
+    with open(path, "rb") as f:
+        info = tool.photo_info(f.read())
+    assert (info["width"], info["height"]) == (full.width(), full.height())
+    assert tool.oriented_size(tool.open_image_reader(path)).width() == full.width()
+    
+    # 缩小解码和只解码一部分时，方向与完整读取一致
+    small, _ = tool.read_image(path, full.width() // 2, full.height() // 2)
+    assert (small.width(), small.height()) == (full.width() // 2, full.height() // 2)
+    for fx, fy in ((0.1, 0.1), (0.9, 0.9), (0.1, 0.9), (0.9, 0.1)):
+        assert is_red(small, int(fx * small.width()), int(fy * small.height())) == \
+            is_red(full, int(fx * full.width()), int(fy * full.height()))
+    
+    from PyQt5.QtCore import QRect
+    clip = QRect(0, 0, full.width() // 2, full.height() // 2)
+    reader = tool.open_image_reader(path)
+    tool.set_clip_rect(reader, clip)
+    part = reader.read()
+    assert (part.width(), part.height()) == (clip.width(), clip.height())
+    for x, y in ((5, 5), (clip.width() - 5, clip.height() - 5)):
+        assert is_red(part, x, y) == is_red(full, x, y)
@@ -0,0 +1,68 @@
+import csv
+
+import pytest
+
+
+@pytest.fixture
+def manifest(tool, tmp_path):
+    """两张源照片、三个订单的CSV清单"""
+    from PyQt5.QtGui import QColor, QImage
+    sources = []
+    for name, color in (("a.png", QColor(200, 30, 30)), ("b.png", QColor(30, 30, 200))):
+        image = QImage(350, 490, QImage.Format_RGB888)
+        image.fill(color)
+        path = str(tmp_path / name)
+        assert image.save(path)
+        sources.append(path)
+    rows = [
+        {"source": sources[0], "photo_size": "2寸", "canvas": "6寸(4R)", "copies": "0",
+         "dpi": "100", "format": "PNG", "output": str(tmp_path / "out" / "a.png")},
+        {"source": sources[1], "photo_size": "1寸", "canvas": "6寸(4R)", "copies": "20",
+         "dpi": "100", "format": "JPG", "output": str(tmp_path / "out" / "b.jpg")},
+        {"source": sources[0], "photo_size": "2寸", "canvas": "6寸(4R)", "copies": "0",
+         "dpi": "100", "format": "PNG", "output": str(tmp_path / "out" / "a_copy.png")},
+    ]
+    path = tmp_path / "orders.csv"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path), [row["output"] for row in rows]
+
+
+def read_checkpoint(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def test_manifest_resumes_from_checkpoint(tool, manifest, tmp_path, capsys):
+    manifest_path, outputs = manifest
+    checkpoint = manifest_path + ".done"
+    assert tool.run_manifest(manifest_path, workers=2) == 0
+    assert sorted(read_checkpoint(checkpoint)) == sorted(outputs)
+    # 20张1寸照片超出一张6寸纸，按页编号输出
+    produced = sorted(p.name for p in (tmp_path / "out").iterdir())
+    assert produced == ["a.png", "a_copy.png", "b_001.jpg", "b_002.jpg"]
+    
+    # 已完成的订单全部跳过，不会重新渲染
+    (tmp_path / "out" / "a.png").unlink()
+    capsys.readouterr()
+    assert tool.run_manifest(manifest_path, workers=2) == 0
+    assert "已完成3个，本次执行0个" in capsys.readouterr().out
+    assert not (tmp_path / "out" / "a.png").exists()
+    
+    # 模拟中断：检查点中只记录了第一个订单，重新运行时只执行其余订单
+    with open(checkpoint, "w", encoding="utf-8") as f:
+        f.write(outputs[1] + "\n")
+    assert tool.run_manifest(manifest_path, workers=2) == 0
+    assert "已完成1个，本次执行2个" in capsys.readouterr().out
+    assert (tmp_path / "out" / "a.png").exists()
+    assert sorted(read_checkpoint(checkpoint)) == sorted(outputs)
+
+
+def test_manifest_invalid_orders_are_reported(tool, tmp_path, capsys):
+    path = tmp_path / "bad.json"
+    path.write_text('{"orders": [{"source": "x.png", "photo_size": "不存在", "canvas": "A4",'
+                    ' "output": "x.png"}]}', encoding="utf-8")
+    assert tool.run_manifest(str(path), workers=1) == 1
+    assert not (tmp_path / "bad.json.done").read_text(encoding="utf-8")
@@ -0,0 +1,118 @@
+import itertools
+
+import pytest
+
+EPS = 1e-6
+PHOTOS = [(2.5, 3.5), (3.3, 4.8), (3.5, 4.9), (2.2, 3.2), (8.9, 12.7)]
+CANVASES = [(10.2, 15.2), (12.7, 17.8), (21.0, 29.7), (14.8, 21.0)]
+SPACINGS = [(0.0, 0.0), (0.2, 0.3)]
+
+
+def assert_no_overlap(rects, width, height, spacing=(0.0, 0.0)):
+    """矩形都在区域内，且彼此之间至少留出间距"""
+    for x, y, w, h in rects:
+        assert x >= -EPS and y >= -EPS
+        assert x + w <= width + EPS and y + h <= height + EPS
+    for a, b in itertools.combinations(rects, 2):
+        apart_x = a[0] + a[2] + spacing[0] <= b[0] + EPS or b[0] + b[2] + spacing[0] <= a[0] + EPS
+        apart_y = a[1] + a[3] + spacing[1] <= b[1] + EPS or b[1] + b[3] + spacing[1] <= a[1] + EPS
+        assert apart_x or apart_y, (a, b)
+
+
+@pytest.mark.parametrize("canvas,photo,spacing",
+                         list(itertools.product(CANVASES, PHOTOS, SPACINGS)))
+def test_mixed_rotation_packer(tool, canvas, photo, spacing):
+    placements = tool.MixedRotationPacker(*photo, *spacing).pack(*canvas)
+    for _, _, w, h, rotated in placements:
+        assert (w, h) == ((photo[1], photo[0]) if rotated else photo)
+    assert_no_overlap([p[:4] for p in placements], *canvas, spacing)
+    # 混合旋转不会比整齐网格少
+    if photo[0] <= canvas[0] and photo[1] <= canvas[1]:
+        cols, rows = tool.grid_rows_cols(*canvas, *photo, *spacing)
+        assert len(placements) >= cols * rows
+
+
+@pytest.mark.parametrize("canvas,photo,spacing",
+                         list(itertools.product(CANVASES, PHOTOS, SPACINGS)))
+def test_guillotine_planner(tool, canvas, photo, spacing):
+    placements, _ = tool.GuillotinePlanner(*photo, *spacing).plan(*canvas)
+    for _, _, w, h, rotated in placements:
+        assert (w, h) == pytest.approx((photo[1], photo[0]) if rotated else photo)
+    assert_no_overlap([p[:4] for p in placements], *canvas, spacing)
+
+
+def test_max_rects_packer(tool):
+    packer = tool.MaxRectsPacker(10.0, 15.0)
+    rects = []
+    for w, h in [(4.0, 6.0)] * 4 + [(3.0, 2.0)] * 6 + [(20.0, 1.0)]:
+        result = packer.insert(w, h)
+        if result is None:
+            continue
+        x, y, rotated = result
+        rects.append((x, y, h if rotated else w, w if rotated else h))
+    assert len(rects) == 10
+    assert_no_overlap(rects, 10.0, 15.0)
+
+
+def test_pack_order_places_every_photo(tool):
+    items = [{"size": {"name": "1寸", "width": 2.5, "height": 3.5}, "quantity": 13},
+             {"size": {"name": "2寸", "width": 3.5, "height": 4.9}, "quantity": 7},
+             {"size": {"name": "5寸", "width": 8.9, "height": 12.7}, "quantity": 2}]
+    spacing = (0.2, 0.2)
+    sheets = tool.pack_order(items, 15.2, 10.2, spacing)
+    counts = [0] * len(items)
+    for placements in sheets:
+        assert placements
+        for p in placements:
+            counts[p["item"]] += 1
+        assert_no_overlap([(p["x"], p["y"], p["width"], p["height"]) for p in placements],
+                          15.2, 10.2, spacing)
+    assert counts == [13, 7, 2]
+
+
+def test_pack_order_rejects_oversized_photo(tool):
+    items = [{"size": {"name": "大", "width": 20.0, "height": 30.0}, "quantity": 1}]
+    with pytest.raises(ValueError):
+        tool.pack_order(items, 10.2, 15.2, (0.0, 0.0))
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 25])
+@pytest.mark.parametrize("margin", [0.0, 0.5])
+def test_roll_layout_fits_roll(tool, count, margin):
+    spacing = (0.2, 0.3)
+    plan = tool.plan_roll_layout(15.2, 3.5, 4.9, spacing, count, margin)
+    assert plan["count"] == (count or plan["cols"])
+    assert plan["cols"] * plan["rows"] >= plan["count"]
+    assert plan["rows"] == -(-plan["count"] // plan["cols"])
+    used_w = plan["cols"] * plan["photo_w"] + (plan["cols"] - 1) * spacing[0]
+    assert plan["margin_x"] >= margin - EPS
+    assert plan["margin_x"] * 2 + used_w == pytest.approx(15.2)
+    used_h = plan["rows"] * plan["photo_h"] + (plan["rows"] - 1) * spacing[1]
+    assert plan["length"] == pytest.approx(used_h + 2 * margin)
+
+
+def test_roll_layout_too_narrow(tool):
+    assert tool.plan_roll_layout(3.0, 3.5, 4.9, (0.0, 0.0), 1) is None
+
+
+@pytest.mark.parametrize("poster", [(50.0, 70.0), (29.7, 21.0), (100.0, 30.0)])
+def test_poster_tiles_cover_poster(tool, poster):
+    overlap, mark_margin = 1.0, 0.8
+    plan = tool.plan_poster_tiles(*poster, 21.0, 29.7, overlap, mark_margin)
+    sheet_w, sheet_h = plan["canvas"]
+    assert len(plan["tiles"]) == plan["rows"] * plan["cols"]
+    tiles = {(row, col): (x0, y0, x1, y1) for row, col, x0, y0, x1, y1 in plan["tiles"]}
+    for (row, col), (x0, y0, x1, y1) in tiles.items():
+        # 分片在画布可打印区域内，且与相邻分片重叠
+        assert x1 - x0 <= sheet_w - 2 * mark_margin + EPS
+        assert y1 - y0 <= sheet_h - 2 * mark_margin + EPS
+        if col + 1 < plan["cols"]:
+            assert tiles[(row, col + 1)][0] == pytest.approx(x1 - overlap)
+        if row + 1 < plan["rows"]:
+            assert tiles[(row + 1, col)][1] == pytest.approx(y1 - overlap)
+    assert max(t[2] for t in tiles.values()) == pytest.approx(poster[0])
+    assert max(t[3] for t in tiles.values()) == pytest.approx(poster[1])
+
+
+def test_poster_tiles_overlap_too_large(tool):
+    assert tool.plan_poster_tiles(50.0, 70.0, 3.0, 3.0, 1.0, 1.0) is None
@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.mark.parametrize("canvas,photo,expected", [
+    ((10.2, 15.2), (8.9, 12.7), 0.65),   # 5寸照片在6寸纸上只能竖放
+    ((12.7, 17.8), (8.9, 12.7), 1.9),    # 5寸照片在7寸纸上
+    ((15.2, 10.2), (8.9, 12.7), 0.65),   # 横放的画布
+    ((10.0, 10.0), (12.0, 3.0), 0.0),    # 放不下
+])
+def test_max_page_margin_uses_fitting_orientation(tool, canvas, photo, expected):
+    assert tool.max_page_margin(*canvas, *photo) == pytest.approx(expected)
+
+
+def test_clamped_margin_still_places_one_photo(tool):
+    canvas_w, canvas_h, photo_w, photo_h = 10.2, 15.2, 8.9, 12.7
+    margin = tool.max_page_margin(canvas_w, canvas_h, photo_w, photo_h)
+    assert margin > 0
+    for layout_mode in (0, 1, 2):
+        info = tool.compute_layout({"width": canvas_w, "height": canvas_h},
+                                   {"width": photo_w, "height": photo_h},
+                                   (0.0, 0.0), 300, layout_mode=layout_mode, margin=margin)
+        assert info["total_photos"] == 1
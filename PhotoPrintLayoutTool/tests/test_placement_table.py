@@ -0,0 +1,70 @@
+import itertools
+
+import pytest
+
+
+def overlaps(a, b):
+    return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and
+            a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
+
+def assert_cells_valid(cells, canvas_w, canvas_h):
+    cells = list(cells)
+    for x, y, w, h, _ in cells:
+        assert x >= 0 and y >= 0 and w > 0 and h > 0
+        assert x + w <= canvas_w and y + h <= canvas_h
+    for a, b in itertools.combinations(cells, 2):
+        assert not overlaps(a, b), (a, b)
+
+
+@pytest.fixture(scope="module")
+def size_pairs(tool):
+    return list(itertools.product(tool.SizeManager.DEFAULT_CANVAS_SIZES,
+                                  tool.SizeManager.DEFAULT_PHOTO_SIZES))
+
+
+@pytest.mark.parametrize("layout_mode", [0, 1, 2])
+@pytest.mark.parametrize("spacing", [(0.0, 0.0), (0.2, 0.2)])
+@pytest.mark.parametrize("dpi", [300, 350])
+def test_layout_cells_inside_canvas_without_overlap(tool, size_pairs, layout_mode, spacing, dpi):
+    for canvas, photo in size_pairs:
+        info = tool.compute_layout(canvas, photo, spacing, dpi, layout_mode=layout_mode)
+        assert_cells_valid(info["cells"], *info["canvas_size"])
+
+
+def test_zero_spacing_cells_share_edges(tool):
+    # 2寸照片在6寸纸上无间距排列：相邻照片的边恰好重合
+    info = tool.compute_layout({"width": 10.2, "height": 15.2}, {"width": 3.5, "height": 4.9},
+                               (0.0, 0.0), 300)
+    cells = list(info["cells"])
+    by_row = {}
+    for x, y, w, h, _ in cells:
+        by_row.setdefault(y, []).append((x, w, h))
+    rows = sorted(by_row)
+    for upper, lower in zip(rows, rows[1:]):
+        assert upper + by_row[upper][0][2] == lower
+    for row in by_row.values():
+        row.sort()
+        for (x, w, _), (next_x, _, _) in zip(row, row[1:]):
+            assert x + w == next_x
+
+
+def test_cell_size_differs_by_at_most_one_pixel(tool):
+    table = tool.PlacementTable([(0.3 * i, 0.0, 3.5, 4.9, False) for i in range(20)], 300)
+    widths = {w for _, _, w, _, _ in table}
+    assert max(widths) - min(widths) <= 1
+
+
+def test_guillotine_a4_cells_stay_on_canvas(tool):
+    info = tool.compute_layout({"width": 21.0, "height": 29.7}, {"width": 3.3, "height": 4.8},
+                               (0.0, 0.0), 300, layout_mode=2)
+    assert_cells_valid(info["cells"], *info["canvas_size"])
+
+
+def test_placement_table_indexing(tool):
+    table = tool.PlacementTable([(0.0, 0.0, 2.54, 2.54, False), (2.54, 0.0, 2.54, 2.54, True)], 100)
+    assert len(table) == 2
+    assert table[-1] == (100, 0, 100, 100, True)
+    assert table[0:1] == [(0, 0, 100, 100, False)]
+    with pytest.raises(IndexError):
+        table[2]
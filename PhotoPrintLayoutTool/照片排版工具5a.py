@@ -1,14 +1,1412 @@
 import sys
+import csv
 import math
 import json
 import os
+import struct
+import time
+import threading
+import hashlib
+import shutil
+import zlib
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+try:
+    import numpy as np
+except ImportError:  # 未安装NumPy时画布推荐使用逐项计算
+    np = None
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, QComboBox, 
                             QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout,
                             QGroupBox, QFileDialog, QLineEdit, QMessageBox,
                             QRadioButton, QButtonGroup, QScrollArea, QDialog,
-                            QDialogButtonBox, QFormLayout)
-from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QColor, QBrush, QFont
-from PyQt5.QtCore import Qt, QSize, QSettings
+                            QDialogButtonBox, QFormLayout, QCheckBox,
+                            QTableWidget, QTableWidgetItem, QSpinBox, QHeaderView,
+                            QListView, QMenu)
+from PyQt5.QtGui import (QImage, QPixmap, QPainter, QPen, QColor, QBrush, QFont, QTransform,
+                         QPdfWriter, QPageSize, QImageReader, QImageIOHandler)
+from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+from PyQt5.QtCore import (Qt, QSize, QSizeF, QRect, QMarginsF, QSettings, QBuffer, QByteArray,
+                          QIODevice, QStandardPaths, QAbstractListModel, QModelIndex, QPoint, QTimer,
+                          QItemSelection, QItemSelectionModel, QObject, QFileSystemWatcher, pyqtSignal)
+
+# 支持直接保存8位灰度图像的格式
+GRAYSCALE_FORMATS = ("PNG", "JPG", "TIFF")
+
+# 预览背景色
+PREVIEW_BACKGROUND = QColor(235, 238, 245)
+
+# 拖动调整间距时的预览刷新间隔（毫秒），约每秒60帧
+DRAG_FRAME_INTERVAL_MS = 16
+
+# 热文件夹轮询间隔（毫秒），目录通知不可用（如网络共享）时仍能发现新文件
+HOT_FOLDER_POLL_MS = 250
+
+# 文件大小和修改时间保持不变超过此时长（毫秒）才视为写入完成
+HOT_FOLDER_SETTLE_MS = 200
+
+# 热文件夹同时渲染的最大任务数
+HOT_FOLDER_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# 可自动处理的图片扩展名
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+# 输出缓存在磁盘上占用的最大字节数
+OUTPUT_CACHE_BYTES = 512 * 1024 * 1024
+
+# 照片缓存（照片信息和缩放后的照片）在磁盘上占用的最大字节数
+TILE_CACHE_BYTES = 1024 * 1024 * 1024
+
+# 解码后的源照片和缩放后的照片在内存中占用的默认字节预算
+IMAGE_CACHE_BYTES = 1024 * 1024 * 1024
+
+# 检测是否为黑白照片时缩小解码的长边像素数
+GRAYSCALE_PROBE_SIZE = 128
+
+# 排队模式默认预处理的后续照片张数和线程数
+QUEUE_PREFETCH_COUNT = 3
+QUEUE_PREFETCH_WORKERS = 2
+
+# 单实例服务名（每个用户一个），后续启动通过它把文件交给已运行的窗口
+SINGLE_INSTANCE_NAME = "PhotoPrintLayoutTool-" + hashlib.sha1(
+    os.path.expanduser("~").encode("utf-8")).hexdigest()[:12]
+
+# 连接和发送给已运行窗口的超时（毫秒）
+SINGLE_INSTANCE_TIMEOUT_MS = 500
+
+# 照片库加载缩略图和扫描文件夹的线程数
+GALLERY_WORKERS = 4
+
+# 排版信息缓存的最大条目数
+LAYOUT_CACHE_SIZE = 16
+
+# 标准输出DPI
+DPI_VALUES = [150, 300, 600, 1200]
+
+# 可保存的文件格式
+OUTPUT_FORMATS = ["PNG", "JPG", "BMP", "TIFF"]
+
+# 混合方向排版的搜索时间预算（毫秒），保证预览可交互
+PACKING_TIME_BUDGET_MS = 10
+
+# 直刀裁切排版中每一刀折合的照片张数，用于权衡张数和刀数
+GUILLOTINE_CUT_WEIGHT = 0.1
+
+# 直刀裁切排版的搜索时间预算（毫秒），超出后剩余区域按整齐网格排列
+GUILLOTINE_TIME_BUDGET_MS = 100
+
+# 缓存的直刀裁切规划结果数
+GUILLOTINE_CACHE_SIZE = 32
+
+# 画布推荐时额外尝试的间距（厘米）
+RECOMMEND_SPACINGS = [0.0, 0.2, 0.5]
+
+# 画布推荐列出的最多结果数
+RECOMMEND_LIMIT = 20
+
+# 混合旋转和裁切优化模式下，按网格张数排名前几个的推荐结果重新排版计数
+RECOMMEND_REFINE_COUNT = 5
+
+def dpi_to_dots_per_meter(dpi):
+    """将DPI转换为每米点数（QImage分辨率单位）"""
+    return int(round(dpi / 0.0254))
+
+def encodable_image(image, file_format):
+    """不能保存8位灰度的格式（BMP写出8位图像需要调色板）在编码前转换为RGB888"""
+    if image.format() == QImage.Format_Grayscale8 and file_format not in GRAYSCALE_FORMATS:
+        return image.convertToFormat(QImage.Format_RGB888)
+    return image
+
+def save_image_with_dpi(image, file_path, file_format, dpi, quality=-1):
+    """写入打印分辨率后保存图像"""
+    image = encodable_image(image, file_format)
+    # PNG写入pHYs，JPEG写入JFIF密度，TIFF写入XResolution，BMP写入每米像素数
+    image.setDotsPerMeterX(dpi_to_dots_per_meter(dpi))
+    image.setDotsPerMeterY(dpi_to_dots_per_meter(dpi))
+    return image.save(file_path, file_format, quality)
+
+def encode_image(image, file_format, quality=-1):
+    """将图像编码到内存，返回字节数据"""
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    encodable_image(image, file_format).save(buffer, file_format, quality)
+    buffer.close()
+    return bytes(data)
+
+def encode_jpeg_to_budget(image, max_bytes, min_quality=5, proxy_pixels=1000000):
+    """二分查找不超过字节预算的最高JPEG质量，返回(字节数据, 质量)
+    
+    先在降采样的代理图上估算质量，再只在估算值附近对全尺寸图像编码，
+    减少全尺寸编码次数。即使最低质量也超出预算时返回最低质量的结果。
+    """
+    # 代理图：按面积缩小到约proxy_pixels像素，文件大小按面积比例放大估算
+    area = image.width() * image.height()
+    if area > proxy_pixels:
+        scale = math.sqrt(proxy_pixels / area)
+        proxy = image.scaled(max(1, int(image.width() * scale)),
+                             max(1, int(image.height() * scale)),
+                             Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    else:
+        proxy = image
+    area_ratio = area / (proxy.width() * proxy.height())
+    
+    lo, hi = min_quality, 100
+    estimate = min_quality
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if len(encode_image(proxy, "JPG", mid)) * area_ratio <= max_bytes:
+            estimate = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    
+    # 全尺寸编码：从估算值开始，只在其附近继续二分
+    best = None
+    data = encode_image(image, "JPG", estimate)
+    if len(data) <= max_bytes:
+        best = (data, estimate)
+        lo, hi = estimate + 1, min(100, estimate + 10)
+    else:
+        lo, hi = max(min_quality, estimate - 10), estimate - 1
+    while True:
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            data = encode_image(image, "JPG", mid)
+            if len(data) <= max_bytes:
+                if best is None or mid > best[1]:
+                    best = (data, mid)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        # 估算偏差过大时扩大搜索范围
+        if best is not None or lo <= min_quality:
+            break
+        lo, hi = min_quality, lo - 1
+    if best is None:
+        best = (encode_image(image, "JPG", min_quality), min_quality)
+    return best
+
+def write_png_stream(file_path, width, height, dpi, grayscale, bands):
+    """逐条带写出PNG文件，内存中只保留当前条带
+    
+    bands依次产生宽度为width的QImage条带（RGB888或Grayscale8），高度之和须为height。
+    """
+    def chunk(f, chunk_type, data):
+        f.write(struct.pack('>I', len(data)) + chunk_type + data)
+        f.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+    
+    color_type = 0 if grayscale else 2
+    row_bytes = width * (1 if grayscale else 3)
+    dpm = dpi_to_dots_per_meter(dpi)
+    compressor = zlib.compressobj(6)
+    with open(file_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        chunk(f, b'pHYs', struct.pack('>IIB', dpm, dpm, 1))
+        for band in bands:
+            stride = band.bytesPerLine()
+            pixels = band.constBits().asstring(stride * band.height())
+            # 每行前加过滤类型0，并去掉QImage的行尾对齐字节
+            raw = b''.join(b'\x00' + pixels[y * stride:y * stride + row_bytes]
+                           for y in range(band.height()))
+            data = compressor.compress(raw)
+            if data:
+                chunk(f, b'IDAT', data)
+        chunk(f, b'IDAT', compressor.flush())
+        chunk(f, b'IEND', b'')
+
+def read_image_dpi(file_path):
+    """读取图像文件头中的打印分辨率，返回(水平DPI, 垂直DPI)，无法识别时返回None
+    
+    只解析文件头（PNG pHYs、JPEG JFIF、TIFF XResolution、BMP），不解码像素，
+    可供打印队列在发送前快速校验。
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(8)
+            if header.startswith(b'\x89PNG\r\n\x1a\n'):
+                return _read_png_dpi(f)
+            if header.startswith(b'\xff\xd8'):
+                f.seek(2)
+                return _read_jpeg_dpi(f)
+            if header[:4] in (b'II*\x00', b'MM\x00*'):
+                return _read_tiff_dpi(f, header)
+            if header.startswith(b'BM'):
+                f.seek(38)
+                x_dpm, y_dpm = struct.unpack('<ii', f.read(8))
+                return round(x_dpm * 0.0254), round(y_dpm * 0.0254)
+    except (IOError, struct.error):
+        pass
+    return None
+
+def _read_png_dpi(f):
+    """读取PNG的pHYs块"""
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return None
+        length, chunk_type = struct.unpack('>I4s', chunk_header)
+        if chunk_type == b'pHYs':
+            x_ppu, y_ppu, unit = struct.unpack('>IIB', f.read(9))
+            if unit != 1:  # 单位不是米时只表示像素宽高比
+                return None
+            return round(x_ppu * 0.0254), round(y_ppu * 0.0254)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return None
+        f.seek(length + 4, os.SEEK_CUR)  # 跳过数据和CRC
+
+def _read_jpeg_dpi(f):
+    """读取JPEG的JFIF(APP0)密度信息"""
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF or marker[1] == 0xDA:
+            return None
+        length = struct.unpack('>H', f.read(2))[0]
+        data = f.read(length - 2)
+        if marker[1] == 0xE0 and data.startswith(b'JFIF\x00'):
+            unit, x_density, y_density = struct.unpack('>BHH', data[7:12])
+            if unit == 1:  # 每英寸点数
+                return x_density, y_density
+            if unit == 2:  # 每厘米点数
+                return round(x_density * 2.54), round(y_density * 2.54)
+            return None
+
+def _read_tiff_dpi(f, header):
+    """读取TIFF第一个IFD中的XResolution/YResolution，只读取IFD和分辨率数值"""
+    order = '<' if header[:2] == b'II' else '>'
+    ifd_offset = struct.unpack(order + 'I', header[4:8])[0]
+    f.seek(ifd_offset)
+    count = struct.unpack(order + 'H', f.read(2))[0]
+    entries = f.read(count * 12)
+    resolution = {}
+    unit = 2  # 默认单位为英寸
+    for i in range(count):
+        entry = entries[i * 12:(i + 1) * 12]
+        tag, _, _, value = struct.unpack(order + 'HHII', entry)
+        if tag in (282, 283):  # XResolution / YResolution，RATIONAL存放在偏移处
+            f.seek(value)
+            num, den = struct.unpack(order + 'II', f.read(8))
+            resolution[tag] = num / den if den else 0
+        elif tag == 296:  # ResolutionUnit，SHORT存放在值的前两个字节
+            unit = struct.unpack(order + 'H', entry[8:10])[0]
+    if 282 not in resolution or 283 not in resolution or unit == 1:
+        return None
+    factor = 2.54 if unit == 3 else 1
+    return round(resolution[282] * factor), round(resolution[283] * factor)
+
+def cm_to_px(cm, dpi):
+    """将厘米坐标换算为最接近的整数像素"""
+    return int(round(cm / 2.54 * dpi))
+
+def max_page_margin(canvas_w, canvas_h, photo_w, photo_h):
+    """至少能放下一张照片时的最大页边距（厘米）
+    
+    取照片能放下的方向中四周余量较小一边的一半，照片只能以一种方向放下时也不会归零。
+    """
+    slack = max(min(canvas_w - photo_w, canvas_h - photo_h),
+                min(canvas_w - photo_h, canvas_h - photo_w))
+    return max(0.0, slack) / 2
+
+def grid_rows_cols(canvas_w, canvas_h, photo_w, photo_h, spacing_w, spacing_h):
+    """计算网格排版的列数和行数（厘米）"""
+    # 计算列数（考虑间距）
+    if photo_w + spacing_w > 0:
+        cols = max(1, int((canvas_w + spacing_w) // (photo_w + spacing_w)))
+    else:
+        cols = 1
+    
+    # 计算行数（考虑间距）
+    if photo_h + spacing_h > 0:
+        rows = max(1, int((canvas_h + spacing_h) // (photo_h + spacing_h)))
+    else:
+        rows = 1
+    
+    return cols, rows
+
+def grid_cells(canvas_w, canvas_h, photo_w, photo_h, spacing_w, spacing_h, cols, rows):
+    """网格在画布中居中时每张照片的位置 (x, y, 宽, 高, 是否旋转)，单位厘米"""
+    total_w = cols * photo_w + max(0, cols - 1) * spacing_w
+    total_h = rows * photo_h + max(0, rows - 1) * spacing_h
+    margin_x = max(0, (canvas_w - total_w) / 2)
+    margin_y = max(0, (canvas_h - total_h) / 2)
+    return [
+        (margin_x + col * (photo_w + spacing_w),
+         margin_y + row * (photo_h + spacing_h),
+         photo_w, photo_h, False)
+        for row in range(rows) for col in range(cols)
+    ]
+
+class PlacementTable:
+    """排版位置表：全部单元格的整数像素矩形，按(x, y, 宽, 高, 是否旋转)紧凑存放在一个整数数组中
+    
+    每个单元格的四条边分别由厘米坐标换算后取整，宽高取两边之差：舍入误差不会逐格累积，
+    相邻照片不会重叠，也不会超出画布。同一方向的照片像素尺寸至多相差1像素。
+    预览、导出、PDF和打印都读取同一张表。
+    """
+    FIELDS = 5
+    
+    def __init__(self, cells_cm, dpi):
+        self.data = array('i')
+        for x, y, w, h, rotated in cells_cm:
+            left, top = cm_to_px(x, dpi), cm_to_px(y, dpi)
+            self.data.extend((left, top, cm_to_px(x + w, dpi) - left,
+                              cm_to_px(y + h, dpi) - top, int(rotated)))
+    
+    def __len__(self):
+        return len(self.data) // self.FIELDS
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        x, y, w, h, rotated = self.data[index * self.FIELDS:(index + 1) * self.FIELDS]
+        return (x, y, w, h, bool(rotated))
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class MixedRotationPacker:
+    """混合方向排版引擎
+    
+    在主网格之外，用旋转90度的照片递归填充剩余的条形区域，在时间预算内
+    返回张数最多的排列。尺寸单位为厘米，每个单元格包含右侧和下方的间距，
+    因此可用区域在画布基础上各加一个间距。
+    """
+    def __init__(self, photo_w, photo_h, spacing_w, spacing_h,
+                 time_budget_ms=PACKING_TIME_BUDGET_MS):
+        self.photo_w = photo_w
+        self.photo_h = photo_h
+        self.spacing = (spacing_w, spacing_h)
+        self.time_budget = time_budget_ms / 1000
+        # 单元格尺寸：(宽, 高, 是否旋转)
+        self.cell_types = [(photo_w + spacing_w, photo_h + spacing_h, False)]
+        if photo_w != photo_h:
+            self.cell_types.append((photo_h + spacing_w, photo_w + spacing_h, True))
+        self.memo = {}
+        self.deadline = 0
+    
+    def pack(self, canvas_w, canvas_h):
+        """返回照片位置列表[(x, y, 宽, 高, 是否旋转)]，坐标相对于排列区域左上角"""
+        self.memo = {}
+        self.deadline = time.perf_counter() + self.time_budget
+        _, blocks = self._best(canvas_w + self.spacing[0], canvas_h + self.spacing[1])
+        
+        placements = []
+        for bx, by, cols, rows, rotated in blocks:
+            cw, ch = self._cell_size(rotated)
+            w, h = (self.photo_h, self.photo_w) if rotated else (self.photo_w, self.photo_h)
+            for row in range(rows):
+                for col in range(cols):
+                    placements.append((bx + col * cw, by + row * ch, w, h, rotated))
+        placements.sort(key=lambda p: (round(p[1], 6), p[0]))
+        return placements
+    
+    def _cell_size(self, rotated):
+        """获取单元格尺寸（含间距）"""
+        for cw, ch, cell_rotated in self.cell_types:
+            if cell_rotated == rotated:
+                return cw, ch
+        return self.cell_types[0][:2]
+    
+    def _best(self, width, height):
+        """递归求区域内张数最多的块排列，返回(张数, 块列表)"""
+        key = (round(width, 6), round(height, 6))
+        if key in self.memo:
+            return self.memo[key]
+        
+        best = (0, ())
+        out_of_time = time.perf_counter() > self.deadline
+        for cw, ch, rotated in self.cell_types:
+            max_cols = int(width / cw + 1e-9)
+            max_rows = int(height / ch + 1e-9)
+            if max_cols == 0 or max_rows == 0:
+                continue
+            # 超出时间预算后只保留整块网格，不再枚举拆分方式
+            col_choices = [max_cols] if out_of_time else range(max_cols, 0, -1)
+            row_choices = [max_rows] if out_of_time else range(max_rows, 0, -1)
+            
+            # 满高主块(cols×max_rows)，右侧条和下方条递归填充
+            for cols in col_choices:
+                right = self._best(width - cols * cw, height)
+                below = self._best(cols * cw, height - max_rows * ch)
+                count = cols * max_rows + right[0] + below[0]
+                if count > best[0]:
+                    best = (count, ((0, 0, cols, max_rows, rotated),) +
+                            self._shift(right[1], cols * cw, 0) +
+                            self._shift(below[1], 0, max_rows * ch))
+            
+            # 满宽主块(max_cols×rows)，下方条和右侧条递归填充
+            for rows in row_choices:
+                below = self._best(width, height - rows * ch)
+                right = self._best(width - max_cols * cw, rows * ch)
+                count = max_cols * rows + right[0] + below[0]
+                if count > best[0]:
+                    best = (count, ((0, 0, max_cols, rows, rotated),) +
+                            self._shift(right[1], max_cols * cw, 0) +
+                            self._shift(below[1], 0, rows * ch))
+        
+        self.memo[key] = best
+        return best
+    
+    @staticmethod
+    def _shift(blocks, dx, dy):
+        """平移块列表"""
+        return tuple((x + dx, y + dy, cols, rows, rotated)
+                     for x, y, cols, rows, rotated in blocks)
+
+class GuillotinePlanner:
+    """直刀裁切排版规划
+    
+    用带记忆的动态规划搜索可以一刀到边逐次裁开的排版，并给出有序的裁切列表。
+    每一刀把一块纸分成两块；照片之间有间距时，间距两侧各需一刀。
+    评分为张数减去刀数乘以权重，张数相同时刀数越少越好。
+    内部以0.01毫米为单位的整数计算。超出时间预算后，尚未搜索的区域只按
+    能放下更多照片的方向逐条切成整齐网格，大画布也能及时返回。
+    """
+    UNIT = 1000  # 每厘米的内部单位数
+    
+    def __init__(self, photo_w, photo_h, spacing_w, spacing_h,
+                 cut_weight=GUILLOTINE_CUT_WEIGHT, time_budget_ms=GUILLOTINE_TIME_BUDGET_MS):
+        self.photos = [(self._units(photo_w), self._units(photo_h), False)]
+        if photo_w != photo_h:
+            self.photos.append((self._units(photo_h), self._units(photo_w), True))
+        self.spacing = (self._units(spacing_w), self._units(spacing_h))
+        self.cut_weight = cut_weight
+        self.time_budget = time_budget_ms / 1000
+        self.memo = {}
+        self.deadline = 0
+        self.timed_out = False  # 上次规划是否超出时间预算
+    
+    def _units(self, cm):
+        """厘米转换为内部整数单位"""
+        return int(round(cm * self.UNIT))
+    
+    def plan(self, canvas_w, canvas_h, margin=0.0):
+        """返回(照片位置列表[(x, y, 宽, 高, 是否旋转)], 裁切列表[(方向, 位置, 起点, 终点)])
+        
+        canvas_w、canvas_h为去掉四周页边距margin后的排列区域，坐标单位为厘米，
+        以整张纸的左上角为原点。排列区域居中，方向为"v"(垂直刀)或"h"(水平刀)。
+        """
+        width, height = self._units(canvas_w), self._units(canvas_h)
+        margin = self._units(margin)
+        self.memo = {}
+        self.deadline = time.perf_counter() + self.time_budget
+        self.timed_out = False
+        tree = self._best(width, height)[3]
+        
+        placements = []
+        cuts = []
+        self._walk(tree, 0, 0, width, height, placements, cuts)
+        if not placements:
+            return [], []
+        
+        # 照片占用的矩形在排列区域中居中
+        used_w = max(p[0] + p[2] for p in placements)
+        used_h = max(p[1] + p[3] for p in placements)
+        left = margin + (width - used_w) // 2
+        top = margin + (height - used_h) // 2
+        right, bottom = left + used_w, top + used_h
+        sheet_w, sheet_h = width + 2 * margin, height + 2 * margin
+        
+        # 先沿占用矩形四边裁去边距：竖刀贯穿整张纸，横刀只在两刀竖刀之间。
+        # 落在纸边的刀不需要裁，边距已由这几刀裁掉，规划中落在矩形边上的刀也不再重复
+        trims = [("v", x, 0, sheet_h) for x in (left, right) if 0 < x < sheet_w]
+        trims += [("h", y, left, right) for y in (top, bottom) if 0 < y < sheet_h]
+        inner = []
+        for axis, pos, start, end in cuts:
+            # 规划中的刀只裁占用矩形内的那一块纸
+            if axis == "v":
+                pos, start, end = pos + left, max(start + top, top), min(end + top, bottom)
+                if not left < pos < right:
+                    continue
+            else:
+                pos, start, end = pos + top, max(start + left, left), min(end + left, right)
+                if not top < pos < bottom:
+                    continue
+            inner.append((axis, pos, start, end))
+        
+        unit = self.UNIT
+        placements = [((x + left) / unit, (y + top) / unit, w / unit, h / unit, rotated)
+                      for x, y, w, h, rotated in placements]
+        cuts = [(axis, pos / unit, start / unit, end / unit)
+                for axis, pos, start, end in trims + inner]
+        return placements, cuts
+    
+    def _best(self, width, height):
+        """返回区域的最优(评分, 张数, 刀数, 裁切树)"""
+        key = (width, height)
+        if key in self.memo:
+            return self.memo[key]
+        
+        best = (0, 0, 0, None)  # 整块废料
+        photos = self.photos
+        out_of_time = time.perf_counter() > self.deadline
+        if out_of_time:
+            # 超出时间预算后只用整齐网格能放下更多照片的方向，且只切竖条
+            self.timed_out = True
+            photos = [max(photos, key=lambda p: self._grid_count(width, height, p[0], p[1]))]
+        for pw, ph, rotated in photos:
+            if pw > width or ph > height:
+                continue
+            if pw == width and ph == height:
+                best = max(best, (1, 1, 0, ("photo", rotated)), key=lambda r: r[0])
+                continue
+            if pw < width:
+                # 垂直一刀切出照片宽度的竖条，剩余部分去掉间距后继续
+                first = self._best(pw, height)
+                second = self._after_gutter(width - pw, height, "v")
+                best = self._better(best, "v", pw, first, second)
+                if out_of_time:
+                    continue
+            if ph < height:
+                # 水平一刀切出照片高度的横条
+                first = self._best(width, ph)
+                second = self._after_gutter(width, height - ph, "h")
+                best = self._better(best, "h", ph, first, second)
+        
+        self.memo[key] = best
+        return best
+    
+    def _grid_count(self, width, height, pw, ph):
+        """整齐网格排列的张数"""
+        cols = (width + self.spacing[0]) // (pw + self.spacing[0])
+        rows = (height + self.spacing[1]) // (ph + self.spacing[1])
+        return cols * rows
+    
+    def _after_gutter(self, width, height, axis):
+        """切出照片条后的剩余部分：有间距时再切一刀去掉间距"""
+        gutter = self.spacing[0] if axis == "v" else self.spacing[1]
+        if gutter == 0:
+            return self._best(width, height)
+        remain = width - gutter if axis == "v" else height - gutter
+        if remain <= 0:
+            return (0, 0, 0, None)
+        rest = self._best(remain, height) if axis == "v" else self._best(width, remain)
+        if rest[1] == 0:  # 间距之后放不下照片，整块为废料，无需再切
+            return (0, 0, 0, None)
+        return (rest[0] - self.cut_weight, rest[1], rest[2] + 1,
+                ("cut", axis, gutter, None, rest[3]))
+    
+    def _better(self, best, axis, pos, first, second):
+        """比较当前最优与"一刀分成两块"的方案"""
+        if first[1] == 0:
+            return best
+        count = first[1] + second[1]
+        cuts = first[2] + second[2] + 1
+        score = count - self.cut_weight * cuts
+        if score > best[0]:
+            return (score, count, cuts, ("cut", axis, pos, first[3], second[3]))
+        return best
+    
+    def _walk(self, node, x, y, width, height, placements, cuts):
+        """按裁切顺序展开裁切树"""
+        if node is None:
+            return
+        if node[0] == "photo":
+            placements.append((x, y, width, height, node[1]))
+            return
+        _, axis, pos, first, second = node
+        if axis == "v":
+            cuts.append(("v", x + pos, y, y + height))
+            self._walk(first, x, y, pos, height, placements, cuts)
+            self._walk(second, x + pos, y, width - pos, height, placements, cuts)
+        else:
+            cuts.append(("h", y + pos, x, x + width))
+            self._walk(first, x, y, width, pos, placements, cuts)
+            self._walk(second, x, y + pos, width, height - pos, placements, cuts)
+
+_guillotine_cache = OrderedDict()
+_guillotine_cache_lock = threading.Lock()
+
+def plan_guillotine_layout(canvas_w, canvas_h, photo_w, photo_h, spacing_w, spacing_h,
+                           margin=0.0):
+    """缓存直刀裁切规划结果，预览反复刷新时无需重新搜索
+    
+    返回(照片位置元组, 裁切元组)，缓存的结果不会被调用方修改。超出时间预算的结果
+    取决于当时的机器负载，不缓存，下次重新搜索。
+    """
+    key = (canvas_w, canvas_h, photo_w, photo_h, spacing_w, spacing_h, margin)
+    with _guillotine_cache_lock:
+        result = _guillotine_cache.get(key)
+        if result is not None:
+            _guillotine_cache.move_to_end(key)
+            return result
+    planner = GuillotinePlanner(photo_w, photo_h, spacing_w, spacing_h)
+    placements, cuts = planner.plan(canvas_w, canvas_h, margin)
+    result = (tuple(placements), tuple(cuts))
+    if not planner.timed_out:
+        with _guillotine_cache_lock:
+            _guillotine_cache[key] = result
+            if len(_guillotine_cache) > GUILLOTINE_CACHE_SIZE:
+                _guillotine_cache.popitem(last=False)
+    return result
+
+def compute_layout(canvas_size, photo_size, spacing, dpi, orientation_mode=0, layout_mode=0,
+                   margin=0.0):
+    """计算排版布局，返回排版信息和位置表，不依赖界面，可在工作线程或子进程中调用
+    
+    orientation_mode: 0自动, 1横向, 2竖向；layout_mode: 0标准网格, 1混合旋转, 2裁切优化。
+    """
+    # 获取物理尺寸，排版在去掉四周页边距的区域内进行，最后整体平移
+    canvas_phys_w = max(0, canvas_size["width"] - 2 * margin)
+    canvas_phys_h = max(0, canvas_size["height"] - 2 * margin)
+    photo_w = photo_size["width"]
+    photo_h = photo_size["height"]
+    
+    # 自动方向选择：计算两种方向下的照片数量
+    if orientation_mode == 0:  # 自动
+        # 方向1：自然方向
+        cols1, rows1 = grid_rows_cols(
+            canvas_phys_w, canvas_phys_h,
+            photo_w, photo_h, *spacing
+        )
+        count1 = cols1 * rows1
+        
+        # 方向2：旋转90度方向
+        cols2, rows2 = grid_rows_cols(
+            canvas_phys_h, canvas_phys_w,
+            photo_w, photo_h, *spacing
+        )
+        count2 = cols2 * rows2
+        
+        # 选择能容纳更多照片的方向
+        if count1 >= count2:
+            # 使用自然方向
+            canvas_w_used, canvas_h_used = canvas_phys_w, canvas_phys_h
+            cols, rows = cols1, rows1
+            # 确定方向标签（宽边水平为横向，宽边垂直为竖向）
+            orientation = "横向" if canvas_phys_w >= canvas_phys_h else "竖向"
+        else:
+            # 使用旋转方向
+            canvas_w_used, canvas_h_used = canvas_phys_h, canvas_phys_w
+            cols, rows = cols2, rows2
+            # 确定方向标签（宽边水平为横向，宽边垂直为竖向）
+            orientation = "横向" if canvas_phys_h >= canvas_phys_w else "竖向"
+    elif orientation_mode == 1:  # 横向 (短边垂直)
+        # 确保宽边水平放置（短边垂直）
+        if canvas_phys_w >= canvas_phys_h:
+            canvas_w_used, canvas_h_used = canvas_phys_w, canvas_phys_h
+        else:
+            canvas_w_used, canvas_h_used = canvas_phys_h, canvas_phys_w
+        cols, rows = grid_rows_cols(
+            canvas_w_used, canvas_h_used,
+            photo_w, photo_h, *spacing
+        )
+        orientation = "横向"
+    else:  # 竖向 (短边水平)
+        # 确保宽边垂直放置（短边水平）
+        if canvas_phys_h >= canvas_phys_w:
+            canvas_w_used, canvas_h_used = canvas_phys_w, canvas_phys_h
+        else:
+            canvas_w_used, canvas_h_used = canvas_phys_h, canvas_phys_w
+        cols, rows = grid_rows_cols(
+            canvas_w_used, canvas_h_used,
+            photo_w, photo_h, *spacing
+        )
+        orientation = "竖向"
+    
+    # 在厘米坐标下计算每张照片的位置，最后统一换算为像素
+    cells_cm = grid_cells(canvas_w_used, canvas_h_used, photo_w, photo_h,
+                          spacing[0], spacing[1], cols, rows)
+    
+    cuts = []
+    if layout_mode in (1, 2):
+        # 混合旋转/裁切优化：按当前方向设置尝试画布的可用朝向，取最优者
+        if orientation_mode == 0:
+            candidates = [(canvas_phys_w, canvas_phys_h), (canvas_phys_h, canvas_phys_w)]
+        else:
+            candidates = [(canvas_w_used, canvas_h_used)]
+        best_placements = None
+        best_score = None
+        for cand_w, cand_h in candidates:
+            if layout_mode == 1:
+                placements = MixedRotationPacker(
+                    photo_w, photo_h, spacing[0], spacing[1]
+                ).pack(cand_w, cand_h)
+                cand_cuts = []
+                score = len(placements)
+            else:
+                placements, cand_cuts = plan_guillotine_layout(
+                    cand_w, cand_h, photo_w, photo_h, spacing[0], spacing[1], margin
+                )
+                score = len(placements) - GUILLOTINE_CUT_WEIGHT * len(cand_cuts)
+            if best_score is None or score > best_score:
+                best_placements, cuts, best_score = placements, cand_cuts, score
+                canvas_w_used, canvas_h_used = cand_w, cand_h
+        orientation = "横向" if canvas_w_used >= canvas_h_used else "竖向"
+        
+        # 排列区域居中（直刀裁切规划已自行居中，且已计入页边距）
+        if layout_mode == 1:
+            used_w = max((p[0] + p[2] for p in best_placements), default=0)
+            used_h = max((p[1] + p[3] for p in best_placements), default=0)
+            margin_cm_x = margin + max(0, (canvas_w_used - used_w) / 2)
+            margin_cm_y = margin + max(0, (canvas_h_used - used_h) / 2)
+        else:
+            margin_cm_x = margin_cm_y = 0
+        cells_cm = [
+            (margin_cm_x + x, margin_cm_y + y, w, h, rotated)
+            for x, y, w, h, rotated in best_placements
+        ]
+    elif margin:
+        cells_cm = [(x + margin, y + margin, w, h, rotated)
+                    for x, y, w, h, rotated in cells_cm]
+    canvas_w_used += 2 * margin
+    canvas_h_used += 2 * margin
+    
+    cells = PlacementTable(cells_cm, dpi)
+    return {
+        'canvas_size': (cm_to_px(canvas_w_used, dpi),
+                        cm_to_px(canvas_h_used, dpi)),
+        'photo_size': (cm_to_px(photo_w, dpi), cm_to_px(photo_h, dpi)),
+        'spacing': (cm_to_px(spacing[0], dpi),
+                    cm_to_px(spacing[1], dpi)),
+        'rows': rows,
+        'cols': cols,
+        'margin': (cells[0][0], cells[0][1]) if len(cells) else (0, 0),
+        'total_photos': len(cells),
+        'cells': cells,
+        'cuts': cuts,
+        'orientation': orientation,
+        'physical_canvas': (canvas_size["width"], canvas_size["height"]),
+        'physical_photo': (photo_w, photo_h),
+        'used_canvas': (canvas_w_used, canvas_h_used),
+        'dpi': dpi
+    }
+
+def begin_print(printer, dpi):
+    """在打印机上开始绘制，坐标单位为dpi下的像素
+    
+    打印驱动可能不接受setResolution设置的分辨率，按打印机实际分辨率缩放，
+    保证打印出的物理尺寸不变。
+    """
+    painter = QPainter(printer)
+    resolution = printer.resolution()
+    if resolution != dpi:
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.scale(resolution / dpi, resolution / dpi)
+    return painter
+
+def open_image_reader(source):
+    """打开照片读取器（文件路径或QIODevice），所有读取照片的地方共用，按EXIF方向自动旋转
+    
+    读取器的尺寸、缩放尺寸和裁剪区域都是旋转前的方向，按旋转后的方向设置时
+    使用oriented_size、set_scaled_size和set_clip_rect。
+    """
+    reader = QImageReader(source)
+    reader.setAutoTransform(True)
+    return reader
+
+def oriented_size(reader):
+    """只读取文件头，返回按EXIF方向旋转后的QSize，无法读取时返回无效尺寸"""
+    size = reader.size()
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        size.transpose()
+    return size
+
+def set_scaled_size(reader, width, height):
+    """按旋转后的方向设置解码缩放尺寸"""
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        width, height = height, width
+    reader.setScaledSize(QSize(width, height))
+
+def set_clip_rect(reader, rect):
+    """按旋转后的坐标设置只解码的区域，换算为文件中原始方向的坐标"""
+    # 读取时先左右、上下镜像，再顺时针旋转90度，这里按相反顺序换算
+    transformation = reader.transformation()
+    raw = reader.size()
+    x0, y0, x1, y1 = rect.left(), rect.top(), rect.left() + rect.width(), rect.top() + rect.height()
+    if transformation & QImageIOHandler.TransformationRotate90:
+        x0, y0, x1, y1 = y0, raw.height() - x1, y1, raw.height() - x0
+    if transformation & QImageIOHandler.TransformationMirror:
+        x0, x1 = raw.width() - x1, raw.width() - x0
+    if transformation & QImageIOHandler.TransformationFlip:
+        y0, y1 = raw.height() - y1, raw.height() - y0
+    reader.setClipRect(QRect(x0, y0, x1 - x0, y1 - y0))
+
+def read_image(source, width=None, height=None):
+    """按EXIF方向读取照片，指定宽高时在解码时直接缩小，返回(图像, 错误信息)"""
+    reader = open_image_reader(source)
+    if width is not None:
+        set_scaled_size(reader, width, height)
+    image = reader.read()
+    return image, reader.errorString()
+
+def sheet_image_format(grayscale):
+    """按是否黑白选择合成用的紧凑像素格式
+    
+    黑白总是以8位灰度合成，不能保存灰度的格式在编码时才转换（见encodable_image）。
+    """
+    # RGB888每像素3字节，比RGB32少25%；Grayscale8每像素1字节，少75%
+    if grayscale:
+        return QImage.Format_Grayscale8
+    return QImage.Format_RGB888
+
+def scale_tile(image, width, height, rotated, image_format):
+    """将源照片缩放到单元格尺寸并转换像素格式，rotated为顺时针旋转90度的次数（True为1）"""
+    turns = int(rotated) % 4
+    if turns % 2:
+        tile = image.scaled(height, width, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    else:
+        tile = image.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    if turns:
+        tile = tile.transformed(QTransform().rotate(90 * turns))
+    return tile.convertToFormat(image_format)
+
+def render_sheet(image, layout_info, image_format, count=None, tiles=None):
+    """用一张源照片按位置表合成整版，不依赖界面，可在工作线程中调用
+    
+    tiles为缩放后照片的缓存，多次合成同一源照片时传入同一个字典可避免重复缩放。
+    """
+    canvas_w, canvas_h = layout_info['canvas_size']
+    sheet = QImage(canvas_w, canvas_h, image_format)
+    sheet.fill(Qt.white)
+    painter = QPainter(sheet)
+    if tiles is None:
+        tiles = {}
+    for x, y, w, h, rotated in layout_info['cells'][:count]:
+        tile = tiles.get((w, h, rotated, image_format))
+        if tile is None:
+            tile = scale_tile(image, w, h, rotated, image_format)
+            tiles[(w, h, rotated, image_format)] = tile
+        painter.drawImage(x, y, tile)
+    painter.end()
+    return sheet
+
+def render_hot_folder_file(file_path, outbox, profile, layout_info):
+    """渲染热文件夹中的一张照片，返回(输出文件, 耗时秒)"""
+    start = time.perf_counter()
+    image, error = read_image(file_path)
+    if image.isNull():
+        raise ValueError(error)
+    file_format = profile["format"]
+    sheet = render_sheet(image, layout_info, sheet_image_format(image.isGrayscale()))
+    # 文件名带上原扩展名，同名的a.jpg和a.png同时渲染时不会互相覆盖
+    stem, extension = os.path.splitext(os.path.basename(file_path))
+    name = f"{stem}_{extension[1:]}" if extension else stem
+    output = os.path.join(outbox, f"{name}_排版.{file_format.lower()}")
+    # 先写入临时文件再改名，下游程序不会读到写了一半的输出
+    temp_path = os.path.join(outbox, f".{name}_排版.tmp")
+    if not save_image_with_dpi(sheet, temp_path, file_format, layout_info['dpi']):
+        raise OSError(f"无法保存文件: {output}")
+    os.replace(temp_path, output)
+    return output, time.perf_counter() - start
+
+def photo_info(data):
+    """由照片文件内容得到照片信息（内容哈希、尺寸、是否黑白），无法读取时返回None
+    
+    尺寸为按EXIF方向旋转后的尺寸，只读取文件头；是否黑白按缩小解码的小图判断，
+    不解码完整的原图。
+    """
+    buffer = QBuffer()
+    buffer.setData(data)
+    reader = open_image_reader(buffer)
+    size = oriented_size(reader)
+    if not size.isValid():
+        return None
+    if max(size.width(), size.height()) > GRAYSCALE_PROBE_SIZE:
+        probe_size = size.scaled(GRAYSCALE_PROBE_SIZE, GRAYSCALE_PROBE_SIZE, Qt.KeepAspectRatio)
+        set_scaled_size(reader, probe_size.width(), probe_size.height())
+    probe = reader.read()
+    if probe.isNull():
+        return None
+    # 内容哈希用作输出缓存键的一部分，文件改名或移动后仍能命中
+    return {"hash": hashlib.sha256(data).hexdigest(),
+            "width": size.width(), "height": size.height(),
+            "grayscale": probe.isGrayscale()}
+
+def decode_size(full_w, full_h, width, height):
+    """按比例缩小解码时刚好覆盖width×height的尺寸，不超过原图"""
+    factor = min(1.0, max(width / full_w, height / full_h))
+    return max(1, math.ceil(full_w * factor)), max(1, math.ceil(full_h * factor))
+
+def prefetch_queue_photo(file_path, layout_info, color_mode):
+    """排队模式在工作线程中预处理一张照片：读取照片信息、解码、缩放到单元格尺寸并合成整版
+    
+    color_mode与界面的颜色模式一致（0:自动, 1:彩色, 2:黑白），预览和输出使用相同的像素格式。
+    """
+    stamp = TileStore.stamp(file_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    info = photo_info(data)
+    if info is None:
+        raise ValueError(f"无法读取照片: {file_path}")
+    # 只按最大的单元格所需的分辨率解码，旋转的单元格宽高互换
+    full_size = (info["width"], info["height"])
+    size = max((decode_size(*full_size, *((h, w) if rotated % 2 else (w, h)))
+                for _, _, w, h, rotated in layout_info['cells']), default=full_size)
+    buffer = QBuffer()
+    buffer.setData(data)
+    image, error = read_image(buffer, *size) if size != full_size else read_image(buffer)
+    if image.isNull():
+        raise ValueError(f"无法读取照片: {file_path}: {error}")
+    grayscale = info["grayscale"] if color_mode == 0 else color_mode == 2
+    image_format = sheet_image_format(grayscale)
+    tiles = {}
+    sheet = render_sheet(image, layout_info, image_format, tiles=tiles)
+    return {"stamp": stamp, "info": info, "tiles": tiles, "sheet": sheet,
+            "image_format": image_format, "layout": layout_info}
+
+def load_manifest(file_path):
+    """读取订单清单（CSV或JSON），返回订单字典列表
+    
+    字段: source 源照片, photo_size 照片尺寸名, canvas 画布名, copies 张数（0为一整版）,
+    dpi, format 输出格式, output 输出路径, spacing 间距（可选，"水平,垂直"或单个值）。
+    """
+    with open(file_path, encoding="utf-8-sig", newline="") as f:
+        if file_path.lower().endswith(".json"):
+            data = json.load(f)
+            return data["orders"] if isinstance(data, dict) else data
+        return list(csv.DictReader(f))
+
+def resolve_manifest_order(order, size_manager):
+    """将订单中的尺寸名换算为尺寸，并补全默认值，返回可传给子进程的字典"""
+    photo = size_manager.find_photo_size(order["photo_size"])
+    canvas = size_manager.find_canvas_size(order["canvas"])
+    if photo is None:
+        raise ValueError(f"未知照片尺寸: {order['photo_size']}")
+    if canvas is None:
+        raise ValueError(f"未知画布: {order['canvas']}")
+    output = order["output"]
+    file_format = (order.get("format") or os.path.splitext(output)[1][1:] or "PNG").upper()
+    if file_format == "JPEG":
+        file_format = "JPG"
+    if file_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {file_format}")
+    spacing = [float(v) for v in str(order.get("spacing") or "0.5").split(",")]
+    return {"source": order["source"], "photo": photo, "canvas": canvas,
+            "copies": int(order.get("copies") or 0), "dpi": int(order.get("dpi") or 300),
+            "format": file_format, "output": output,
+            "spacing": (spacing[0], spacing[-1])}
+
+def file_sha256(file_path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def perceptual_hash(file_path):
+    """差值哈希(dHash)：缩小解码为9×8灰度图，比较相邻像素亮度得到64位整数，无法读取时返回None"""
+    image, _ = read_image(file_path, 9, 8)
+    if image.isNull():
+        return None
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    bits = 0
+    for y in range(8):
+        for x in range(8):
+            bits = bits << 1 | ((image.pixel(x, y) & 0xff) > (image.pixel(x + 1, y) & 0xff))
+    return bits
+
+def manifest_page_paths(output, page_count):
+    """订单各页的输出路径，多页时按页编号"""
+    if page_count == 1:
+        return [output]
+    base_path, extension = os.path.splitext(output)
+    return [f"{base_path}_{number:03d}{extension}" for number in range(1, page_count + 1)]
+
+def link_or_copy(source, target):
+    """优先用硬链接复用已渲染的文件，跨磁盘等无法链接时复制"""
+    if os.path.abspath(source) == os.path.abspath(target):
+        return
+    directory = os.path.dirname(target)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def run_manifest_source(source, orders):
+    """执行同一张源照片的订单（在子进程中调用），源照片只解码一次，相同尺寸的照片只缩放一次
+    
+    返回每个订单的(输出文件列表, 照片张数)。
+    """
+    image, error = read_image(source)
+    if image.isNull():
+        raise ValueError(f"{source}: {error}")
+    tiles = {}
+    results = []
+    for order in orders:
+        layout_info = compute_layout(order["canvas"], order["photo"], order["spacing"],
+                                     order["dpi"])
+        per_sheet = layout_info['total_photos']
+        copies = order["copies"]
+        if copies <= 0:
+            counts = [per_sheet]
+        else:
+            full_sheets, remainder = divmod(copies, per_sheet)
+            counts = [per_sheet] * full_sheets + ([remainder] if remainder else [])
+        
+        image_format = sheet_image_format(image.isGrayscale())
+        directory = os.path.dirname(order["output"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        paths = manifest_page_paths(order["output"], len(counts))
+        for path, count in zip(paths, counts):
+            sheet = render_sheet(image, layout_info, image_format, count, tiles)
+            if not save_image_with_dpi(sheet, path, order["format"], order["dpi"]):
+                raise OSError(f"无法保存文件: {path}")
+        results.append((paths, sum(counts)))
+    return results
+
+def run_manifest(manifest_path, workers=None, checkpoint_path=None):
+    """用进程池执行订单清单；完成的订单记入检查点文件，中断后重新运行会跳过它们"""
+    if checkpoint_path is None:
+        checkpoint_path = manifest_path + ".done"
+    completed = set()
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            completed = {line.rstrip("\n") for line in f if line.strip()}
+    
+    size_manager = SizeManager()
+    orders = []
+    skipped = failed = 0
+    for number, order in enumerate(load_manifest(manifest_path), 1):
+        if order.get("output") in completed:
+            skipped += 1
+            continue
+        try:
+            orders.append(resolve_manifest_order(order, size_manager))
+        except (KeyError, ValueError) as e:
+            failed += 1
+            print(f"第{number}行订单无效: {e}", file=sys.stderr)
+    print(f"共{len(orders) + skipped + failed}个订单，已完成{skipped}个，本次执行{len(orders)}个")
+    
+    start = time.perf_counter()
+    # 按文件内容去重：同一内容的源照片只解码一次，参数完全相同的画布只渲染一次
+    paths = sorted({order["source"] for order in orders})
+    with ThreadPoolExecutor() as pool:
+        digests = dict(zip(paths, pool.map(
+            lambda path: file_sha256(path) if os.path.isfile(path) else path, paths
+        )))
+    groups = {}  # {内容哈希: {画布键: [订单, ...]}}
+    for order in orders:
+        sheet_key = json.dumps([order[key] for key in
+                                ("photo", "canvas", "spacing", "dpi", "format", "copies")],
+                               sort_keys=True)
+        groups.setdefault(digests[order["source"]], {}).setdefault(sheet_key, []).append(order)
+    
+    # 内容不同但看起来相同的照片（如重新编码或另存）只做统计
+    unique_sources = {digest: next(iter(sheet_groups.values()))[0]["source"]
+                      for digest, sheet_groups in groups.items()}
+    with ThreadPoolExecutor() as pool:
+        perceptual = [h for h in pool.map(perceptual_hash, unique_sources.values())
+                      if h is not None]
+    similar = len(perceptual) - len(set(perceptual))
+    unique_sheets = sum(len(sheet_groups) for sheet_groups in groups.values())
+    
+    sheets = photos = done = linked = 0
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for digest, sheet_groups in groups.items():
+            batches = list(sheet_groups.values())
+            primaries = [batch[0] for batch in batches]
+            futures[executor.submit(run_manifest_source, unique_sources[digest], primaries)] = batches
+        for future in as_completed(futures):
+            batches = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                failed += sum(len(batch) for batch in batches)
+                print(f"失败: {batches[0][0]['source']}: {e}", file=sys.stderr)
+                continue
+            for batch, (page_paths, photo_count) in zip(batches, results):
+                for order in batch:
+                    if order is not batch[0]:
+                        try:
+                            for source, target in zip(page_paths, manifest_page_paths(
+                                    order["output"], len(page_paths))):
+                                link_or_copy(source, target)
+                        except OSError as e:
+                            failed += 1
+                            print(f"失败: {order['output']}: {e}", file=sys.stderr)
+                            continue
+                        linked += 1
+                    # 每完成一个订单立即写入检查点，进程被中断也不会丢失进度
+                    checkpoint.write(order["output"] + "\n")
+                    checkpoint.flush()
+                    done += 1
+                    sheets += len(page_paths)
+                    photos += photo_count
+    
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print(f"完成{done}个订单，{sheets}张画布，{photos}张照片，失败{failed}个")
+    print(f"耗时 {elapsed:.1f} 秒，{done / elapsed:.1f} 订单/秒，{sheets / elapsed:.1f} 画布/秒")
+    print(f"去重: {len(orders)}个订单共{len(groups)}张不同源照片（少解码{len(orders) - len(groups)}次），"
+          f"{unique_sheets}种不同画布（{linked}个订单直接复用已渲染文件）")
+    if similar:
+        print(f"另有{similar}张源照片与其他照片内容相近但文件不同，未合并")
+    return 1 if failed else 0
+
+def plan_roll_layout(roll_width, photo_w, photo_h, spacing, count, margin=0.0):
+    """在定宽卷纸上排列count张照片，选择消耗长度最短的照片方向
+    
+    count为0时排满一整行，选择一行能放下更多照片的方向。四周留出margin页边距。
+    返回{"cols", "rows", "count", "photo_w", "photo_h", "rotated", "margin_x", "margin_y",
+    "length"}（厘米），宽度放不下照片时返回None。
+    """
+    spacing_w, spacing_h = spacing
+    usable_w = roll_width - 2 * margin
+    best = None
+    for pw, ph, rotated in ((photo_w, photo_h, False), (photo_h, photo_w, True)):
+        cols = int((usable_w + spacing_w) // (pw + spacing_w)) if usable_w > 0 else 0
+        if cols == 0:
+            continue
+        photos = count if count > 0 else cols
+        rows = math.ceil(photos / cols)
+        length = rows * ph + max(0, rows - 1) * spacing_h + 2 * margin
+        if count > 0:
+            better = best is None or length < best["length"]
+        else:
+            better = best is None or (cols, -length) > (best["cols"], -best["length"])
+        if better:
+            used_w = cols * pw + (cols - 1) * spacing_w
+            best = {"cols": cols, "rows": rows, "count": photos, "photo_w": pw, "photo_h": ph,
+                    "rotated": rotated, "margin_x": (roll_width - used_w) / 2,
+                    "margin_y": margin, "length": length}
+    return best
+
+def plan_poster_tiles(poster_w, poster_h, canvas_w, canvas_h, overlap, mark_margin):
+    """将海报分割到多张画布上，相邻分片重叠overlap用于粘贴
+    
+    每张画布四周留出mark_margin放置对齐标记。比较画布两种方向，选择张数较少者。
+    返回{"canvas": (宽, 高), "cols", "rows", "tiles": [(行, 列, x0, y0, x1, y1)]}（厘米），
+    画布可打印区域不大于重叠宽度时返回None。
+    """
+    best = None
+    for sheet_w, sheet_h in ((canvas_w, canvas_h), (canvas_h, canvas_w)):
+        area_w = sheet_w - 2 * mark_margin
+        area_h = sheet_h - 2 * mark_margin
+        if area_w <= overlap or area_h <= overlap:
+            continue
+        cols = max(1, math.ceil((poster_w - overlap) / (area_w - overlap) - 1e-9))
+        rows = max(1, math.ceil((poster_h - overlap) / (area_h - overlap) - 1e-9))
+        if best is not None and cols * rows >= best["cols"] * best["rows"]:
+            continue
+        tiles = []
+        for row in range(rows):
+            for col in range(cols):
+                x0 = col * (area_w - overlap)
+                y0 = row * (area_h - overlap)
+                tiles.append((row, col, x0, y0,
+                              min(x0 + area_w, poster_w), min(y0 + area_h, poster_h)))
+        best = {"canvas": (sheet_w, sheet_h), "cols": cols, "rows": rows, "tiles": tiles}
+    return best
+
+def recommend_canvases(photo_size, canvas_sizes, spacings, margin=0.0, layout_mode=0,
+                       limit=RECOMMEND_LIMIT, refine=RECOMMEND_REFINE_COUNT):
+    """对所有画布×方向×间距组合计算每张画布可排张数，返回最好的limit个结果
+    
+    结果按张数、纸张利用率降序、每张成本升序排列。画布设置了"price"时按价格计算
+    每张成本，否则按每张照片占用的纸张面积(cm²)计算。与排版计算一致，排列区域
+    去掉四周页边距，放得下的判断与grid_rows_cols相同。混合旋转和裁切优化模式下，
+    按网格张数排名前refine个结果再用compute_layout重新计数（列数和行数为None），
+    其余结果保留网格张数，推荐在界面线程中也能及时返回。
+    """
+    if not canvas_sizes or not spacings:
+        return []
+    photo_w, photo_h = photo_size["width"], photo_size["height"]
+    if np is None:
+        results = _recommend_canvases_python(photo_w, photo_h, canvas_sizes, spacings,
+                                             margin, limit)
+    else:
+        results = _recommend_canvases_numpy(photo_w, photo_h, canvas_sizes, spacings,
+                                            margin, limit)
+    if layout_mode:
+        for result in results[:refine]:
+            canvas = result["canvas"]
+            canvas_w, canvas_h = canvas["width"], canvas["height"]
+            if result["rotated"]:
+                canvas_w, canvas_h = canvas_h, canvas_w
+            # 排版张数与DPI无关，按方向设置固定推荐结果的朝向
+            count = compute_layout(canvas, photo_size, result["spacing"], 300,
+                                   1 if canvas_w >= canvas_h else 2, layout_mode,
+                                   margin)['total_photos']
+            price = canvas.get("price", canvas["width"] * canvas["height"])
+            result.update(cols=None, rows=None, count=count,
+                          utilization=count * photo_w * photo_h / (canvas_w * canvas_h),
+                          cost_per_photo=price / count if count else math.inf)
+        results.sort(key=lambda r: (-r["count"], -r["utilization"], r["cost_per_photo"]))
+    return results
+
+def _recommend_canvases_numpy(photo_w, photo_h, canvas_sizes, spacings, margin, limit):
+    """recommend_canvases的NumPy实现：整体计算张数，只为最好的limit个组合生成结果"""
+    widths = np.array([c["width"] for c in canvas_sizes], dtype=float)
+    heights = np.array([c["height"] for c in canvas_sizes], dtype=float)
+    prices = np.array([c.get("price", c["width"] * c["height"]) for c in canvas_sizes], dtype=float)
+    spacing = np.array(spacings, dtype=float)  # (间距数, 2)
+    
+    # 形状 (画布数, 2种方向, 间距数)
+    canvas_w = np.stack([widths, heights], axis=1)[:, :, None]
+    canvas_h = np.stack([heights, widths], axis=1)[:, :, None]
+    spacing_w = spacing[None, None, :, 0]
+    spacing_h = spacing[None, None, :, 1]
+    area_w = np.maximum(canvas_w - 2 * margin, 0)
+    area_h = np.maximum(canvas_h - 2 * margin, 0)
+    cols = np.floor_divide(area_w + spacing_w, photo_w + spacing_w)
+    rows = np.floor_divide(area_h + spacing_h, photo_h + spacing_h)
+    counts = (cols * rows).ravel()
+    utilization = (cols * rows * (photo_w * photo_h) / (canvas_w * canvas_h)).ravel()
+    cost = (prices[:, None, None] / np.maximum(cols * rows, 1)).ravel()
+    
+    # 先按张数选出前limit个（与第limit个张数相同的全部保留），只对这些组合完整排序
+    top_k = min(limit, counts.size)
+    top = np.argpartition(-counts, top_k - 1)[:top_k]
+    threshold = max(counts[top].min(), 1)
+    candidates = np.flatnonzero(counts >= threshold)
+    # 排序键从次到主：成本升序、利用率降序、张数降序
+    order = candidates[np.lexsort((cost[candidates], -utilization[candidates],
+                                   -counts[candidates]))][:limit]
+    canvas_idx, orient_idx, spacing_idx = np.unravel_index(order, cols.shape)
+    results = []
+    for c, o, k, flat in zip(canvas_idx, orient_idx, spacing_idx, order):
+        results.append({
+            "canvas": canvas_sizes[c],
+            "rotated": bool(o),
+            "spacing": tuple(spacings[k]),
+            "cols": int(cols[c, o, k]),
+            "rows": int(rows[c, o, k]),
+            "count": int(counts[flat]),
+            "utilization": float(utilization[flat]),
+            "cost_per_photo": float(cost[flat])
+        })
+    return results
+
+def _recommend_canvases_python(photo_w, photo_h, canvas_sizes, spacings, margin, limit):
+    """recommend_canvases的纯Python实现"""
+    results = []
+    for canvas in canvas_sizes:
+        price = canvas.get("price", canvas["width"] * canvas["height"])
+        for rotated in (False, True):
+            canvas_w, canvas_h = canvas["width"], canvas["height"]
+            if rotated:
+                canvas_w, canvas_h = canvas_h, canvas_w
+            area_w = max(0, canvas_w - 2 * margin)
+            area_h = max(0, canvas_h - 2 * margin)
+            for spacing_w, spacing_h in spacings:
+                cols = int((area_w + spacing_w) // (photo_w + spacing_w))
+                rows = int((area_h + spacing_h) // (photo_h + spacing_h))
+                count = cols * rows
+                if count == 0:
+                    continue
+                results.append({
+                    "canvas": canvas, "rotated": rotated,
+                    "spacing": (spacing_w, spacing_h),
+                    "cols": cols, "rows": rows, "count": count,
+                    "utilization": count * photo_w * photo_h / (canvas_w * canvas_h),
+                    "cost_per_photo": price / count
+                })
+    results.sort(key=lambda r: (-r["count"], -r["utilization"], r["cost_per_photo"]))
+    return results[:limit]
+
+class MaxRectsPacker:
+    """MaxRects二维装箱（最短边优先），支持旋转
+    
+    内部以0.01毫米为单位的整数计算，避免浮点误差。
+    """
+    UNIT = 1000  # 每厘米的内部单位数
+    
+    def __init__(self, width, height):
+        self.free_rects = [(0, 0, self._units(width), self._units(height))]
+    
+    def _units(self, cm):
+        """厘米转换为内部整数单位"""
+        return int(round(cm * self.UNIT))
+    
+    def insert(self, width, height, allow_rotate=True):
+        """放入一个矩形，返回(x, y, 是否旋转)（厘米），放不下时返回None"""
+        w, h = self._units(width), self._units(height)
+        best = None
+        for fx, fy, fw, fh in self.free_rects:
+            for rw, rh, rotated in ((w, h, False), (h, w, True)):
+                if rotated and (not allow_rotate or w == h):
+                    continue
+                if rw <= fw and rh <= fh:
+                    score = (min(fw - rw, fh - rh), max(fw - rw, fh - rh))
+                    if best is None or score < best[0]:
+                        best = (score, fx, fy, rw, rh, rotated)
+        if best is None:
+            return None
+        _, x, y, rw, rh, rotated = best
+        self._split_free_rects((x, y, rw, rh))
+        return x / self.UNIT, y / self.UNIT, rotated
+    
+    def _split_free_rects(self, used):
+        """从空闲矩形中扣除已用区域，并去掉被包含的空闲矩形"""
+        ux, uy, uw, uh = used
+        new_rects = []
+        for fx, fy, fw, fh in self.free_rects:
+            if ux >= fx + fw or ux + uw <= fx or uy >= fy + fh or uy + uh <= fy:
+                new_rects.append((fx, fy, fw, fh))
+                continue
+            if ux > fx:
+                new_rects.append((fx, fy, ux - fx, fh))
+            if ux + uw < fx + fw:
+                new_rects.append((ux + uw, fy, fx + fw - ux - uw, fh))
+            if uy > fy:
+                new_rects.append((fx, fy, fw, uy - fy))
+            if uy + uh < fy + fh:
+                new_rects.append((fx, uy + uh, fw, fy + fh - uy - uh))
+        self.free_rects = [
+            a for i, a in enumerate(new_rects)
+            if not any(
+                j != i and b[0] <= a[0] and b[1] <= a[1] and
+                a[0] + a[2] <= b[0] + b[2] and a[1] + a[3] <= b[1] + b[3] and
+                (b != a or j < i)
+                for j, b in enumerate(new_rects)
+            )
+        ]
+
+def pack_order(items, canvas_w, canvas_h, spacing):
+    """将多尺寸订单装入尽量少的画布
+    
+    items为[{"size": 照片尺寸, "quantity": 数量, ...}]，返回每张画布的位置表
+    [[{"item": 订单项序号, "x", "y", "width", "height", "rotated"}]]（厘米）。
+    每张照片右侧和下方计入间距，画布相应加一个间距。
+    """
+    spacing_w, spacing_h = spacing
+    pieces = []
+    for index, item in enumerate(items):
+        w, h = item["size"]["width"], item["size"]["height"]
+        fits = ((w <= canvas_w and h <= canvas_h) or
+                (h <= canvas_w and w <= canvas_h))
+        if not fits:
+            raise ValueError(f"{item['size']['name']} 超出画布尺寸")
+        pieces.extend([(index, w, h)] * item["quantity"])
+    # 先放面积大、长边长的照片
+    pieces.sort(key=lambda p: (p[1] * p[2], max(p[1], p[2])), reverse=True)
+    
+    sheets = []
+    while pieces:
+        packer = MaxRectsPacker(canvas_w + spacing_w, canvas_h + spacing_h)
+        placements = []
+        remaining = []
+        for index, w, h in pieces:
+            result = packer.insert(w + spacing_w, h + spacing_h)
+            if result is None:
+                remaining.append((index, w, h))
+                continue
+            x, y, rotated = result
+            placements.append({
+                "item": index, "x": x, "y": y,
+                "width": h if rotated else w,
+                "height": w if rotated else h,
+                "rotated": rotated
+            })
+        sheets.append(placements)
+        pieces = remaining
+    return sheets
 
 class SizeManager:
     """尺寸管理器，处理尺寸数据的加载和保存"""
@@ -32,10 +1430,19 @@ class SizeManager:
         {"name": "A6", "width": 10.5, "height": 14.8},
     ]
     
+    # 卷纸只有宽度，长度按需
+    DEFAULT_ROLL_SIZES = [
+        {"name": "4英寸卷纸", "width": 10.2},
+        {"name": "5英寸卷纸", "width": 12.7},
+        {"name": "6英寸卷纸", "width": 15.2},
+        {"name": "8英寸卷纸", "width": 20.3},
+    ]
+    
     def __init__(self):
         self.settings = QSettings("PhotoLayoutTool", "SizeConfig")
         self.photo_sizes = self.load_sizes("photo_sizes", self.DEFAULT_PHOTO_SIZES)
         self.canvas_sizes = self.load_sizes("canvas_sizes", self.DEFAULT_CANVAS_SIZES)
+        self.roll_sizes = self.load_sizes("roll_sizes", self.DEFAULT_ROLL_SIZES)
     
     def load_sizes(self, key, default):
         """从设置中加载尺寸数据"""
@@ -51,6 +1458,7 @@ class SizeManager:
         """保存尺寸数据到设置"""
         self.settings.setValue("photo_sizes", json.dumps(self.photo_sizes))
         self.settings.setValue("canvas_sizes", json.dumps(self.canvas_sizes))
+        self.settings.setValue("roll_sizes", json.dumps(self.roll_sizes))
     
     def get_photo_size(self, index):
         """获取照片尺寸"""
@@ -81,6 +1489,33 @@ class SizeManager:
             "height": height
         })
         self.save_sizes()
+    
+    def add_roll_size(self, name, width):
+        """添加自定义卷纸宽度"""
+        self.roll_sizes.append({
+            "name": name,
+            "width": width
+        })
+        self.save_sizes()
+    
+    def find_photo_size(self, name):
+        """按名称查找照片尺寸"""
+        return next((size for size in self.photo_sizes if size["name"] == name), None)
+    
+    def find_canvas_size(self, name):
+        """按名称查找画布尺寸"""
+        return next((size for size in self.canvas_sizes if size["name"] == name), None)
+    
+    def get_folder_profile(self, folder):
+        """获取热文件夹的排版配置，未保存过时返回None"""
+        profiles = self.load_sizes("hot_folder_profiles", {})
+        return profiles.get(os.path.abspath(folder)) if folder else None
+    
+    def save_folder_profile(self, folder, profile):
+        """保存热文件夹的排版配置"""
+        profiles = self.load_sizes("hot_folder_profiles", {})
+        profiles[os.path.abspath(folder)] = profile
+        self.settings.setValue("hot_folder_profiles", json.dumps(profiles))
 
 class SizeEditorDialog(QDialog):
     """尺寸编辑对话框"""
@@ -100,7 +1535,10 @@ class SizeEditorDialog(QDialog):
         
         form_layout.addRow("名称:", self.name_edit)
         form_layout.addRow("宽度 (cm):", self.width_edit)
-        form_layout.addRow("高度 (cm):", self.height_edit)
+        # 卷纸只有宽度，长度按需
+        self.with_height = size_type != "卷纸"
+        if self.with_height:
+            form_layout.addRow("高度 (cm):", self.height_edit)
         
         layout.addLayout(form_layout)
         
@@ -111,16 +1549,16 @@ class SizeEditorDialog(QDialog):
         layout.addWidget(button_box)
     
     def get_size(self):
-        """获取编辑后的尺寸"""
+        """获取编辑后的尺寸，卷纸的高度为None"""
         try:
             name = self.name_edit.text().strip()
             width = float(self.width_edit.text())
-            height = float(self.height_edit.text())
+            height = float(self.height_edit.text()) if self.with_height else None
             
             if not name:
                 raise ValueError("名称不能为空")
                 
-            if width <= 0 or height <= 0:
+            if width <= 0 or (height is not None and height <= 0):
                 raise ValueError("尺寸必须大于0")
                 
             return name, width, height
@@ -128,74 +1566,1200 @@ class SizeEditorDialog(QDialog):
             QMessageBox.warning(self, "输入错误", str(e))
             return None, None, None
 
-class EnhancedPhotoLayoutTool(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("专业证件照片排版工具")
-        self.setGeometry(100, 100, 1100, 700)
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #f5f7fa;
-                font-family: 'Segoe UI', Arial, sans-serif;
-            }
-            QGroupBox {
-                border: 1px solid #dcdfe6;
-                border-radius: 8px;
-                margin-top: 1ex;
-                font-weight: bold;
-                padding: 12px;
-                background-color: white;
-            }
-            QGroupBox::title {
-                subcontrol-origin: margin;
-                subcontrol-position: top center;
-                padding: 0 8px;
-                font-size: 13px;
-                color: #409eff;
-            }
-            QLabel {
-                font-size: 12px;
-                color: #606266;
-            }
-            QComboBox, QLineEdit {
-                border: 1px solid #dcdfe6;
-                border-radius: 4px;
-                padding: 6px 10px;
-                font-size: 12px;
-                min-height: 28px;
-                background-color: white;
-            }
-            QComboBox:hover, QLineEdit:hover {
-                border-color: #c0c4cc;
-            }
-            QComboBox:focus, QLineEdit:focus {
-                border: 1px solid #409eff;
-                box-shadow: 0 0 3px rgba(64, 158, 255, 0.3);
-            }
-            QPushButton {
-                background-color: #409eff;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                padding: 10px 16px;
-                font-size: 13px;
-                font-weight: 500;
-                min-height: 36px;
-            }
-            QPushButton:hover {
-                background-color: #66b1ff;
-            }
-            QPushButton:pressed {
-                background-color: #3a8ee6;
-            }
-            QPushButton#actionButton {
-                background-color: #67c23a;
-            }
-            QPushButton#actionButton:hover {
-                background-color: #85ce61;
-            }
-            QRadioButton {
-                font-size: 12px;
+class MultiExportDialog(QDialog):
+    """多分辨率导出对话框：一次合成，输出多个分辨率/格式的文件"""
+    # 默认输出：客户样张、冲印文件
+    DEFAULT_OUTPUTS = [
+        {"enabled": True, "dpi": 150, "format": "JPG", "watermark": True},
+        {"enabled": True, "dpi": 300, "format": "TIFF", "watermark": False},
+        {"enabled": False, "dpi": 600, "format": "TIFF", "watermark": False},
+    ]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("多分辨率导出")
+        self.setMinimumWidth(420)
+        
+        layout = QVBoxLayout(self)
+        
+        grid = QGridLayout()
+        grid.addWidget(QLabel("输出"), 0, 0)
+        grid.addWidget(QLabel("DPI"), 0, 1)
+        grid.addWidget(QLabel("格式"), 0, 2)
+        grid.addWidget(QLabel("样张水印"), 0, 3)
+        
+        self.rows = []
+        for i, output in enumerate(self.DEFAULT_OUTPUTS, 1):
+            enabled_check = QCheckBox(f"文件{i}")
+            enabled_check.setChecked(output["enabled"])
+            dpi_combo = QComboBox()
+            for dpi in DPI_VALUES:
+                dpi_combo.addItem(str(dpi), dpi)
+            dpi_combo.setCurrentIndex(dpi_combo.findData(output["dpi"]))
+            format_combo = QComboBox()
+            format_combo.addItems(OUTPUT_FORMATS)
+            format_combo.setCurrentText(output["format"])
+            watermark_check = QCheckBox()
+            watermark_check.setChecked(output["watermark"])
+            
+            grid.addWidget(enabled_check, i, 0)
+            grid.addWidget(dpi_combo, i, 1)
+            grid.addWidget(format_combo, i, 2)
+            grid.addWidget(watermark_check, i, 3)
+            self.rows.append((enabled_check, dpi_combo, format_combo, watermark_check))
+        
+        layout.addLayout(grid)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+    
+    def get_outputs(self):
+        """获取选中的输出列表"""
+        outputs = []
+        for enabled_check, dpi_combo, format_combo, watermark_check in self.rows:
+            if enabled_check.isChecked():
+                outputs.append({
+                    "dpi": dpi_combo.currentData(),
+                    "format": format_combo.currentText(),
+                    "watermark": watermark_check.isChecked()
+                })
+        return outputs
+
+class OrderPackingDialog(QDialog):
+    """多尺寸拼版对话框：输入订单中每种照片的尺寸、源照片和数量"""
+    def __init__(self, parent=None, size_manager=None):
+        super().__init__(parent)
+        self.size_manager = size_manager
+        self.setWindowTitle("多尺寸订单拼版")
+        self.setMinimumSize(600, 360)
+        
+        layout = QVBoxLayout(self)
+        
+        self.table = QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(["照片尺寸", "源照片", "数量"])
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        
+        add_btn = QPushButton("添加照片")
+        add_btn.clicked.connect(self.add_row)
+        layout.addWidget(add_btn)
+        
+        form_layout = QFormLayout()
+        self.canvas_combo = QComboBox()
+        for size in self.size_manager.canvas_sizes:
+            self.canvas_combo.addItem(
+                f"{size['name']}: ({size['width']}cm×{size['height']}cm)", size
+            )
+        form_layout.addRow("冲洗照片尺寸:", self.canvas_combo)
+        layout.addLayout(form_layout)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+    
+    def add_row(self):
+        """添加一行订单，先选择源照片"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择证件照片", "", "图片文件 (*.png *.jpg *.jpeg *.bmp)"
+        )
+        if not file_path:
+            return
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        
+        size_combo = QComboBox()
+        for size in self.size_manager.photo_sizes:
+            size_combo.addItem(f"{size['name']} ({size['width']}cm×{size['height']}cm)", size)
+        self.table.setCellWidget(row, 0, size_combo)
+        
+        file_label = QLabel(os.path.basename(file_path))
+        file_label.setToolTip(file_path)
+        file_label.setProperty("file_path", file_path)
+        self.table.setCellWidget(row, 1, file_label)
+        
+        quantity_spin = QSpinBox()
+        quantity_spin.setRange(1, 999)
+        quantity_spin.setValue(1)
+        self.table.setCellWidget(row, 2, quantity_spin)
+    
+    def get_order(self):
+        """获取订单项列表和画布尺寸"""
+        items = []
+        for row in range(self.table.rowCount()):
+            items.append({
+                "size": self.table.cellWidget(row, 0).currentData(),
+                "file_path": self.table.cellWidget(row, 1).property("file_path"),
+                "quantity": self.table.cellWidget(row, 2).value()
+            })
+        return items, self.canvas_combo.currentData()
+
+class CanvasRecommendDialog(QDialog):
+    """画布推荐对话框：列出张数最多的画布、方向和间距组合"""
+    def __init__(self, parent=None, results=None):
+        super().__init__(parent)
+        self.results = results or []
+        self.setWindowTitle("推荐最佳画布")
+        self.setMinimumSize(640, 420)
+        
+        layout = QVBoxLayout(self)
+        
+        self.table = QTableWidget(len(self.results), 6)
+        self.table.setHorizontalHeaderLabels(
+            ["画布", "方向", "间距 (cm)", "每张画布", "纸张利用率", "每张成本"]
+        )
+        self.table.horizontalHeaderItem(5).setToolTip("画布设置了价格时按价格计算，否则为每张照片占用的纸张面积(cm²)")
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        for row, result in enumerate(self.results):
+            canvas = result["canvas"]
+            canvas_w, canvas_h = canvas["width"], canvas["height"]
+            if result["rotated"]:
+                canvas_w, canvas_h = canvas_h, canvas_w
+            values = [
+                f"{canvas['name']} ({canvas['width']}cm×{canvas['height']}cm)",
+                "横向" if canvas_w >= canvas_h else "竖向",
+                f"{result['spacing'][0]} / {result['spacing'][1]}",
+                f"{result['rows']}行 × {result['cols']}列 = {result['count']}张"
+                if result['cols'] is not None else f"{result['count']}张",
+                f"{result['utilization']:.0%}",
+                f"{result['cost_per_photo']:.2f}"
+            ]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(value))
+        if self.results:
+            self.table.selectRow(0)
+        self.table.doubleClicked.connect(self.accept)
+        layout.addWidget(self.table)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("使用所选画布")
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+    
+    def selected_result(self):
+        """获取选中的推荐结果"""
+        row = self.table.currentRow()
+        if 0 <= row < len(self.results):
+            return self.results[row]
+        return None
+
+class PageThumbnailModel(QAbstractListModel):
+    """多页作业的缩略图模型，只在视图请求可见行时才渲染缩略图"""
+    THUMBNAIL_HEIGHT = 96
+    
+    def __init__(self, render_thumbnail, parent=None):
+        super().__init__(parent)
+        self.render_thumbnail = render_thumbnail
+        self.pages = []
+        self.thumbnails = {}
+    
+    def set_pages(self, pages):
+        """更换页面列表并清空已渲染的缩略图"""
+        self.beginResetModel()
+        self.pages = pages
+        self.thumbnails = {}
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.pages)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        page = self.pages[index.row()]
+        if role == Qt.DisplayRole:
+            return f"第{index.row() + 1}页 · {page['count']}张"
+        if role == Qt.DecorationRole:
+            thumbnail = self.thumbnails.get(index.row())
+            if thumbnail is None:
+                thumbnail = self.render_thumbnail(page, self.THUMBNAIL_HEIGHT)
+                self.thumbnails[index.row()] = thumbnail
+            return thumbnail
+        return None
+
+class PhotoGalleryModel(QAbstractListModel):
+    """照片库模型：只为视图请求的可见行加载缩略图，在线程池中按缩略图尺寸解码"""
+    THUMBNAIL_SIZE = 96
+    thumbnailLoaded = pyqtSignal(str, QImage)  # 工作线程加载完成的缩略图
+    filesFound = pyqtSignal(list)  # 工作线程扫描到的照片文件
+    
+    def __init__(self, tile_store, parent=None):
+        super().__init__(parent)
+        self.tile_store = tile_store
+        self.paths = []
+        self.rows = {}  # {路径: 行号}
+        self.thumbnails = {}  # {路径: QPixmap}
+        self.loading = set()
+        self.executor = ThreadPoolExecutor(max_workers=GALLERY_WORKERS)
+        # 信号排队回到界面线程，QPixmap只能在界面线程中创建
+        self.thumbnailLoaded.connect(self.set_thumbnail)
+        self.filesFound.connect(self.add_paths)
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ToolTipRole:
+            return path
+        if role == Qt.DecorationRole:
+            thumbnail = self.thumbnails.get(path)
+            if thumbnail is None and path not in self.loading:
+                self.loading.add(path)
+                self.executor.submit(self.load_thumbnail, path)
+            return thumbnail
+        return None
+    
+    def load_thumbnail(self, path):
+        """读取缩略图（在工作线程中调用），优先使用磁盘缓存，否则按缩略图尺寸解码"""
+        name = f"thumb_{self.THUMBNAIL_SIZE}"
+        try:
+            stamp = TileStore.stamp(path)
+        except OSError:
+            stamp = None
+        image = self.tile_store.get_image(stamp, name) if stamp else None
+        if image is None:
+            reader = open_image_reader(path)
+            size = oriented_size(reader)
+            if size.isValid():
+                # JPEG等格式可在解码时直接缩小，无需先解出全尺寸图像
+                size = size.scaled(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE, Qt.KeepAspectRatio)
+                set_scaled_size(reader, size.width(), size.height())
+            image = reader.read()
+            if stamp and not image.isNull():
+                self.tile_store.put_image(stamp, name, image)
+        self.thumbnailLoaded.emit(path, image)
+    
+    def set_thumbnail(self, path, image):
+        self.loading.discard(path)
+        row = self.rows.get(path)
+        if row is None or image.isNull():
+            return
+        self.thumbnails[path] = QPixmap.fromImage(image)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+    
+    def add_paths(self, paths):
+        """添加照片文件，已在库中的忽略"""
+        new_paths = [path for path in dict.fromkeys(paths) if path not in self.rows]
+        if not new_paths:
+            return
+        first = len(self.paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_paths) - 1)
+        for path in new_paths:
+            self.rows[path] = len(self.paths)
+            self.paths.append(path)
+        self.endInsertRows()
+    
+    def add_folder(self, folder):
+        """在后台扫描文件夹（含子文件夹），界面不会卡住"""
+        self.executor.submit(self.scan_folder, folder)
+    
+    def scan_folder(self, folder):
+        """扫描文件夹（在工作线程中调用），分批送回界面线程"""
+        batch = []
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                if not name.startswith(".") and name.lower().endswith(IMAGE_EXTENSIONS):
+                    batch.append(os.path.join(root, name))
+                    if len(batch) >= 200:
+                        self.filesFound.emit(batch)
+                        batch = []
+        if batch:
+            self.filesFound.emit(batch)
+    
+    def clear(self):
+        self.beginResetModel()
+        self.paths = []
+        self.rows = {}
+        self.thumbnails = {}
+        self.endResetModel()
+
+class PreviewCanvas(QLabel):
+    """排版预览区域：显示缩放后的画布，并把鼠标位置换算为位置表中的单元格"""
+    cellClicked = pyqtSignal(int, QPoint)  # 单元格序号, 鼠标全局位置
+    dragMoved = pyqtSignal(str, float, float)  # 手柄名, 水平/垂直位移（画布像素）
+    dragFinished = pyqtSignal(str, float, float)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.scale = 1.0  # 显示像素 / 画布像素
+        self.cells = None  # 当前显示的位置表，卷纸预览时为空
+        self.handles = []  # 可拖动的手柄 [(手柄名, 画布像素矩形)]
+        self.drag_handle = None
+        self.drag_origin = None
+        self.setMouseTracking(True)
+    
+    def set_canvas(self, pixmap, scale=1.0, cells=None, handles=()):
+        """显示预览图，并记录缩放比例、位置表和拖动手柄"""
+        self.scale = scale
+        self.cells = cells
+        self.handles = list(handles)
+        self.setPixmap(pixmap)
+    
+    def canvas_point(self, pos):
+        """将控件坐标换算为画布像素坐标（预览图居中显示）"""
+        pixmap = self.pixmap()
+        if pixmap is None or pixmap.isNull() or self.scale <= 0:
+            return None
+        left = (self.width() - pixmap.width()) / 2
+        top = (self.height() - pixmap.height()) / 2
+        return (pos.x() - left) / self.scale, (pos.y() - top) / self.scale
+    
+    def cell_at(self, pos):
+        """返回鼠标位置下的单元格序号，不在任何单元格内时返回-1"""
+        point = self.canvas_point(pos)
+        if point is None or self.cells is None:
+            return -1
+        px, py = point
+        for index, (x, y, w, h, _) in enumerate(self.cells):
+            if x <= px < x + w and y <= py < y + h:
+                return index
+        return -1
+    
+    def handle_at(self, pos):
+        """返回鼠标位置下的拖动手柄名"""
+        point = self.canvas_point(pos)
+        if point is None:
+            return None
+        for name, rect in self.handles:
+            if rect.contains(int(point[0]), int(point[1])):
+                return name
+        return None
+    
+    def drag_delta(self, pos):
+        """拖动位移，换算为画布像素"""
+        return ((pos.x() - self.drag_origin.x()) / self.scale,
+                (pos.y() - self.drag_origin.y()) / self.scale)
+    
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            handle = self.handle_at(event.pos())
+            if handle is not None:
+                self.drag_handle = handle
+                self.drag_origin = event.pos()
+                return
+            index = self.cell_at(event.pos())
+            if index >= 0:
+                self.cellClicked.emit(index, event.globalPos())
+                return
+        super().mousePressEvent(event)
+    
+    def mouseMoveEvent(self, event):
+        if self.drag_handle is not None:
+            self.dragMoved.emit(self.drag_handle, *self.drag_delta(event.pos()))
+            return
+        handle = self.handle_at(event.pos())
+        if handle is None:
+            self.unsetCursor()
+        elif handle in ("gutter_x", "margin_left", "margin_right"):
+            self.setCursor(Qt.SplitHCursor)
+        else:
+            self.setCursor(Qt.SplitVCursor)
+        super().mouseMoveEvent(event)
+    
+    def mouseReleaseEvent(self, event):
+        if self.drag_handle is not None and event.button() == Qt.LeftButton:
+            handle, self.drag_handle = self.drag_handle, None
+            self.dragFinished.emit(handle, *self.drag_delta(event.pos()))
+            return
+        super().mouseReleaseEvent(event)
+
+class PosterDialog(QDialog):
+    """海报分页对话框：设置海报尺寸、画布和粘贴重叠"""
+    def __init__(self, parent=None, size_manager=None):
+        super().__init__(parent)
+        self.size_manager = size_manager
+        self.file_path = None
+        self.source_size = None
+        self.setWindowTitle("海报分页打印")
+        self.setMinimumWidth(380)
+        
+        layout = QVBoxLayout(self)
+        form_layout = QFormLayout()
+        
+        self.file_btn = QPushButton("选择图片")
+        self.file_btn.clicked.connect(self.choose_file)
+        form_layout.addRow("海报图片:", self.file_btn)
+        
+        self.width_edit = QLineEdit()
+        self.width_edit.textEdited.connect(self.keep_aspect)
+        form_layout.addRow("海报宽度 (cm):", self.width_edit)
+        self.height_edit = QLineEdit()
+        form_layout.addRow("海报高度 (cm):", self.height_edit)
+        
+        self.canvas_combo = QComboBox()
+        for size in self.size_manager.canvas_sizes:
+            self.canvas_combo.addItem(
+                f"{size['name']}: ({size['width']}cm×{size['height']}cm)", size
+            )
+        form_layout.addRow("分页画布:", self.canvas_combo)
+        
+        self.overlap_edit = QLineEdit("1.0")
+        form_layout.addRow("粘贴重叠 (cm):", self.overlap_edit)
+        self.margin_edit = QLineEdit("0.8")
+        form_layout.addRow("标记边距 (cm):", self.margin_edit)
+        
+        layout.addLayout(form_layout)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+    
+    def choose_file(self):
+        """选择海报图片，只读取文件头获取尺寸"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择海报图片", "", "图片文件 (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)"
+        )
+        if not file_path:
+            return
+        size = oriented_size(open_image_reader(file_path))
+        if not size.isValid():
+            QMessageBox.warning(self, "错误", "无法读取图片尺寸！")
+            return
+        self.file_path = file_path
+        self.source_size = size
+        self.file_btn.setText(os.path.basename(file_path))
+        self.keep_aspect()
+    
+    def keep_aspect(self):
+        """按图片宽高比自动计算海报高度"""
+        try:
+            width = float(self.width_edit.text())
+        except ValueError:
+            return
+        if self.source_size is not None:
+            height = width * self.source_size.height() / self.source_size.width()
+            self.height_edit.setText(f"{height:.1f}")
+    
+    def get_settings(self):
+        """获取海报设置，输入无效时返回None"""
+        try:
+            if not self.file_path:
+                raise ValueError("请选择海报图片")
+            poster_w = float(self.width_edit.text())
+            poster_h = float(self.height_edit.text())
+            overlap = float(self.overlap_edit.text())
+            mark_margin = float(self.margin_edit.text())
+            if poster_w <= 0 or poster_h <= 0 or overlap < 0 or mark_margin < 0:
+                raise ValueError("尺寸必须大于0")
+        except ValueError as e:
+            QMessageBox.warning(self, "输入错误", str(e))
+            return None
+        return {"file_path": self.file_path, "source_size": self.source_size,
+                "poster": (poster_w, poster_h), "canvas": self.canvas_combo.currentData(),
+                "overlap": overlap, "mark_margin": mark_margin}
+
+def evict_lru(directory, max_bytes):
+    """删除目录中最久未使用（修改时间最早）的文件，直到总大小不超过上限"""
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+    except OSError:
+        return
+    stats = []
+    for entry in entries:
+        try:
+            stats.append((entry.stat(), entry.path))
+        except OSError:
+            continue
+    stats.sort(key=lambda item: item[0].st_mtime)
+    total = sum(stat.st_size for stat, _ in stats)
+    for stat, path in stats:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= stat.st_size
+
+class OutputCache:
+    """按内容寻址的输出缓存
+    
+    内存中保留最近一次合成的整版，只改输出格式时直接重新编码；编码后的文件以键名
+    保存在磁盘目录中，按最近使用时间淘汰，总大小不超过max_bytes。
+    """
+    def __init__(self, directory, max_bytes=OUTPUT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sheet_key = None
+        self.sheet = None
+    
+    @staticmethod
+    def make_key(*parts):
+        """由任意可JSON序列化的参数生成缓存键"""
+        data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+    
+    def get_sheet(self, key):
+        return self.sheet if key == self.sheet_key else None
+    
+    def put_sheet(self, key, sheet):
+        self.sheet_key = key
+        self.sheet = sheet
+    
+    def get_file(self, key):
+        """返回缓存文件路径，并更新其最近使用时间；未命中时返回None"""
+        path = os.path.join(self.directory, key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+    
+    def put_file(self, key, file_path):
+        """将已保存的输出文件复制进缓存，然后按大小上限淘汰旧文件"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = os.path.join(self.directory, key + ".tmp")
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, os.path.join(self.directory, key))
+        except OSError:
+            return
+        self.evict()
+    
+    def evict(self):
+        evict_lru(self.directory, self.max_bytes)
+
+class ImageCache:
+    """内存中的图像缓存，总字节数不超过预算
+    
+    超出预算时按最近使用顺序淘汰，被固定（pin）的图像（如正在导出所用的源照片）
+    不会被淘汰。同一键可多次固定，全部解除后才可淘汰；尚未放入的键也可预先固定。
+    """
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # 键 -> QImage，最近使用的在末尾
+        self.pins = {}  # 键 -> 固定次数
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """返回缓存的图像并标记为最近使用；未命中时返回None"""
+        image = self.entries.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return image
+    
+    def put(self, key, image):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old.sizeInBytes()
+        self.entries[key] = image
+        self.bytes += image.sizeInBytes()
+        self.evict()
+    
+    def pin(self, key):
+        self.pins[key] = self.pins.get(key, 0) + 1
+    
+    def unpin(self, key):
+        count = self.pins.get(key, 0) - 1
+        if count > 0:
+            self.pins[key] = count
+        else:
+            self.pins.pop(key, None)
+        self.evict()
+    
+    @contextmanager
+    def pinned(self, keys):
+        """在with块内固定一组键"""
+        keys = list(keys)
+        for key in keys:
+            self.pin(key)
+        try:
+            yield
+        finally:
+            for key in keys:
+                self.unpin(key)
+    
+    def set_budget(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict()
+    
+    def evict(self):
+        """从最久未使用的图像开始淘汰，跳过被固定的图像"""
+        if self.bytes <= self.max_bytes:
+            return
+        for key in list(self.entries):
+            if key in self.pins:
+                continue
+            self.bytes -= self.entries.pop(key).sizeInBytes()
+            self.evictions += 1
+            if self.bytes <= self.max_bytes:
+                break
+    
+    def discard(self, key):
+        image = self.entries.pop(key, None)
+        if image is not None:
+            self.bytes -= image.sizeInBytes()
+    
+    def pinned_bytes(self):
+        return sum(image.sizeInBytes() for key, image in self.entries.items()
+                   if key in self.pins)
+
+class TileStore:
+    """持久化照片缓存：按文件路径、修改时间和大小保存照片信息和缩放后的照片
+    
+    位于系统缓存目录（Linux下遵循XDG_CACHE_HOME），重新打开最近用过的照片或重启程序后
+    无需再次解码。写入在后台线程进行，总大小超过上限时按最近使用时间淘汰。
+    """
+    EVICT_EVERY = 32  # 每写入多少个文件检查一次总大小
+    VERSION = 2  # 照片的读取方式改变时递增（2: 按EXIF方向旋转），旧文件不再命中并被逐步淘汰
+    
+    def __init__(self, directory, max_bytes=TILE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.writes = 0
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.infos = {}  # 本次运行读写过的照片信息，后台写入完成前也可读到
+        # 启动时先按大小上限淘汰一次，之前运行留下的超额文件不必等到写满一批才清理
+        self.writer.submit(evict_lru, directory, max_bytes)
+    
+    @staticmethod
+    def stamp(file_path):
+        """文件的缓存标识：绝对路径、修改时间和大小，文件改动后自动失效"""
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+    
+    def entry_path(self, stamp, name, extension):
+        key = hashlib.sha1(f"{self.VERSION}|{stamp}|{name}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + extension)
+    
+    def get_info(self, stamp):
+        """读取照片信息（内容哈希、尺寸、是否黑白），未缓存时返回None"""
+        info = self.infos.get(stamp)
+        if info is not None:
+            return info
+        path = self.entry_path(stamp, "info", ".json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                info = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self.infos[stamp] = info
+        return info
+    
+    def put_info(self, stamp, info):
+        self.infos[stamp] = info
+        self.writer.submit(self.write_file, self.entry_path(stamp, "info", ".json"),
+                           json.dumps(info).encode("utf-8"))
+    
+    def get_image(self, stamp, name):
+        """读取缓存的图像，未缓存时返回None"""
+        path = self.entry_path(stamp, name, ".png")
+        image = QImage(path)
+        if image.isNull():
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+    
+    def put_image(self, stamp, name, image):
+        # PNG最高质量即不压缩，写入和读回都很快
+        self.writer.submit(lambda: self.write_file(self.entry_path(stamp, name, ".png"),
+                                                   encode_image(image, "PNG", 100)))
+    
+    def write_file(self, path, data):
+        """写入缓存文件（在后台线程中调用）"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return
+        self.writes += 1
+        if self.writes % self.EVICT_EVERY == 0:
+            evict_lru(self.directory, self.max_bytes)
+
+class QueuePrefetcher(QObject):
+    """排队模式：在后台预处理照片库中接下来的几张照片
+    
+    每张照片在工作线程中解码、缩放到当前单元格尺寸并合成整版，结果放入图像缓存并固定，
+    切换到该照片时预览直接命中缓存，导出时直接使用合成好的整版。
+    排版或输出设置变化后，旧的结果不再使用。
+    """
+    photoReady = pyqtSignal(str, object)  # 工作线程处理完成的照片和结果
+    photoFailed = pyqtSignal(str, object)  # 处理失败的照片和提交时的参数
+    
+    def __init__(self, image_cache, tile_store, parent=None):
+        super().__init__(parent)
+        self.image_cache = image_cache
+        self.tile_store = tile_store
+        self.params = None  # 当前的(排版信息, 颜色模式)
+        self.paths = []  # 需要预处理的照片
+        self.ready = {}  # 已完成的照片 {路径: 结果}，图像保存在图像缓存中
+        self.active = set()  # 正在处理的照片
+        self.failed = set()  # 无法处理的照片，设置不变时不再重试
+        self.executor = ThreadPoolExecutor(max_workers=QUEUE_PREFETCH_WORKERS)
+        
+        # 工作线程发出的信号排队回到界面线程处理
+        self.photoReady.connect(self.finish)
+        self.photoFailed.connect(self.fail)
+    
+    def same_params(self, params):
+        # 排版信息可能被重新计算，按排版参数比较而不是按对象比较
+        return (self.params is not None
+                and params[0]['layout_key'] == self.params[0]['layout_key']
+                and params[1:] == self.params[1:])
+    
+    def request(self, paths, layout_info, color_mode):
+        """设置需要预处理的照片，不在其中的旧结果解除固定"""
+        params = (layout_info, color_mode)
+        if not self.same_params(params):
+            self.clear()
+            self.params = params
+        self.paths = list(paths)
+        for path in list(self.ready):
+            if path not in self.paths:
+                self.release(self.ready.pop(path))
+        self.submit_missing()
+    
+    def clear(self):
+        for entry in self.ready.values():
+            self.release(entry)
+        self.ready = {}
+        self.paths = []
+        self.failed = set()
+    
+    def submit_missing(self):
+        for path in self.paths:
+            if path in self.ready or path in self.active or path in self.failed:
+                continue
+            self.active.add(path)
+            future = self.executor.submit(prefetch_queue_photo, path, *self.params)
+            future.add_done_callback(functools.partial(self.task_done, path, self.params))
+    
+    def task_done(self, path, params, future):
+        """在工作线程中调用，结果通过信号交给界面线程"""
+        try:
+            result = future.result()
+        except Exception:
+            self.photoFailed.emit(path, params)
+            return
+        result["params"] = params
+        self.photoReady.emit(path, result)
+    
+    def finish(self, path, result):
+        self.active.discard(path)
+        if not self.same_params(result["params"]) or path not in self.paths:
+            # 处理期间设置或当前照片已变化
+            self.submit_missing()
+            return
+        stamp = result["stamp"]
+        self.tile_store.put_info(stamp, result["info"])
+        images = {("sheet", stamp): result["sheet"]}
+        for (w, h, rotated, image_format), tile in result["tiles"].items():
+            images[("tile", stamp, w, h, int(rotated), int(image_format))] = tile
+        # 先固定再放入，避免放入时就被淘汰
+        for key, image in images.items():
+            self.image_cache.pin(key)
+            self.image_cache.put(key, image)
+        self.ready[path] = {"stamp": stamp, "keys": list(images),
+                            "image_format": result["image_format"],
+                            "layout": result["layout"]}
+    
+    def fail(self, path, params):
+        self.active.discard(path)
+        if self.same_params(params):
+            self.failed.add(path)
+        else:
+            self.submit_missing()
+    
+    def release(self, entry):
+        for key in entry["keys"]:
+            self.image_cache.unpin(key)
+        self.image_cache.discard(("sheet", entry["stamp"]))
+    
+    def take(self, path):
+        """取出已预处理的照片，返回包含整版的结果；未就绪时返回None
+        
+        缩放后的照片解除固定但留在图像缓存中，整版移出图像缓存交给调用者。
+        """
+        entry = self.ready.pop(path, None)
+        if entry is None:
+            return None
+        entry["sheet"] = self.image_cache.get(("sheet", entry["stamp"]))
+        self.release(entry)
+        return entry
+
+def forward_to_running_instance(file_paths):
+    """已有窗口在运行时把文件交给它，成功返回True；需先创建QApplication"""
+    socket = QLocalSocket()
+    socket.connectToServer(SINGLE_INSTANCE_NAME)
+    if not socket.waitForConnected(SINGLE_INSTANCE_TIMEOUT_MS):
+        return False
+    data = json.dumps([os.path.abspath(path) for path in file_paths], ensure_ascii=False)
+    socket.write(data.encode("utf-8"))
+    socket.waitForBytesWritten(SINGLE_INSTANCE_TIMEOUT_MS)
+    socket.disconnectFromServer()
+    if socket.state() != QLocalSocket.UnconnectedState:
+        socket.waitForDisconnected(SINGLE_INSTANCE_TIMEOUT_MS)
+    return True
+
+class SingleInstanceServer(QObject):
+    """单实例服务：接收后续启动转交的文件列表（JSON），连接断开时发出filesReceived"""
+    filesReceived = pyqtSignal(list)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.accept)
+        self.buffers = {}  # 连接 -> 已收到的数据
+    
+    def listen(self):
+        if self.server.listen(SINGLE_INSTANCE_NAME):
+            return True
+        # 服务名仍有程序在监听（如同时启动的另一个窗口）时不能删除
+        probe = QLocalSocket()
+        probe.connectToServer(SINGLE_INSTANCE_NAME)
+        if probe.waitForConnected(SINGLE_INSTANCE_TIMEOUT_MS):
+            probe.disconnectFromServer()
+            return False
+        # 上次异常退出时残留的服务名
+        QLocalServer.removeServer(SINGLE_INSTANCE_NAME)
+        return self.server.listen(SINGLE_INSTANCE_NAME)
+    
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = b""
+            socket.readyRead.connect(functools.partial(self.read, socket))
+            socket.disconnected.connect(functools.partial(self.finish, socket))
+    
+    def read(self, socket):
+        if socket in self.buffers:
+            self.buffers[socket] += bytes(socket.readAll())
+    
+    def finish(self, socket):
+        data = self.buffers.pop(socket, b"") + bytes(socket.readAll())
+        socket.deleteLater()
+        try:
+            file_paths = json.loads(data.decode("utf-8"))
+        except ValueError:
+            return
+        if isinstance(file_paths, list):
+            self.filesReceived.emit([str(path) for path in file_paths])
+
+class HotFolderWatcher(QObject):
+    """热文件夹：监视目录中的新照片，写入完成后按文件夹配置自动排版并输出到发件箱
+    
+    目录通知(QFileSystemWatcher)用于及时发现新文件，定时轮询作为后备并检查写入是否完成。
+    渲染在有界线程池中进行，处理完的源文件移入“已处理”，失败的移入“失败”。
+    """
+    sheetFinished = pyqtSignal(str, str, float)  # 源文件, 输出文件, 耗时（秒）
+    sheetFailed = pyqtSignal(str, str)  # 源文件, 错误信息
+    
+    DONE_FOLDER = "已处理"
+    FAILED_FOLDER = "失败"
+    
+    def __init__(self, folder, profile, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.profile = profile
+        # 同一文件夹的所有照片共用一张位置表
+        self.layout_info = compute_layout(profile["canvas"], profile["photo"],
+                                          tuple(profile["spacing"]), profile["dpi"])
+        self.pending = {}  # 正在写入的文件 {路径: ((大小, 修改时间), 首次观察时间)}
+        self.queued = []  # 已写完、等待渲染的文件
+        self.active = set()  # 正在渲染的文件
+        self.executor = ThreadPoolExecutor(max_workers=HOT_FOLDER_WORKERS)
+        
+        # 工作线程发出的信号排队回到界面线程处理
+        self.sheetFinished.connect(self.finish_file)
+        self.sheetFailed.connect(self.fail_file)
+        
+        self.watcher = QFileSystemWatcher([folder], self)
+        self.watcher.directoryChanged.connect(self.scan)
+        self.timer = QTimer(self)
+        self.timer.setInterval(HOT_FOLDER_POLL_MS)
+        self.timer.timeout.connect(self.scan)
+        self.timer.start()
+        self.scan()
+    
+    def stop(self):
+        """停止监视，已提交的渲染任务继续完成"""
+        self.timer.stop()
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.executor.shutdown(wait=False)
+    
+    def scan(self):
+        """扫描文件夹，文件大小和修改时间稳定后加入渲染队列"""
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError:
+            return
+        now = time.monotonic()
+        seen = set()
+        for entry in entries:
+            if (entry.name.startswith(".") or not entry.name.lower().endswith(IMAGE_EXTENSIONS)
+                    or not entry.is_file()):
+                continue
+            path = entry.path
+            seen.add(path)
+            if path in self.active or path in self.queued:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)
+            elif stat.st_size > 0 and (now - previous[1]) * 1000 >= HOT_FOLDER_SETTLE_MS:
+                del self.pending[path]
+                self.queued.append(path)
+        # 已被移走的文件不再跟踪
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
+        self.submit()
+    
+    def submit(self):
+        """在工作线程数以内提交渲染任务，其余文件留在队列中"""
+        while self.queued and len(self.active) < HOT_FOLDER_WORKERS:
+            path = self.queued.pop(0)
+            self.active.add(path)
+            future = self.executor.submit(render_hot_folder_file, path, self.profile["outbox"],
+                                          self.profile, self.layout_info)
+            future.add_done_callback(functools.partial(self.render_done, path))
+    
+    def render_done(self, path, future):
+        """渲染结束（在工作线程中调用）"""
+        try:
+            output, elapsed = future.result()
+        except Exception as e:
+            self.sheetFailed.emit(path, str(e))
+        else:
+            self.sheetFinished.emit(path, output, elapsed)
+    
+    def move_source(self, path, subfolder):
+        """将处理过的源文件移入子文件夹，避免重复处理"""
+        target = os.path.join(self.folder, subfolder)
+        try:
+            os.makedirs(target, exist_ok=True)
+            os.replace(path, os.path.join(target, os.path.basename(path)))
+        except OSError:
+            pass
+    
+    def finish_file(self, path, output, elapsed):
+        self.active.discard(path)
+        self.move_source(path, self.DONE_FOLDER)
+        self.submit()
+    
+    def fail_file(self, path, message):
+        self.active.discard(path)
+        self.move_source(path, self.FAILED_FOLDER)
+        self.submit()
+
+class HotFolderDialog(QDialog):
+    """热文件夹设置对话框：每个监视文件夹保存各自的排版配置"""
+    def __init__(self, parent=None, size_manager=None, defaults=None):
+        super().__init__(parent)
+        self.size_manager = size_manager
+        self.setWindowTitle("热文件夹自动排版")
+        self.setMinimumWidth(420)
+        
+        layout = QVBoxLayout(self)
+        form_layout = QFormLayout()
+        
+        self.folder_edit = QLineEdit()
+        self.folder_edit.editingFinished.connect(self.load_profile)
+        folder_btn = QPushButton("浏览...")
+        folder_btn.clicked.connect(self.choose_folder)
+        folder_row = QHBoxLayout()
+        folder_row.addWidget(self.folder_edit)
+        folder_row.addWidget(folder_btn)
+        form_layout.addRow("监视文件夹:", folder_row)
+        
+        self.outbox_edit = QLineEdit()
+        outbox_btn = QPushButton("浏览...")
+        outbox_btn.clicked.connect(self.choose_outbox)
+        outbox_row = QHBoxLayout()
+        outbox_row.addWidget(self.outbox_edit)
+        outbox_row.addWidget(outbox_btn)
+        form_layout.addRow("输出文件夹:", outbox_row)
+        
+        self.photo_combo = QComboBox()
+        for size in self.size_manager.photo_sizes:
+            self.photo_combo.addItem(f"{size['name']}: ({size['width']}cm×{size['height']}cm)", size)
+        form_layout.addRow("照片尺寸:", self.photo_combo)
+        
+        self.canvas_combo = QComboBox()
+        for size in self.size_manager.canvas_sizes:
+            self.canvas_combo.addItem(
+                f"{size['name']}: ({size['width']}cm×{size['height']}cm)", size
+            )
+        form_layout.addRow("画布尺寸:", self.canvas_combo)
+        
+        self.dpi_combo = QComboBox()
+        for dpi in DPI_VALUES:
+            self.dpi_combo.addItem(f"{dpi} DPI", dpi)
+        form_layout.addRow("分辨率:", self.dpi_combo)
+        
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(OUTPUT_FORMATS)
+        form_layout.addRow("输出格式:", self.format_combo)
+        
+        self.h_spacing_edit = QLineEdit()
+        form_layout.addRow("水平间距 (cm):", self.h_spacing_edit)
+        self.v_spacing_edit = QLineEdit()
+        form_layout.addRow("垂直间距 (cm):", self.v_spacing_edit)
+        
+        layout.addLayout(form_layout)
+        
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+        
+        if defaults:
+            self.apply_profile(defaults)
+    
+    def apply_profile(self, profile):
+        """将配置填入表单"""
+        self.outbox_edit.setText(profile.get("outbox", ""))
+        index = self.photo_combo.findText(profile["photo"]["name"] + ":", Qt.MatchStartsWith)
+        if index >= 0:
+            self.photo_combo.setCurrentIndex(index)
+        index = self.canvas_combo.findText(profile["canvas"]["name"] + ":", Qt.MatchStartsWith)
+        if index >= 0:
+            self.canvas_combo.setCurrentIndex(index)
+        self.dpi_combo.setCurrentIndex(max(0, self.dpi_combo.findData(profile["dpi"])))
+        self.format_combo.setCurrentText(profile["format"])
+        self.h_spacing_edit.setText(str(profile["spacing"][0]))
+        self.v_spacing_edit.setText(str(profile["spacing"][1]))
+    
+    def choose_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择监视文件夹")
+        if folder:
+            self.folder_edit.setText(folder)
+            self.load_profile()
+    
+    def choose_outbox(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择输出文件夹")
+        if folder:
+            self.outbox_edit.setText(folder)
+    
+    def load_profile(self):
+        """读取该文件夹上次使用的配置"""
+        profile = self.size_manager.get_folder_profile(self.folder_edit.text())
+        if profile:
+            self.apply_profile(profile)
+    
+    def get_profile(self):
+        """获取(监视文件夹, 配置)，输入无效时返回None"""
+        folder = self.folder_edit.text()
+        outbox = self.outbox_edit.text()
+        try:
+            if not os.path.isdir(folder):
+                raise ValueError("监视文件夹不存在")
+            if not outbox:
+                raise ValueError("请选择输出文件夹")
+            if os.path.abspath(outbox) == os.path.abspath(folder):
+                raise ValueError("输出文件夹不能与监视文件夹相同")
+            spacing = [float(self.h_spacing_edit.text()), float(self.v_spacing_edit.text())]
+            if min(spacing) < 0:
+                raise ValueError("间距不能为负数")
+        except ValueError as e:
+            QMessageBox.warning(self, "输入错误", str(e))
+            return None
+        return folder, {"outbox": outbox,
+                        "photo": self.photo_combo.currentData(),
+                        "canvas": self.canvas_combo.currentData(),
+                        "dpi": self.dpi_combo.currentData(),
+                        "format": self.format_combo.currentText(),
+                        "spacing": spacing}
+
+class EnhancedPhotoLayoutTool(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("专业证件照片排版工具")
+        self.setGeometry(100, 100, 1100, 700)
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #f5f7fa;
+                font-family: 'Segoe UI', Arial, sans-serif;
+            }
+            QGroupBox {
+                border: 1px solid #dcdfe6;
+                border-radius: 8px;
+                margin-top: 1ex;
+                font-weight: bold;
+                padding: 12px;
+                background-color: white;
+            }
+            QGroupBox::title {
+                subcontrol-origin: margin;
+                subcontrol-position: top center;
+                padding: 0 8px;
+                font-size: 13px;
+                color: #409eff;
+            }
+            QLabel {
+                font-size: 12px;
+                color: #606266;
+            }
+            QComboBox, QLineEdit {
+                border: 1px solid #dcdfe6;
+                border-radius: 4px;
+                padding: 6px 10px;
+                font-size: 12px;
+                min-height: 28px;
+                background-color: white;
+            }
+            QComboBox:hover, QLineEdit:hover {
+                border-color: #c0c4cc;
+            }
+            QComboBox:focus, QLineEdit:focus {
+                border: 1px solid #409eff;
+                box-shadow: 0 0 3px rgba(64, 158, 255, 0.3);
+            }
+            QPushButton {
+                background-color: #409eff;
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 10px 16px;
+                font-size: 13px;
+                font-weight: 500;
+                min-height: 36px;
+            }
+            QPushButton:hover {
+                background-color: #66b1ff;
+            }
+            QPushButton:pressed {
+                background-color: #3a8ee6;
+            }
+            QPushButton#actionButton {
+                background-color: #67c23a;
+            }
+            QPushButton#actionButton:hover {
+                background-color: #85ce61;
+            }
+            QRadioButton {
+                font-size: 12px;
                 color: #606266;
                 padding: 4px 0;
             }
@@ -240,9 +2804,42 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         self.photo_size = self.size_manager.get_photo_size(0)  # 默认第一个照片尺寸
         self.canvas_size = self.size_manager.get_canvas_size(0)  # 默认第一个画布尺寸
         self.spacing = (0.5, 0.5)  # 间距 (水平, 垂直) 单位厘米
+        self.page_margin = 0.0  # 画布四周的最小页边距（厘米）
         self.dpi = 300  # 默认DPI
-        self.photo_pixmap = None
+        self.dpi_auto = False  # 是否按源照片分辨率自动选择DPI
+        # 打印机原生分辨率，自动DPI不会超过此值
+        self.printer_dpi = int(self.size_manager.settings.value("printer_dpi", 600))
+        # 已上传的源照片 [{"path", "stamp": 缓存标识, "hash": 内容哈希,
+        #                  "width", "height", "grayscale"}]，解码后的图像保存在image_cache中
+        self.photo_sources = []
+        self.photo_is_grayscale = False  # 源照片是否全部为黑白照片
+        self.assignment_mode = 0  # 0:轮流排列, 1:按人分块, 2:手动指定
         self.orientation_mode = 0  # 0:自动, 1:横向(短边垂直), 2:竖向(短边水平)
+        self.layout_mode = 0  # 0:标准网格, 1:混合旋转, 2:裁切优化
+        self.layout_cache = OrderedDict()  # 排版信息缓存，键为全部排版参数，按最近使用排序
+        # 逐格修改 {单元格序号: {"skip": 留空, "rotate": 旋转180度, "source": 源照片序号}}
+        self.cell_overrides = {}
+        self.override_layout = None  # 逐格修改所对应的排版信息
+        self.override_key = None  # 逐格修改所对应的排版参数
+        self.preview_pixmap = None  # 当前显示的预览图，逐格修改时只重绘受影响的区域
+        self.hot_folder = None  # 正在运行的热文件夹监视
+        self.hot_folder_stats = [0, 0, 0.0]  # 完成张数, 失败张数, 累计耗时（秒）
+        self.drag_state = None  # 拖动中的((水平间距, 垂直间距), 页边距)，松开时才写入设置
+        self.drag_timer = QTimer(self)
+        self.drag_timer.setSingleShot(True)
+        self.drag_timer.setInterval(DRAG_FRAME_INTERVAL_MS)
+        self.drag_timer.timeout.connect(self.render_drag_frame)
+        cache_dir = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+        self.output_cache = OutputCache(os.path.join(cache_dir, "outputs"))
+        self.tile_store = TileStore(os.path.join(cache_dir, "tiles"))
+        # 解码后的源照片和缩放后的照片共用一个内存预算
+        cache_mb = int(self.size_manager.settings.value(
+            "image_cache_mb", IMAGE_CACHE_BYTES // (1024 * 1024)))
+        self.image_cache = ImageCache(cache_mb * 1024 * 1024)
+        self.prefetcher = QueuePrefetcher(self.image_cache, self.tile_store, self)
+        self.unreadable_sources = set()  # 已提示过读取失败的源照片
+        
+        self.setAcceptDrops(True)
         
         # 创建主布局
         main_widget = QWidget()
@@ -303,6 +2900,30 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         
         canvas_layout.addLayout(canvas_hbox)
         
+        # 卷纸模式：定宽不定长，按照片数量排列
+        self.roll_check = QCheckBox("卷纸模式 (定宽不定长)")
+        self.roll_check.toggled.connect(self.update_roll_mode)
+        canvas_layout.addWidget(self.roll_check)
+        self.roll_row = QWidget()
+        roll_hbox = QHBoxLayout(self.roll_row)
+        roll_hbox.setContentsMargins(0, 0, 0, 0)
+        self.roll_combo = QComboBox()
+        self.populate_roll_sizes()
+        self.roll_combo.currentIndexChanged.connect(self.update_preview)
+        roll_hbox.addWidget(self.roll_combo, 5)
+        add_roll_btn = QPushButton("+")
+        add_roll_btn.setMaximumWidth(40)
+        add_roll_btn.setToolTip("添加自定义卷纸宽度")
+        add_roll_btn.clicked.connect(self.add_custom_roll_size)
+        roll_hbox.addWidget(add_roll_btn)
+        self.roll_row.hide()
+        canvas_layout.addWidget(self.roll_row)
+        
+        recommend_btn = QPushButton("推荐最佳画布")
+        recommend_btn.setToolTip("比较所有画布、方向和间距，按可排张数排序")
+        recommend_btn.clicked.connect(self.recommend_canvas)
+        canvas_layout.addWidget(recommend_btn)
+        
         # 纸张方向设置
         orientation_group = QGroupBox("纸张方向")
         orientation_layout = QVBoxLayout(orientation_group)
@@ -322,6 +2943,15 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         orientation_layout.addWidget(self.orientation_horizontal)
         orientation_layout.addWidget(self.orientation_vertical)
         
+        # 排列模式设置
+        layout_mode_group = QGroupBox("排列模式")
+        layout_mode_layout = QVBoxLayout(layout_mode_group)
+        self.layout_mode_combo = QComboBox()
+        self.layout_mode_combo.addItems(["标准网格", "混合旋转 (最多张数)", "裁切优化 (直刀裁切)"])
+        self.layout_mode_combo.setToolTip("混合旋转会用旋转90度的照片填充剩余空白")
+        self.layout_mode_combo.currentIndexChanged.connect(self.update_layout_mode)
+        layout_mode_layout.addWidget(self.layout_mode_combo)
+        
         # 照片间距设置
         spacing_group = QGroupBox("照片间距设置")
         spacing_layout = QVBoxLayout(spacing_group)
@@ -340,17 +2970,89 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         self.v_spacing_edit.textChanged.connect(self.update_spacing)
         spacing_form.addWidget(self.v_spacing_edit, 1, 1)
         
+        spacing_form.addWidget(QLabel("页边距 (cm):"), 2, 0)
+        self.margin_edit = QLineEdit("0")
+        self.margin_edit.setToolTip("也可在网格排版的预览中直接拖动照片间隙和四周边距")
+        self.margin_edit.textChanged.connect(self.update_spacing)
+        spacing_form.addWidget(self.margin_edit, 2, 1)
+        
         spacing_layout.addLayout(spacing_form)
         
         # 上传照片
         upload_group = QGroupBox("上传证件照片")
         upload_layout = QVBoxLayout(upload_group)
-        self.upload_btn = QPushButton("选择照片文件")
-        self.upload_btn.clicked.connect(self.upload_photo)
-        self.upload_label = QLabel("未选择文件")
-        self.upload_label.setStyleSheet("font-size: 11px; color: #909399; margin-top: 5px;")
-        upload_layout.addWidget(self.upload_btn)
-        upload_layout.addWidget(self.upload_label)
+        gallery_buttons = QHBoxLayout()
+        add_files_btn = QPushButton("添加照片")
+        add_files_btn.clicked.connect(self.upload_photo)
+        add_folder_btn = QPushButton("添加文件夹")
+        add_folder_btn.clicked.connect(self.add_photo_folder)
+        clear_gallery_btn = QPushButton("清空")
+        clear_gallery_btn.clicked.connect(self.clear_gallery)
+        gallery_buttons.addWidget(add_files_btn)
+        gallery_buttons.addWidget(add_folder_btn)
+        gallery_buttons.addWidget(clear_gallery_btn)
+        upload_layout.addLayout(gallery_buttons)
+        
+        # 照片库：只为可见的照片加载缩略图，可容纳数百张照片
+        self.gallery_model = PhotoGalleryModel(self.tile_store, self)
+        self.gallery_view = QListView()
+        self.gallery_view.setModel(self.gallery_model)
+        self.gallery_view.setViewMode(QListView.IconMode)
+        self.gallery_view.setMovement(QListView.Static)
+        self.gallery_view.setResizeMode(QListView.Adjust)
+        self.gallery_view.setUniformItemSizes(True)
+        self.gallery_view.setLayoutMode(QListView.Batched)
+        size = PhotoGalleryModel.THUMBNAIL_SIZE
+        self.gallery_view.setIconSize(QSize(size, size))
+        self.gallery_view.setGridSize(QSize(size + 16, size + 34))
+        self.gallery_view.setSelectionMode(QListView.ExtendedSelection)
+        # 拖放由主窗口统一处理
+        self.gallery_view.setDragEnabled(False)
+        self.gallery_view.setAcceptDrops(False)
+        self.gallery_view.setMinimumHeight(200)
+        self.gallery_view.selectionModel().selectionChanged.connect(self.gallery_selection_changed)
+        upload_layout.addWidget(self.gallery_view)
+        
+        self.gallery_label = QLabel("拖入照片或文件夹；选中多张可排在同一张画布上")
+        self.gallery_label.setStyleSheet("font-size: 11px; color: #909399; margin-top: 5px;")
+        self.gallery_label.setWordWrap(True)
+        upload_layout.addWidget(self.gallery_label)
+        
+        # 排队模式：逐位顾客处理照片库中的照片，后续照片在后台预先处理
+        queue_layout = QHBoxLayout()
+        self.queue_check = QCheckBox("排队模式")
+        self.queue_check.setToolTip("后台预先解码、缩放并合成当前照片之后的几张照片，"
+                                    "切换到下一位时无需等待")
+        self.queue_check.toggled.connect(self.toggle_queue_mode)
+        queue_layout.addWidget(self.queue_check)
+        self.queue_spin = QSpinBox()
+        self.queue_spin.setRange(1, 10)
+        self.queue_spin.setValue(QUEUE_PREFETCH_COUNT)
+        self.queue_spin.setPrefix("预处理 ")
+        self.queue_spin.setSuffix(" 张")
+        self.queue_spin.valueChanged.connect(self.queue_prefetch)
+        queue_layout.addWidget(self.queue_spin)
+        self.next_btn = QPushButton("下一位")
+        self.next_btn.setShortcut("Ctrl+Right")
+        self.next_btn.setToolTip("选中照片库中的下一张照片 (Ctrl+→)")
+        self.next_btn.setEnabled(False)
+        self.next_btn.clicked.connect(self.advance_queue)
+        queue_layout.addWidget(self.next_btn)
+        upload_layout.addLayout(queue_layout)
+        
+        # 多张照片时的分配方式
+        assignment_form = QFormLayout()
+        self.assignment_combo = QComboBox()
+        self.assignment_combo.addItems(["轮流排列", "按人分块", "手动指定"])
+        self.assignment_combo.currentIndexChanged.connect(self.update_assignment_mode)
+        assignment_form.addRow("多人分配:", self.assignment_combo)
+        self.assignment_edit = QLineEdit()
+        self.assignment_edit.setPlaceholderText("例如: 1,1,2,2,3,0")
+        self.assignment_edit.setToolTip("按位置顺序填写照片序号，逗号分隔，0表示留空；未填写的位置轮流排列")
+        self.assignment_edit.textChanged.connect(self.update_preview)
+        self.assignment_edit.hide()
+        assignment_form.addRow(self.assignment_edit)
+        upload_layout.addLayout(assignment_form)
         
         # 保存设置
         save_group = QGroupBox("输出设置")
@@ -362,16 +3064,45 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         
         save_form.addWidget(QLabel("DPI (打印质量):"), 0, 0)
         self.dpi_combo = QComboBox()
-        self.dpi_combo.addItems(["150 (普通)", "300 (标准)", "600 (高质量)", "1200 (超高质量)"])
+        self.dpi_combo.addItems(["150 (普通)", "300 (标准)", "600 (高质量)", "1200 (超高质量)",
+                                 "自动 (按源照片分辨率)"])
         self.dpi_combo.setCurrentIndex(1)
         self.dpi_combo.currentIndexChanged.connect(self.update_dpi)
         save_form.addWidget(self.dpi_combo, 0, 1)
         
+        save_form.addWidget(QLabel("打印机分辨率:"), 3, 0)
+        self.printer_dpi_combo = QComboBox()
+        for dpi in DPI_VALUES:
+            self.printer_dpi_combo.addItem(f"{dpi} DPI", dpi)
+        self.printer_dpi_combo.setCurrentIndex(max(0, self.printer_dpi_combo.findData(self.printer_dpi)))
+        self.printer_dpi_combo.currentIndexChanged.connect(self.update_printer_dpi)
+        save_form.addWidget(self.printer_dpi_combo, 3, 1)
+        
         save_form.addWidget(QLabel("保存格式:"), 1, 0)
         self.format_combo = QComboBox()
         self.format_combo.addItems(["PNG (推荐)", "JPG", "BMP", "TIFF"])
         save_form.addWidget(self.format_combo, 1, 1)
         
+        save_form.addWidget(QLabel("色彩模式:"), 2, 0)
+        self.color_combo = QComboBox()
+        self.color_combo.addItems(["自动 (按源照片)", "彩色", "黑白"])
+        self.color_combo.currentIndexChanged.connect(self.update_preview)
+        save_form.addWidget(self.color_combo, 2, 1)
+        
+        save_form.addWidget(QLabel("JPG目标大小 (KB):"), 4, 0)
+        self.jpeg_budget_edit = QLineEdit()
+        self.jpeg_budget_edit.setPlaceholderText("不限 (最高质量)")
+        self.jpeg_budget_edit.setToolTip("保存JPG时自动调整质量，使文件不超过该大小")
+        save_form.addWidget(self.jpeg_budget_edit, 4, 1)
+        
+        save_form.addWidget(QLabel("照片数量 (张):"), 5, 0)
+        self.copies_spin = QSpinBox()
+        self.copies_spin.setRange(0, 9999)
+        self.copies_spin.setSpecialValueText("整版")
+        self.copies_spin.setToolTip("按数量自动分页，最后一页可改用更小的画布")
+        self.copies_spin.valueChanged.connect(self.update_preview)
+        save_form.addWidget(self.copies_spin, 5, 1)
+        
         save_layout.addLayout(save_form)
         
         # 生成按钮
@@ -379,16 +3110,41 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         generate_btn.setObjectName("actionButton")
         generate_btn.clicked.connect(self.generate_layout)
         
+        multi_export_btn = QPushButton("多分辨率导出 (样张+冲印)")
+        multi_export_btn.clicked.connect(self.export_multi_resolution)
+        
+        order_btn = QPushButton("多尺寸订单拼版")
+        order_btn.clicked.connect(self.export_order_sheets)
+        
+        poster_btn = QPushButton("海报分页打印")
+        poster_btn.clicked.connect(self.export_poster)
+        
+        print_btn = QPushButton("直接打印")
+        print_btn.clicked.connect(self.print_layout)
+        
+        self.hot_folder_btn = QPushButton("热文件夹自动排版")
+        self.hot_folder_btn.clicked.connect(self.toggle_hot_folder)
+        self.hot_folder_label = QLabel()
+        self.hot_folder_label.setWordWrap(True)
+        self.hot_folder_label.hide()
+        
         # 添加到左侧布局
         control_layout.addWidget(title_label)
         control_layout.addWidget(subtitle_label)
         control_layout.addWidget(photo_size_group)
         control_layout.addWidget(canvas_size_group)
         control_layout.addWidget(orientation_group)
+        control_layout.addWidget(layout_mode_group)
         control_layout.addWidget(spacing_group)
         control_layout.addWidget(upload_group)
         control_layout.addWidget(save_group)
         control_layout.addWidget(generate_btn)
+        control_layout.addWidget(multi_export_btn)
+        control_layout.addWidget(order_btn)
+        control_layout.addWidget(poster_btn)
+        control_layout.addWidget(print_btn)
+        control_layout.addWidget(self.hot_folder_btn)
+        control_layout.addWidget(self.hot_folder_label)
         control_layout.addStretch(1)  # 添加弹性空间
         
         # 设置滚动区域的内容
@@ -403,7 +3159,11 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         preview_title = QLabel("排版预览")
         preview_title.setStyleSheet("font-size: 18px; font-weight: bold; color: #303133;")
         
-        self.preview_area = QLabel()
+        self.preview_area = PreviewCanvas()
+        self.preview_area.setToolTip("单击照片位置可留空、旋转或更换照片")
+        self.preview_area.cellClicked.connect(self.edit_cell)
+        self.preview_area.dragMoved.connect(self.drag_layout)
+        self.preview_area.dragFinished.connect(self.finish_drag)
         self.preview_area.setObjectName("previewArea")
         self.preview_area.setAlignment(Qt.AlignCenter)
         self.preview_area.setMinimumSize(650, 550)
@@ -434,9 +3194,53 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         stats_layout.addWidget(self.stats_label3)
         stats_layout.addWidget(self.stats_label4)
         
+        # 源照片分辨率不足提示，仅在需要时显示
+        self.stats_warning_label = QLabel()
+        self.stats_warning_label.setObjectName("statsLabel")
+        self.stats_warning_label.setAlignment(Qt.AlignCenter)
+        self.stats_warning_label.setStyleSheet("color: #f56c6c;")
+        self.stats_warning_label.hide()
+        stats_layout.addWidget(self.stats_warning_label)
+        
+        # 图像缓存统计：命中、未命中和内存占用，内存预算可调
+        cache_area = QWidget()
+        cache_layout = QHBoxLayout(cache_area)
+        cache_layout.setContentsMargins(10, 0, 10, 0)
+        self.cache_stats_label = QLabel()
+        self.cache_stats_label.setObjectName("statsLabel")
+        cache_layout.addWidget(self.cache_stats_label, 1)
+        cache_layout.addWidget(QLabel("内存预算:"))
+        self.cache_budget_spin = QSpinBox()
+        self.cache_budget_spin.setRange(64, 65536)
+        self.cache_budget_spin.setSingleStep(64)
+        self.cache_budget_spin.setSuffix(" MB")
+        self.cache_budget_spin.setValue(cache_mb)
+        self.cache_budget_spin.valueChanged.connect(self.update_cache_budget)
+        cache_layout.addWidget(self.cache_budget_spin)
+        self.cache_stats_timer = QTimer(self)
+        self.cache_stats_timer.setInterval(1000)
+        self.cache_stats_timer.timeout.connect(self.update_cache_stats)
+        self.cache_stats_timer.start()
+        self.update_cache_stats()
+        
+        # 多页作业缩略图条，只渲染可见的页面
+        self.page_model = PageThumbnailModel(self.render_page_thumbnail, self)
+        self.page_strip = QListView()
+        self.page_strip.setModel(self.page_model)
+        self.page_strip.setFlow(QListView.LeftToRight)
+        self.page_strip.setWrapping(False)
+        self.page_strip.setUniformItemSizes(True)
+        self.page_strip.setViewMode(QListView.IconMode)
+        self.page_strip.setIconSize(QSize(PageThumbnailModel.THUMBNAIL_HEIGHT,
+                                          PageThumbnailModel.THUMBNAIL_HEIGHT))
+        self.page_strip.setFixedHeight(PageThumbnailModel.THUMBNAIL_HEIGHT + 40)
+        self.page_strip.hide()
+        
         preview_layout.addWidget(preview_title)
         preview_layout.addWidget(self.preview_area, 1)
+        preview_layout.addWidget(self.page_strip)
         preview_layout.addWidget(self.stats_area)
+        preview_layout.addWidget(cache_area)
         
         # 添加到主布局
         main_layout.addWidget(scroll_area)  # 使用滚动区域替代原控制面板
@@ -467,6 +3271,12 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         # 添加自定义选项
         self.canvas_size_combo.addItem("添加自定义尺寸...", None)
     
+    def populate_roll_sizes(self):
+        """填充卷纸宽度选项"""
+        self.roll_combo.clear()
+        for size in self.size_manager.roll_sizes:
+            self.roll_combo.addItem(f"{size['name']} (宽{size['width']}cm)", size)
+    
     def update_photo_size(self, index):
         """更新证件照片尺寸"""
         size_data = self.photo_size_combo.itemData(index)
@@ -517,167 +3327,613 @@ class EnhancedPhotoLayoutTool(QMainWindow):
                         self.canvas_size_combo.setCurrentIndex(i)
                         break
     
-    def update_orientation(self, button):
-        """更新纸张方向"""
-        self.orientation_mode = self.orientation_group.id(button)
+    def add_custom_roll_size(self):
+        """添加自定义卷纸宽度"""
+        dialog = SizeEditorDialog(self, "卷纸", self.size_manager)
+        if dialog.exec_() == QDialog.Accepted:
+            name, width, _ = dialog.get_size()
+            if name and width:
+                self.size_manager.add_roll_size(name, width)
+                # 暂停信号，重新填充后只在选中新宽度时更新一次预览
+                self.roll_combo.blockSignals(True)
+                self.populate_roll_sizes()
+                self.roll_combo.blockSignals(False)
+                self.roll_combo.setCurrentIndex(self.roll_combo.count() - 1)
+    
+    def recommend_canvas(self):
+        """为当前照片尺寸推荐画布、方向和间距"""
+        spacings = [self.spacing] + [(s, s) for s in RECOMMEND_SPACINGS if (s, s) != self.spacing]
+        results = recommend_canvases(self.photo_size, self.size_manager.canvas_sizes, spacings,
+                                     self.page_margin, self.layout_mode)
+        dialog = CanvasRecommendDialog(self, results)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        result = dialog.selected_result()
+        if result is None:
+            return
+        
+        # 应用推荐的画布、方向和间距
+        index = self.canvas_size_combo.findData(result["canvas"])
+        if index >= 0:
+            self.canvas_size_combo.setCurrentIndex(index)
+        canvas_w, canvas_h = result["canvas"]["width"], result["canvas"]["height"]
+        if result["rotated"]:
+            canvas_w, canvas_h = canvas_h, canvas_w
+        if canvas_w >= canvas_h:
+            self.orientation_horizontal.setChecked(True)
+            self.orientation_mode = 1
+        else:
+            self.orientation_vertical.setChecked(True)
+            self.orientation_mode = 2
+        # 暂停信号，两个间距都设置好后只更新一次预览
+        for edit, value in ((self.h_spacing_edit, result["spacing"][0]),
+                            (self.v_spacing_edit, result["spacing"][1])):
+            edit.blockSignals(True)
+            edit.setText(str(value))
+            edit.blockSignals(False)
+        self.update_spacing()
+    
+    def update_orientation(self, button):
+        """更新纸张方向"""
+        self.orientation_mode = self.orientation_group.id(button)
+        self.update_preview()
+    
+    def update_layout_mode(self, index):
+        """更新排列模式"""
+        self.layout_mode = index
+        self.update_preview()
+    
+    def update_roll_mode(self, checked):
+        """切换卷纸模式"""
+        self.roll_row.setVisible(checked)
+        self.update_preview()
+    
+    def plan_roll(self):
+        """计算当前卷纸排列，未设置数量时排满一整行"""
+        roll = self.roll_combo.currentData()
+        return plan_roll_layout(roll["width"], self.photo_size["width"],
+                                self.photo_size["height"], self.spacing,
+                                self.copies_spin.value(), self.page_margin)
+    
+    def roll_bands(self, plan, dpi, image_format):
+        """逐行生成卷纸条带图像，每次只分配一行照片的高度"""
+        count = plan["count"]
+        cols, rows = plan["cols"], plan["rows"]
+        photo_w = self.cm_to_pixels(plan["photo_w"], dpi)
+        photo_h = self.cm_to_pixels(plan["photo_h"], dpi)
+        width = self.cm_to_pixels(self.roll_combo.currentData()["width"], dpi)
+        length = self.cm_to_pixels(plan["length"], dpi)
+        pitch_h = plan["photo_h"] + self.spacing[1]
+        margin_y = plan["margin_y"]
+        sources = self.cell_sources(count)
+        for row in range(rows):
+            # 条带上下边界按厘米位置换算，误差不会沿卷纸累积；首尾条带包含页边距
+            top = 0 if row == 0 else self.cm_to_pixels(margin_y + row * pitch_h, dpi)
+            if row == rows - 1:
+                bottom = length
+            else:
+                bottom = self.cm_to_pixels(margin_y + (row + 1) * pitch_h, dpi)
+            y = self.cm_to_pixels(margin_y + row * pitch_h, dpi) - top
+            band = QImage(width, bottom - top, image_format)
+            band.fill(Qt.white)
+            painter = QPainter(band)
+            for col in range(min(cols, count - row * cols)):
+                source = sources[row * cols + col]
+                if source < 0:
+                    continue
+                x = self.cm_to_pixels(plan["margin_x"] + col * (plan["photo_w"] + self.spacing[0]), dpi)
+                painter.drawImage(x, y, self.get_photo_tile(
+                    photo_w, photo_h, plan["rotated"], image_format, source, dpi == self.dpi
+                ))
+            painter.end()
+            yield band
+    
+    def update_roll_preview(self):
+        """卷纸模式预览：按显示区域高度降低分辨率渲染整卷"""
+        plan = self.plan_roll()
+        if plan is None:
+            self.preview_area.setText("卷纸宽度不足以放下一张照片")
+            return
+        preview_h = max(1, self.preview_area.height())
+        dpi = max(10, int(preview_h / (plan["length"] / 2.54)))
+        width = self.cm_to_pixels(self.roll_combo.currentData()["width"], dpi)
+        preview_img = QImage(max(1, width), max(1, self.cm_to_pixels(plan["length"], dpi)),
+                             QImage.Format_RGB888)
+        preview_img.fill(QColor(235, 238, 245))
+        painter = QPainter(preview_img)
+        y = 0
+        if self.photo_sources:
+            for band in self.roll_bands(plan, dpi, self.choose_image_format()):
+                painter.drawImage(0, y, band)
+                y += band.height()
+        painter.setPen(QPen(QColor(180, 190, 210), 1, Qt.DashLine))
+        painter.drawRect(0, 0, preview_img.width() - 1, preview_img.height() - 1)
+        painter.end()
+        self.preview_area.set_canvas(QPixmap.fromImage(preview_img).scaled(
+            self.preview_area.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
+        ))
+        self.page_strip.hide()
+        
+        roll = self.roll_combo.currentData()
+        self.stats_label2.setText(f"卷纸: 宽{roll['width']}cm × 长{plan['length']:.1f}cm")
+        self.stats_label3.setText(
+            f"排列: {plan['rows']}行 × {plan['cols']}列，共{plan['count']}张"
+        )
+        self.stats_label4.setText(f"照片方向: {'旋转90°' if plan['rotated'] else '正向'}")
+    
+    def export_roll(self):
+        """卷纸模式输出：逐条带写入PNG文件或发送到打印机，不分配整卷图像"""
+        plan = self.plan_roll()
+        if plan is None:
+            QMessageBox.warning(self, "警告", "卷纸宽度不足以放下一张照片！")
+            return
+        if self.dpi_auto:
+            self.dpi = self.choose_auto_dpi()
+        roll = self.roll_combo.currentData()
+        width = self.cm_to_pixels(roll["width"], self.dpi)
+        length = self.cm_to_pixels(plan["length"], self.dpi)
+        image_format = self.choose_image_format()
+        
+        box = QMessageBox(self)
+        box.setWindowTitle("卷纸输出")
+        box.setText(f"卷纸长度 {plan['length']:.1f}cm，共{plan['count']}张照片")
+        save_btn = box.addButton("保存PNG文件", QMessageBox.AcceptRole)
+        print_btn = box.addButton("发送到打印机", QMessageBox.AcceptRole)
+        box.addButton(QMessageBox.Cancel)
+        box.exec_()
+        
+        if box.clickedButton() == save_btn:
+            file_path, _ = QFileDialog.getSaveFileName(
+                self, "保存卷纸排版", "卷纸排版.png", "PNG文件 (*.png)"
+            )
+            if not file_path:
+                return
+            write_png_stream(file_path, width, length, self.dpi,
+                             image_format == QImage.Format_Grayscale8,
+                             self.roll_bands(plan, self.dpi, image_format))
+            QMessageBox.information(self, "成功", f"卷纸排版已保存至:\n{file_path}")
+        elif box.clickedButton() == print_btn:
+            printer = QPrinter(QPrinter.HighResolution)
+            printer.setResolution(self.dpi)
+            printer.setFullPage(True)
+            printer.setPageSize(QPageSize(QSizeF(roll["width"] * 10, plan["length"] * 10),
+                                          QPageSize.Millimeter, "卷纸"))
+            if QPrintDialog(printer, self).exec_() != QDialog.Accepted:
+                return
+            painter = begin_print(printer, self.dpi)
+            y = 0
+            for band in self.roll_bands(plan, self.dpi, image_format):
+                painter.drawImage(0, y, band)
+                y += band.height()
+            painter.end()
+    
+    def update_spacing(self):
+        """更新照片间距和页边距"""
+        try:
+            h_spacing = float(self.h_spacing_edit.text())
+            v_spacing = float(self.v_spacing_edit.text())
+            margin = float(self.margin_edit.text() or 0)
+            if h_spacing >= 0 and v_spacing >= 0 and margin >= 0:
+                self.spacing = (h_spacing, v_spacing)
+                self.page_margin = margin
+                self.update_preview()
+        except ValueError:
+            pass
+    
+    def update_dpi(self, index):
+        """更新DPI设置"""
+        # 最后一项为自动DPI，实际值在计算排版时按源照片确定
+        self.dpi_auto = index >= len(DPI_VALUES)
+        if not self.dpi_auto:
+            self.dpi = DPI_VALUES[index]
+        self.update_preview()
+    
+    def update_printer_dpi(self, index):
+        """更新打印机原生分辨率"""
+        self.printer_dpi = self.printer_dpi_combo.itemData(index)
+        self.size_manager.settings.setValue("printer_dpi", self.printer_dpi)
+        self.update_preview()
+    
+    def source_effective_ppi(self):
+        """计算每张源照片在所选照片尺寸下的有效分辨率[(水平, 垂直)]"""
+        photo_in_w = self.photo_size["width"] / 2.54
+        photo_in_h = self.photo_size["height"] / 2.54
+        return [(source["width"] / photo_in_w,
+                 source["height"] / photo_in_h)
+                for source in self.photo_sources]
+    
+    def choose_auto_dpi(self):
+        """选择能保留源照片全部细节的最低标准DPI，不超过打印机原生分辨率"""
+        ppis = self.source_effective_ppi()
+        if not ppis:
+            return min(300, self.printer_dpi)
+        needed = max(max(ppi) for ppi in ppis)
+        for dpi in DPI_VALUES:
+            if dpi >= needed or dpi >= self.printer_dpi:
+                return min(dpi, self.printer_dpi)
+        return min(DPI_VALUES[-1], self.printer_dpi)
+    
+    def upload_photo(self):
+        """添加证件照片到照片库（可多选）并选中"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "选择证件照片", "", "图片文件 (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)"
+        )
+        if file_paths:
+            self.gallery_model.add_paths(file_paths)
+            self.select_gallery_paths(file_paths)
+    
+    def add_photo_folder(self):
+        """将文件夹中的照片添加到照片库"""
+        folder = QFileDialog.getExistingDirectory(self, "选择照片文件夹")
+        if folder:
+            self.gallery_model.add_folder(folder)
+    
+    def clear_gallery(self):
+        self.gallery_model.clear()
+        self.set_photo_sources([])
+    
+    def select_gallery_paths(self, file_paths):
+        """在照片库中选中指定照片（只触发一次选择变化）"""
+        selection = QItemSelection()
+        for path in file_paths:
+            row = self.gallery_model.rows.get(path)
+            if row is not None:
+                index = self.gallery_model.index(row)
+                selection.select(index, index)
+        self.gallery_view.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        if not selection.isEmpty():
+            self.gallery_view.scrollTo(selection.indexes()[0])
+    
+    def gallery_selection_changed(self, selected=None, deselected=None):
+        """选中的照片按照片库顺序作为源照片"""
+        rows = sorted(index.row() for index in self.gallery_view.selectionModel().selectedIndexes())
+        self.set_photo_sources([self.gallery_model.paths[row] for row in rows])
+    
+    def toggle_queue_mode(self, checked):
+        """开启或关闭排队模式"""
+        self.next_btn.setEnabled(checked)
+        self.queue_prefetch()
+    
+    def advance_queue(self):
+        """选中当前照片之后的下一张照片"""
+        rows = [index.row() for index in self.gallery_view.selectionModel().selectedIndexes()]
+        row = max(rows) + 1 if rows else 0
+        if row < len(self.gallery_model.paths):
+            self.select_gallery_paths([self.gallery_model.paths[row]])
+    
+    def queue_prefetch(self):
+        """排队模式下在后台预处理照片库中当前照片之后的几张照片"""
+        if not self.queue_check.isChecked() or self.roll_check.isChecked():
+            self.prefetcher.clear()
+            return
+        rows = [index.row() for index in self.gallery_view.selectionModel().selectedIndexes()]
+        start = max(rows) + 1 if rows else 0
+        self.prefetcher.request(
+            self.gallery_model.paths[start:start + self.queue_spin.value()],
+            self.calculate_layout(), self.color_combo.currentIndex()
+        )
+    
+    def use_prefetched(self, layout_info):
+        """切换到已预处理的照片时，把预先合成的整版交给输出缓存，导出时无需再合成"""
+        if len(self.photo_sources) != 1:
+            return
+        photo = self.photo_sources[0]
+        entry = self.prefetcher.take(photo["path"])
+        if entry is None or entry["sheet"] is None:
+            return
+        image_format = self.choose_image_format()
+        # 照片已改动、排版或格式不同，或有逐格修改时，预先合成的整版不可用
+        if (entry["stamp"] != photo["stamp"]
+                or entry["layout"]['layout_key'] != layout_info['layout_key']
+                or entry["image_format"] != image_format or self.cell_overrides):
+            return
+        self.output_cache.put_sheet(self.sheet_cache_key(layout_info, image_format),
+                                    entry["sheet"])
+    
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+    
+    def dropEvent(self, event):
+        """拖入照片或文件夹"""
+        self.add_gallery_items([url.toLocalFile() for url in event.mimeData().urls()])
+        event.acceptProposedAction()
+    
+    def add_gallery_items(self, paths):
+        """加入照片或文件夹：照片立即加入并选中，文件夹在后台扫描"""
+        file_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.gallery_model.add_folder(path)
+            elif path.lower().endswith(IMAGE_EXTENSIONS):
+                file_paths.append(path)
+        if file_paths:
+            self.gallery_model.add_paths(file_paths)
+            self.select_gallery_paths(file_paths)
+    
+    def open_files(self, paths):
+        """打开启动参数或后续启动转交的文件，并把窗口带到前台"""
+        self.add_gallery_items(paths)
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+    
+    def set_photo_sources(self, file_paths):
+        """加载源照片，只读取照片信息；磁盘缓存中已有时不读取文件，照片在绘制时才按所需尺寸解码"""
+        sources = []
+        for file_path in file_paths:
+            try:
+                stamp = TileStore.stamp(file_path)
+            except OSError:
+                continue
+            info = self.tile_store.get_info(stamp)
+            if info is None:
+                try:
+                    with open(file_path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                # 上传时检测一次是否为黑白照片，避免每次生成都扫描像素
+                info = photo_info(data)
+                if info is None:
+                    continue
+                self.tile_store.put_info(stamp, info)
+            sources.append(dict(info, path=file_path, stamp=stamp))
+        self.photo_sources = sources
+        if sources:
+            self.gallery_label.setText(
+                f"已选择 {len(sources)} 张照片，照片库共 {len(self.gallery_model.paths)} 张"
+            )
+        else:
+            self.gallery_label.setText("拖入照片或文件夹；选中多张可排在同一张画布上")
+        self.photo_is_grayscale = bool(sources) and all(
+            source["grayscale"] for source in sources
+        )
         self.update_preview()
     
-    def update_spacing(self):
-        """更新照片间距"""
-        try:
-            h_spacing = float(self.h_spacing_edit.text())
-            v_spacing = float(self.v_spacing_edit.text())
-            if h_spacing >= 0 and v_spacing >= 0:
-                self.spacing = (h_spacing, v_spacing)
-                self.update_preview()
-        except ValueError:
-            pass
+    def source_image(self, source, width=None, height=None):
+        """返回解码后的源照片，分辨率只需覆盖width×height（未指定时为原始尺寸）
+        
+        内存缓存中已有足够大的解码结果时直接使用，否则按所需尺寸重新解码，
+        JPEG等格式可在解码时直接缩小，不必先解码完整的原图。
+        读取失败时返回None且不缓存，下次使用时重试。
+        """
+        photo = self.photo_sources[source]
+        key = ("source", photo["stamp"])
+        full_w, full_h = photo["width"], photo["height"]
+        target_w, target_h = full_w, full_h
+        if width is not None:
+            target_w, target_h = decode_size(full_w, full_h, width, height)
+        image = self.image_cache.get(key)
+        if image is not None and image.width() >= target_w and image.height() >= target_h:
+            return image
+        reader = open_image_reader(photo["path"])
+        if (target_w, target_h) != (full_w, full_h):
+            set_scaled_size(reader, target_w, target_h)
+        image = reader.read()
+        if image.isNull():
+            # 同一照片只提示一次；在绘制结束后再弹出提示
+            if photo["stamp"] not in self.unreadable_sources:
+                self.unreadable_sources.add(photo["stamp"])
+                message = f"无法读取照片:\n{photo['path']}\n{reader.errorString()}"
+                QTimer.singleShot(0, lambda: QMessageBox.warning(self, "错误", message))
+            return None
+        self.unreadable_sources.discard(photo["stamp"])
+        self.image_cache.put(key, image)
+        return image
     
-    def update_dpi(self, index):
-        """更新DPI设置"""
-        dpi_values = [150, 300, 600, 1200]
-        self.dpi = dpi_values[index]
-        self.update_preview()
+    def source_cache_keys(self):
+        """当前源照片在图像缓存中的键，导出期间固定这些键"""
+        return [("source", photo["stamp"]) for photo in self.photo_sources]
     
-    def upload_photo(self):
-        """上传证件照片"""
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "选择证件照片", "", "图片文件 (*.png *.jpg *.jpeg *.bmp)"
+    def update_cache_budget(self, value):
+        """修改图像缓存的内存预算（MB）"""
+        self.image_cache.set_budget(value * 1024 * 1024)
+        self.size_manager.settings.setValue("image_cache_mb", value)
+        self.update_cache_stats()
+    
+    def update_cache_stats(self):
+        """刷新图像缓存统计"""
+        cache = self.image_cache
+        mb = 1024 * 1024
+        self.cache_stats_label.setText(
+            f"图像缓存: 命中 {cache.hits} | 未命中 {cache.misses} | "
+            f"{len(cache.entries)} 张 {cache.bytes / mb:.1f}/{cache.max_bytes // mb} MB | "
+            f"固定 {cache.pinned_bytes() / mb:.1f} MB | 淘汰 {cache.evictions}"
         )
-        if file_path:
-            self.upload_label.setText(os.path.basename(file_path))
-            self.photo_pixmap = QPixmap(file_path)
-            self.update_preview()
     
-    def cm_to_pixels(self, cm, dpi):
-        """将厘米转换为像素"""
-        inches = cm / 2.54
-        return int(inches * dpi)
-    
-    def calculate_layout(self):
-        """计算最佳排版布局（考虑方向优化）"""
-        # 获取物理尺寸
-        canvas_phys_w = self.canvas_size["width"]
-        canvas_phys_h = self.canvas_size["height"]
-        photo_w = self.photo_size["width"]
-        photo_h = self.photo_size["height"]
-        
-        # 自动方向选择：计算两种方向下的照片数量
-        if self.orientation_mode == 0:  # 自动
-            # 方向1：自然方向
-            cols1, rows1 = self.calculate_rows_cols(
-                canvas_phys_w, canvas_phys_h, 
-                photo_w, photo_h
-            )
-            count1 = cols1 * rows1
-            
-            # 方向2：旋转90度方向
-            cols2, rows2 = self.calculate_rows_cols(
-                canvas_phys_h, canvas_phys_w, 
-                photo_w, photo_h
-            )
-            count2 = cols2 * rows2
-            
-            # 选择能容纳更多照片的方向
-            if count1 >= count2:
-                # 使用自然方向
-                canvas_w_used, canvas_h_used = canvas_phys_w, canvas_phys_h
-                cols, rows = cols1, rows1
-                # 确定方向标签（宽边水平为横向，宽边垂直为竖向）
-                orientation = "横向" if canvas_phys_w >= canvas_phys_h else "竖向"
-            else:
-                # 使用旋转方向
-                canvas_w_used, canvas_h_used = canvas_phys_h, canvas_phys_w
-                cols, rows = cols2, rows2
-                # 确定方向标签（宽边水平为横向，宽边垂直为竖向）
-                orientation = "横向" if canvas_phys_h >= canvas_phys_w else "竖向"
-        elif self.orientation_mode == 1:  # 横向 (短边垂直)
-            # 确保宽边水平放置（短边垂直）
-            if canvas_phys_w >= canvas_phys_h:
-                canvas_w_used, canvas_h_used = canvas_phys_w, canvas_phys_h
-            else:
-                canvas_w_used, canvas_h_used = canvas_phys_h, canvas_phys_w
-            cols, rows = self.calculate_rows_cols(
-                canvas_w_used, canvas_h_used, 
-                photo_w, photo_h
-            )
-            orientation = "横向"
-        else:  # 竖向 (短边水平)
-            # 确保宽边垂直放置（短边水平）
-            if canvas_phys_h >= canvas_phys_w:
-                canvas_w_used, canvas_h_used = canvas_phys_w, canvas_phys_h
-            else:
-                canvas_w_used, canvas_h_used = canvas_phys_h, canvas_phys_w
-            cols, rows = self.calculate_rows_cols(
-                canvas_w_used, canvas_h_used, 
-                photo_w, photo_h
-            )
-            orientation = "竖向"
-        
-        # 转换为像素
-        photo_px_w = self.cm_to_pixels(photo_w, self.dpi)
-        photo_px_h = self.cm_to_pixels(photo_h, self.dpi)
-        canvas_px_w = self.cm_to_pixels(canvas_w_used, self.dpi)
-        canvas_px_h = self.cm_to_pixels(canvas_h_used, self.dpi)
-        spacing_px_w = self.cm_to_pixels(self.spacing[0], self.dpi)
-        spacing_px_h = self.cm_to_pixels(self.spacing[1], self.dpi)
-        
-        # 计算总尺寸和边距
-        total_w = cols * photo_px_w + max(0, cols - 1) * spacing_px_w
-        total_h = rows * photo_px_h + max(0, rows - 1) * spacing_px_h
-        margin_x = max(0, (canvas_px_w - total_w) // 2)
-        margin_y = max(0, (canvas_px_h - total_h) // 2)
-        
-        return {
-            'canvas_size': (canvas_px_w, canvas_px_h),
-            'photo_size': (photo_px_w, photo_px_h),
-            'spacing': (spacing_px_w, spacing_px_h),
-            'rows': rows,
-            'cols': cols,
-            'margin': (margin_x, margin_y),
-            'total_photos': rows * cols,
-            'orientation': orientation,
-            'physical_canvas': (canvas_phys_w, canvas_phys_h),
-            'physical_photo': (photo_w, photo_h),
-            'used_canvas': (canvas_w_used, canvas_h_used)
-        }
+    def update_assignment_mode(self, index):
+        """更新多人分配方式"""
+        self.assignment_mode = index
+        self.assignment_edit.setVisible(index == 2)
+        self.update_preview()
     
-    def calculate_rows_cols(self, canvas_w, canvas_h, photo_w, photo_h):
-        """计算给定方向下的行列数"""
-        # 物理尺寸（厘米）
-        spacing_w, spacing_h = self.spacing
-
-        # 计算列数（考虑间距）
-        if photo_w + spacing_w > 0:
-            cols = max(1, int((canvas_w + spacing_w) // (photo_w + spacing_w)))
-        else:
-            cols = 1
+    def cell_sources(self, cell_count):
+        """为每个位置分配源照片序号，-1表示留空"""
+        source_count = len(self.photo_sources)
+        if source_count <= 1:
+            return [0 if source_count else -1] * cell_count
+        if self.assignment_mode == 1:
+            # 按人分块：每人占连续的一段位置
+            return [i * source_count // cell_count for i in range(cell_count)]
+        assignment = [i % source_count for i in range(cell_count)]
+        if self.assignment_mode == 2:
+            for i, text in enumerate(self.assignment_edit.text().split(",")[:cell_count]):
+                try:
+                    number = int(text)
+                except ValueError:
+                    continue
+                assignment[i] = number - 1 if 0 < number <= source_count else -1
+        return assignment
+    
+    def overrides_for(self, layout_info):
+        """返回适用于该排版的逐格修改
+        
+        同一画布、照片尺寸和张数的排版（如不同DPI的导出）位置序号一致，共用修改。
+        """
+        current = self.override_layout
+        if not self.cell_overrides or current is None:
+            return {}
+        if layout_info.get('layout_key') == current['layout_key'] or all(
+            layout_info[key] == current[key]
+            for key in ('used_canvas', 'physical_photo', 'total_photos', 'rows', 'cols')
+        ):
+            return self.cell_overrides
+        return {}
+    
+    def placed_cells(self, layout_info, count=None):
+        """返回每个位置的(x, y, 宽, 高, 旋转, 源照片序号)，已应用逐格修改
         
-        # 计算行数（考虑间距）
-        if photo_h + spacing_h > 0:
-            rows = max(1, int((canvas_h + spacing_h) // (photo_h + spacing_h)))
+        旋转为顺时针90度的次数，源照片序号为-1表示留空。
+        """
+        cells = layout_info['cells'][:count]
+        sources = self.cell_sources(len(cells))
+        overrides = self.overrides_for(layout_info)
+        placed = []
+        for index, ((x, y, w, h, rotated), source) in enumerate(zip(cells, sources)):
+            override = overrides.get(index, {})
+            if override.get("skip"):
+                source = -1
+            elif 0 <= override.get("source", -1) < len(self.photo_sources):
+                source = override["source"]
+            turns = int(rotated) + (2 if override.get("rotate") else 0)
+            placed.append((x, y, w, h, turns, source))
+        return placed
+    
+    def assigned_cells(self, layout_info, count=None):
+        """返回带源照片序号的位置列表，按源照片分组以便连续绘制同一张照片"""
+        assigned = [cell for cell in self.placed_cells(layout_info, count) if cell[5] >= 0]
+        assigned.sort(key=lambda cell: cell[5])
+        return assigned
+    
+    def choose_image_format(self, source_grayscale=None):
+        """根据色彩模式和源照片选择合成用的像素格式，预览、图像、PDF和打印共用
+        
+        source_grayscale为自动模式下源照片是否为黑白，为空时使用已上传的照片。
+        """
+        mode = self.color_combo.currentIndex() if hasattr(self, 'color_combo') else 0
+        if mode == 0:
+            grayscale = self.photo_is_grayscale if source_grayscale is None else source_grayscale
         else:
-            rows = 1
+            grayscale = (mode == 2)
+        return sheet_image_format(grayscale)
+    
+    def cm_to_pixels(self, cm, dpi):
+        """将厘米转换为像素（四舍五入，与位置表一致）"""
+        return cm_to_px(cm, dpi)
+    
+    def calculate_layout(self, dpi=None, canvas_size=None):
+        """计算最佳排版布局（考虑方向优化），dpi和画布为空时使用当前设置"""
+        if self.dpi_auto:
+            self.dpi = self.choose_auto_dpi()
+        if dpi is None:
+            dpi = self.dpi
+        if canvas_size is None:
+            canvas_size = self.canvas_size
+        
+        # 与拖动调整相同，输入过大的页边距时仍至少能排下一张照片
+        margin = min(self.page_margin, max_page_margin(
+            canvas_size["width"], canvas_size["height"],
+            self.photo_size["width"], self.photo_size["height"]
+        ))
+        
+        # 参数相同时复用已算好的排版和位置表，预览刷新和导出不再重复计算
+        key = (dpi, canvas_size["width"], canvas_size["height"],
+               self.photo_size["width"], self.photo_size["height"],
+               self.spacing, margin, self.orientation_mode, self.layout_mode)
+        layout_info = self.layout_cache.get(key)
+        if layout_info is not None:
+            self.layout_cache.move_to_end(key)
+            return layout_info
+        if len(self.layout_cache) >= LAYOUT_CACHE_SIZE:
+            self.layout_cache.popitem(last=False)
+        layout_info = compute_layout(canvas_size, self.photo_size, self.spacing, dpi,
+                                     self.orientation_mode, self.layout_mode,
+                                     margin)
+        layout_info['layout_key'] = key
+        self.layout_cache[key] = layout_info
+        return layout_info
+    
+    def plan_job(self, copies, layout_info=None):
+        """按照片数量规划分页，返回页面列表[{"layout": 排版信息, "count": 本页张数}]
+        
+        数量为0时输出一整版。最后一页不满时，改用能放下剩余照片的最小画布。
+        """
+        if layout_info is None:
+            layout_info = self.calculate_layout()
+        per_sheet = layout_info['total_photos']
+        if copies <= 0 or per_sheet == 0:
+            return [{"layout": layout_info, "count": per_sheet}]
         
-        return cols, rows
+        full_sheets, remainder = divmod(copies, per_sheet)
+        pages = [{"layout": layout_info, "count": per_sheet} for _ in range(full_sheets)]
+        if remainder:
+            last_layout = layout_info
+            current_area = self.canvas_size["width"] * self.canvas_size["height"]
+            smaller = sorted(
+                (c for c in self.size_manager.canvas_sizes
+                 if c["width"] * c["height"] < current_area),
+                key=lambda c: c["width"] * c["height"]
+            )
+            for canvas in smaller:
+                candidate = self.calculate_layout(layout_info['dpi'], canvas)
+                if candidate['total_photos'] >= remainder:
+                    last_layout = candidate
+                    break
+            pages.append({"layout": last_layout, "count": remainder})
+        return pages
+    
+    def render_page_thumbnail(self, page, height):
+        """渲染页面缩略图"""
+        layout_info = page["layout"]
+        canvas_w, canvas_h = layout_info['canvas_size']
+        scale = height / canvas_h
+        thumbnail = QImage(max(1, int(canvas_w * scale)), height, QImage.Format_RGB888)
+        thumbnail.fill(Qt.white)
+        painter = QPainter(thumbnail)
+        painter.setPen(QPen(QColor(180, 190, 210), 1))
+        painter.drawRect(0, 0, thumbnail.width() - 1, height - 1)
+        painter.setBrush(QBrush(QColor(64, 158, 255, 120)))
+        if self.photo_sources:
+            cells = self.assigned_cells(layout_info, page["count"])
+        else:
+            cells = [cell + (-1,) for cell in layout_info['cells'][:page["count"]]]
+        for x, y, w, h, rotated, source in cells:
+            rect = (int(x * scale), int(y * scale), max(1, int(w * scale)), max(1, int(h * scale)))
+            if source >= 0:
+                painter.drawImage(rect[0], rect[1], self.get_photo_tile(
+                    rect[2], rect[3], rotated, self.choose_image_format(), source
+                ))
+            else:
+                painter.drawRect(*rect)
+        painter.end()
+        return QPixmap.fromImage(thumbnail)
     
     def update_preview(self):
         """更新预览区域"""
         if not hasattr(self, 'preview_area'):
             return
+        if self.roll_check.isChecked():
+            self.update_roll_preview()
+            self.queue_prefetch()
+            return
             
         layout_info = self.calculate_layout()
         canvas_w, canvas_h = layout_info['canvas_size']
-        photo_w, photo_h = layout_info['photo_size']
         rows, cols = layout_info['rows'], layout_info['cols']
-        spacing_w, spacing_h = layout_info['spacing']
-        margin_x, margin_y = layout_info['margin']
         total_photos = layout_info['total_photos']
         orientation = layout_info['orientation']
         
-        # 创建预览图像
-        preview_img = QImage(canvas_w, canvas_h, QImage.Format_RGB32)
-        preview_img.fill(QColor(235, 238, 245))  # 预览背景色
+        # 排版参数变化后逐格修改失效；排版信息被淘汰后重新计算时参数不变，修改保留
+        if layout_info['layout_key'] != self.override_key:
+            self.cell_overrides = {}
+            self.override_key = layout_info['layout_key']
+        self.override_layout = layout_info
+        
+        # 创建预览图像（预览需要彩色标注，使用RGB888）
+        preview_img = QImage(canvas_w, canvas_h, QImage.Format_RGB888)
+        preview_img.fill(PREVIEW_BACKGROUND)
         
         painter = QPainter(preview_img)
         painter.setRenderHint(QPainter.Antialiasing)
@@ -686,26 +3942,124 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         painter.setPen(QPen(QColor(180, 190, 210), 3, Qt.DashLine))
         painter.drawRect(0, 0, canvas_w - 1, canvas_h - 1)
         
-        # 绘制照片位置
+        # 绘制照片位置，每张源照片只在第一个位置显示预览
+        placed = self.placed_cells(layout_info)
+        persist = layout_info['dpi'] == self.dpi
+        shown = set()
+        self.preview_photo_cells = set()
+        for index, cell in enumerate(placed):
+            if cell[5] >= 0 and cell[5] not in shown:
+                shown.add(cell[5])
+                self.preview_photo_cells.add(index)
+            self.paint_preview_cell(painter, placed, index, persist)
+        self.paint_preview_overlay(painter, layout_info)
+        
+        painter.end()
+        
+        # 缩放预览以适应显示区域
+        preview_pixmap = QPixmap.fromImage(preview_img)
+        preview_size = self.preview_area.size()
+        self.preview_pixmap = preview_pixmap.scaled(
+            preview_size, Qt.KeepAspectRatio, Qt.SmoothTransformation
+        )
+        
+        scale = self.preview_pixmap.width() / canvas_w
+        self.preview_area.set_canvas(self.preview_pixmap, scale, layout_info['cells'],
+                                     self.drag_handles(layout_info, scale))
+        
+        # 多页作业显示缩略图条
+        pages = self.plan_job(self.copies_spin.value(), layout_info)
+        self.page_model.set_pages(pages)
+        self.page_strip.setVisible(len(pages) > 1)
+        
+        # 更新统计信息
+        ph_w, ph_h = layout_info['physical_photo']
+        cv_w, cv_h = layout_info['physical_canvas']
+        
+        self.stats_label1.setText(f"照片尺寸: {ph_w}×{ph_h}cm")
+        self.stats_label2.setText(f"画布尺寸: {cv_w}×{cv_h}cm")
+        if self.layout_mode == 1:
+            rotated_count = sum(1 for cell in layout_info['cells'] if cell[4])
+            self.stats_label3.setText(f"排列: 混合旋转 = {total_photos}张 (旋转{rotated_count}张)")
+        elif self.layout_mode == 2:
+            self.stats_label3.setText(f"排列: 直刀裁切 = {total_photos}张 / {len(layout_info['cuts'])}刀")
+        else:
+            self.stats_label3.setText(f"排列: {rows}行 × {cols}列 = {total_photos}张")
+        if len(pages) > 1:
+            self.stats_label3.setText(self.stats_label3.text() + f" | 共{len(pages)}页")
+        if self.dpi_auto:
+            self.stats_label4.setText(f"方向: {orientation} | 自动 {self.dpi} DPI")
+        else:
+            self.stats_label4.setText(f"方向: {orientation}")
+        
+        # 源照片有效分辨率低于输出DPI时照片需要放大，提示打印可能模糊
+        ppis = self.source_effective_ppi()
+        lowest = min((min(ppi) for ppi in ppis), default=None)
+        if lowest is not None and lowest < self.dpi:
+            self.stats_warning_label.setText(
+                f"源照片分辨率不足: 有效 {int(lowest)} PPI，低于输出的 {self.dpi} DPI，打印可能模糊"
+            )
+            self.stats_warning_label.show()
+        else:
+            self.stats_warning_label.hide()
+        
+        self.use_prefetched(layout_info)
+        self.queue_prefetch()
+    
+    def paint_preview_cell(self, painter, placed, index, persist=False):
+        """在预览中绘制一个照片位置（画布像素坐标）
+        
+        persist为真时位置为输出DPI下的尺寸，照片与输出共用磁盘缓存；拖动中按显示
+        分辨率绘制的尺寸只保存在内存中。
+        """
+        x, y, w, h, turns, source = placed[index]
+        override = self.cell_overrides.get(index, {})
+        if override.get("skip"):
+            # 留空的位置用红色虚线叉号标出
+            painter.setBrush(Qt.NoBrush)
+            painter.setPen(QPen(QColor(245, 108, 108), max(1, w // 100), Qt.DashLine))
+            painter.drawRect(x, y, w, h)
+            painter.drawLine(x, y, x + w, y + h)
+            painter.drawLine(x + w, y, x, y + h)
+            return
         painter.setBrush(QBrush(QColor(64, 158, 255, 120)))  # 半透明蓝色
         painter.setPen(QPen(QColor(30, 100, 200), 1))
+        painter.drawRect(x, y, w, h)
+        if source < 0:
+            return
+        # 修改过的位置总是显示照片，便于确认效果
+        if override or index in self.preview_photo_cells:
+            painter.drawImage(x, y, self.get_photo_tile(w, h, turns, self.choose_image_format(),
+                                                        source, persist))
+        if len(self.photo_sources) > 1:
+            font = QFont()
+            font.setPixelSize(max(10, h // 4))
+            font.setBold(True)
+            painter.setFont(font)
+            painter.drawText(x, y, w, h, Qt.AlignCenter, str(source + 1))
+    
+    def paint_preview_overlay(self, painter, layout_info):
+        """在预览上叠加裁切线和方向指示"""
+        orientation = layout_info['orientation']
+        canvas_w = layout_info['canvas_size'][0]
         
-        for row in range(rows):
-            for col in range(cols):
-                x = margin_x + col * (photo_w + spacing_w)
-                y = margin_y + row * (photo_h + spacing_h)
-                painter.drawRect(x, y, photo_w, photo_h)
-        
-        # 如果上传了照片，在第一个位置显示预览
-        if self.photo_pixmap and not self.photo_pixmap.isNull():
-            # 缩放照片到证件尺寸
-            scaled_photo = self.photo_pixmap.scaled(
-                photo_w, photo_h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
-            )
-            # 在第一个位置绘制照片预览
-            first_x = margin_x
-            first_y = margin_y
-            painter.drawPixmap(first_x, first_y, scaled_photo)
+        # 绘制裁切线及顺序
+        if layout_info['cuts']:
+            dpi = layout_info['dpi']
+            font = QFont()
+            font.setPixelSize(max(10, canvas_w // 60))
+            painter.setFont(font)
+            painter.setPen(QPen(QColor(245, 108, 108), max(1, dpi // 100), Qt.DashLine))
+            for order, (axis, pos, start, end) in enumerate(layout_info['cuts'], 1):
+                pos_px = self.cm_to_pixels(pos, dpi)
+                start_px = self.cm_to_pixels(start, dpi)
+                end_px = self.cm_to_pixels(end, dpi)
+                if axis == "v":
+                    painter.drawLine(pos_px, start_px, pos_px, end_px)
+                    painter.drawText(pos_px + 2, start_px + font.pixelSize(), str(order))
+                else:
+                    painter.drawLine(start_px, pos_px, end_px, pos_px)
+                    painter.drawText(start_px + 2, pos_px - 2, str(order))
         
         # 绘制方向指示
         if orientation == "横向":
@@ -722,60 +4076,205 @@ class EnhancedPhotoLayoutTool(QMainWindow):
             painter.drawLine(20, 50, 15, 45)
             painter.drawLine(20, 50, 25, 45)
             painter.drawText(25, 60, "纸张方向: 竖向 (短边水平)")
+    
+    def drag_handles(self, layout_info, scale):
+        """网格排版中可拖动的间隙和四周边距（画布像素矩形）"""
+        cells = layout_info['cells']
+        if self.layout_mode != 0 or not len(cells):
+            return []
+        canvas_w, canvas_h = layout_info['canvas_size']
+        cols, rows = layout_info['cols'], layout_info['rows']
+        grab = max(1, int(6 / scale))  # 手柄至少6个显示像素宽
+        left, top = cells[0][0], cells[0][1]
+        right = cells[-1][0] + cells[-1][2]
+        bottom = cells[-1][1] + cells[-1][3]
+        handles = []
+        for col in range(1, cols):
+            x0 = cells[col - 1][0] + cells[col - 1][2]
+            width = max(cells[col][0] - x0, grab)
+            center = (x0 + cells[col][0]) // 2
+            handles.append(("gutter_x", QRect(center - width // 2, top, width, bottom - top)))
+        for row in range(1, rows):
+            y0 = cells[(row - 1) * cols][1] + cells[(row - 1) * cols][3]
+            height = max(cells[row * cols][1] - y0, grab)
+            center = (y0 + cells[row * cols][1]) // 2
+            handles.append(("gutter_y", QRect(left, center - height // 2, right - left, height)))
+        handles.append(("margin_left", QRect(0, 0, max(left, grab), canvas_h)))
+        handles.append(("margin_right", QRect(min(right, canvas_w - grab), 0,
+                                              max(canvas_w - right, grab), canvas_h)))
+        handles.append(("margin_top", QRect(0, 0, canvas_w, max(top, grab))))
+        handles.append(("margin_bottom", QRect(0, min(bottom, canvas_h - grab),
+                                               canvas_w, max(canvas_h - bottom, grab))))
+        return handles
+    
+    def drag_values(self, handle, dx, dy):
+        """按拖动位移计算新的间距和页边距（厘米，保留两位小数）"""
+        px_per_cm = self.override_layout['dpi'] / 2.54
+        spacing_w, spacing_h = self.spacing
+        margin = self.page_margin
+        if handle == "gutter_x":
+            spacing_w = max(0.0, spacing_w + dx / px_per_cm)
+        elif handle == "gutter_y":
+            spacing_h = max(0.0, spacing_h + dy / px_per_cm)
+        else:
+            delta = {"margin_left": dx, "margin_right": -dx,
+                     "margin_top": dy, "margin_bottom": -dy}[handle]
+            # 至少保留放下一张照片的区域
+            limit = max_page_margin(*self.override_layout['physical_canvas'],
+                                    *self.override_layout['physical_photo'])
+            margin = min(max(0.0, margin + delta / px_per_cm), limit)
+        return (round(spacing_w, 2), round(spacing_h, 2)), round(margin, 2)
+    
+    def drag_layout(self, handle, dx, dy):
+        """拖动中只记录新数值，按显示刷新率合并重绘"""
+        if self.override_layout is None:
+            return
+        self.drag_state = self.drag_values(handle, dx, dy)
+        if not self.drag_timer.isActive():
+            self.drag_timer.start()
+    
+    def render_drag_frame(self):
+        """用位置表和缓存的预览尺寸照片绘制拖动中的网格，不重新计算整张画布"""
+        layout_info = self.override_layout
+        if self.drag_state is None or layout_info is None or self.preview_pixmap is None:
+            return
+        (spacing_w, spacing_h), margin = self.drag_state
+        canvas_w, canvas_h = layout_info['used_canvas']
+        photo_w, photo_h = layout_info['physical_photo']
+        inner_w, inner_h = canvas_w - 2 * margin, canvas_h - 2 * margin
+        cols, rows = grid_rows_cols(inner_w, inner_h, photo_w, photo_h, spacing_w, spacing_h)
+        cells_cm = grid_cells(inner_w, inner_h, photo_w, photo_h, spacing_w, spacing_h, cols, rows)
         
-        painter.end()
-        
-        # 缩放预览以适应显示区域
-        preview_pixmap = QPixmap.fromImage(preview_img)
-        preview_size = self.preview_area.size()
-        scaled_pixmap = preview_pixmap.scaled(
-            preview_size, Qt.KeepAspectRatio, Qt.SmoothTransformation
-        )
-        
-        self.preview_area.setPixmap(scaled_pixmap)
+        # 直接在显示分辨率下绘制，照片使用预览尺寸的缓存
+        px_per_cm = layout_info['dpi'] / 2.54 * self.preview_area.scale
+        cell_w, cell_h = int(round(photo_w * px_per_cm)), int(round(photo_h * px_per_cm))
+        sources = self.cell_sources(len(cells_cm))
+        placed = [(int(round((margin + x) * px_per_cm)), int(round((margin + y) * px_per_cm)),
+                   cell_w, cell_h, 0, source)
+                  for (x, y, _, _, _), source in zip(cells_cm, sources)]
         
-        # 更新统计信息
-        ph_w, ph_h = layout_info['physical_photo']
-        cv_w, cv_h = layout_info['physical_canvas']
+        frame = QPixmap(self.preview_pixmap.size())
+        frame.fill(PREVIEW_BACKGROUND)
+        painter = QPainter(frame)
+        painter.setPen(QPen(QColor(180, 190, 210), 1, Qt.DashLine))
+        painter.drawRect(0, 0, frame.width() - 1, frame.height() - 1)
+        for index in range(len(placed)):
+            self.paint_preview_cell(painter, placed, index)
+        painter.setPen(QPen(Qt.darkGray))
+        painter.drawText(frame.rect().adjusted(0, 4, -6, 0), Qt.AlignTop | Qt.AlignRight,
+                         f"间距 {spacing_w:.2f}×{spacing_h:.2f}cm  页边距 {margin:.2f}cm  "
+                         f"{rows}行×{cols}列")
+        painter.end()
+        self.preview_area.setPixmap(frame)
+    
+    def finish_drag(self, handle, dx, dy):
+        """松开鼠标时写入间距和页边距，并重新计算一次排版"""
+        self.drag_timer.stop()
+        if self.override_layout is None:
+            return
+        (spacing_w, spacing_h), margin = self.drag_values(handle, dx, dy)
+        self.drag_state = None
+        # 暂停信号，全部数值设置好后只更新一次预览
+        for edit, value in ((self.h_spacing_edit, spacing_w),
+                            (self.v_spacing_edit, spacing_h),
+                            (self.margin_edit, margin)):
+            edit.blockSignals(True)
+            edit.setText(str(value))
+            edit.blockSignals(False)
+        self.update_spacing()
+    
+    def edit_cell(self, index, global_pos):
+        """单击预览中的照片位置：留空、旋转或更换源照片"""
+        layout_info = self.override_layout
+        if layout_info is None:
+            return
+        override = dict(self.cell_overrides.get(index, {}))
+        menu = QMenu(self)
+        skip_action = menu.addAction("留空此位置")
+        skip_action.setCheckable(True)
+        skip_action.setChecked(bool(override.get("skip")))
+        rotate_action = menu.addAction("旋转180°")
+        rotate_action.setCheckable(True)
+        rotate_action.setChecked(bool(override.get("rotate")))
+        source_actions = {}
+        if len(self.photo_sources) > 1:
+            source_menu = menu.addMenu("更换照片")
+            for number, source in enumerate(self.photo_sources):
+                action = source_menu.addAction(f"{number + 1}. {os.path.basename(source['path'])}")
+                action.setCheckable(True)
+                action.setChecked(self.placed_cells(layout_info)[index][5] == number)
+                source_actions[action] = number
+        menu.addSeparator()
+        reset_action = menu.addAction("清除全部修改")
+        reset_action.setEnabled(bool(self.cell_overrides))
         
-        self.stats_label1.setText(f"照片尺寸: {ph_w}×{ph_h}cm")
-        self.stats_label2.setText(f"画布尺寸: {cv_w}×{cv_h}cm")
-        self.stats_label3.setText(f"排列: {rows}行 × {cols}列 = {total_photos}张")
-        self.stats_label4.setText(f"方向: {orientation}")
+        action = menu.exec_(global_pos)
+        if action is None:
+            return
+        if action is reset_action:
+            self.cell_overrides = {}
+            self.update_preview()
+            return
+        if action is skip_action:
+            override["skip"] = action.isChecked()
+        elif action is rotate_action:
+            override["rotate"] = action.isChecked()
+        elif action in source_actions:
+            override["source"] = source_actions[action]
+            override["skip"] = False
+        override = {key: value for key, value in override.items() if value is not False}
+        if override:
+            self.cell_overrides[index] = override
+        else:
+            self.cell_overrides.pop(index, None)
+        self.repaint_preview_cells([index])
+    
+    def repaint_preview_cells(self, indices):
+        """只重绘预览中受影响的单元格区域，不重新渲染整张画布"""
+        layout_info = self.override_layout
+        if self.preview_pixmap is None or layout_info is None:
+            return
+        cells = layout_info['cells']
+        placed = self.placed_cells(layout_info)
+        persist = layout_info['dpi'] == self.dpi
+        painter = QPainter(self.preview_pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.scale(self.preview_area.scale, self.preview_area.scale)
+        for index in indices:
+            x, y, w, h, _ = cells[index]
+            pad = max(2, int(2 / self.preview_area.scale))
+            dirty = QRect(x - pad, y - pad, w + 2 * pad, h + 2 * pad)
+            painter.setClipRect(dirty)
+            painter.fillRect(dirty, PREVIEW_BACKGROUND)
+            # 与脏区域相交的相邻位置和叠加标注一并重绘
+            for other, (ox, oy, ow, oh, _) in enumerate(cells):
+                if dirty.intersects(QRect(ox, oy, ow, oh)):
+                    self.paint_preview_cell(painter, placed, other, persist)
+            self.paint_preview_overlay(painter, layout_info)
+        painter.end()
+        self.preview_area.setPixmap(self.preview_pixmap)
     
     def generate_layout(self):
-        """生成并下载排版"""
-        if not self.photo_pixmap or self.photo_pixmap.isNull():
+        """生成并下载排版；导出期间固定源照片，避免被内存预算淘汰后反复解码"""
+        with self.image_cache.pinned(self.source_cache_keys()):
+            self.export_layout()
+        self.update_cache_stats()
+    
+    def export_layout(self):
+        """按当前设置导出单张、多份作业或卷筒排版"""
+        if not self.photo_sources:
             QMessageBox.warning(self, "警告", "请先上传证件照片！")
             return
+        if self.roll_check.isChecked():
+            self.export_roll()
+            return
             
         layout_info = self.calculate_layout()
-        canvas_w, canvas_h = layout_info['canvas_size']
-        photo_w, photo_h = layout_info['photo_size']
-        rows, cols = layout_info['rows'], layout_info['cols']
-        spacing_w, spacing_h = layout_info['spacing']
-        margin_x, margin_y = layout_info['margin']
-        
-        # 创建最终图像
-        result_img = QImage(canvas_w, canvas_h, QImage.Format_RGB32)
-        result_img.fill(Qt.white)  # 白色背景
-        
-        painter = QPainter(result_img)
-        painter.setRenderHint(QPainter.SmoothPixmapTransform)
-        
-        # 缩放照片到证件尺寸
-        scaled_photo = self.photo_pixmap.scaled(
-            photo_w, photo_h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
-        )
-        
-        # 排列照片
-        for row in range(rows):
-            for col in range(cols):
-                x = margin_x + col * (photo_w + spacing_w)
-                y = margin_y + row * (photo_h + spacing_h)
-                painter.drawPixmap(x, y, scaled_photo)
         
-        painter.end()
+        if self.copies_spin.value() > 0:
+            self.export_job(self.plan_job(self.copies_spin.value(), layout_info))
+            return
         
         # 保存文件
         format_map = {
@@ -793,16 +4292,614 @@ class EnhancedPhotoLayoutTool(QMainWindow):
         )
         
         if file_path:
-            result_img.save(file_path, file_format)
+            max_bytes = self.jpeg_budget_bytes() if file_format == "JPG" else None
+            image_format = self.choose_image_format()
+            sheet_key = self.sheet_cache_key(layout_info, image_format)
+            output_key = OutputCache.make_key(sheet_key, file_format, max_bytes)
+            cached_path = self.output_cache.get_file(output_key)
+            if cached_path is not None:
+                # 相同照片和设置已输出过，直接复制编码好的文件
+                try:
+                    shutil.copyfile(cached_path, file_path)
+                except OSError:
+                    QMessageBox.warning(self, "错误", f"无法保存文件:\n{file_path}")
+                    return
+                if layout_info['cuts']:
+                    self.save_cut_sidecars(layout_info, file_path)
+                QMessageBox.information(self, "成功", f"证件照片排版已保存至:\n{file_path}")
+                return
+            
+            # 只改输出格式时复用内存中的整版，无需重新合成
+            result_img = self.output_cache.get_sheet(sheet_key)
+            if result_img is None:
+                result_img = self.compose_layout_image(layout_info, image_format)
+                self.output_cache.put_sheet(sheet_key, result_img)
+            elif result_img.format() != image_format:
+                result_img = result_img.convertToFormat(image_format)
+            
+            if max_bytes:
+                quality, size = self.save_jpeg_to_budget(result_img, file_path, max_bytes)
+                if quality is None:
+                    QMessageBox.warning(self, "错误", f"无法保存文件:\n{file_path}")
+                    return
+                if size > max_bytes:
+                    QMessageBox.warning(
+                        self, "警告",
+                        f"最低质量下文件仍为 {size // 1024} KB，超出目标大小。"
+                    )
+            elif not self.save_layout_image(result_img, file_path, file_format):
+                QMessageBox.warning(self, "错误", f"无法保存文件:\n{file_path}")
+                return
+            # 读回分辨率，确保打印机可按1:1打印而无需重采样
+            saved_dpi = read_image_dpi(file_path)
+            if saved_dpi != (self.dpi, self.dpi):
+                QMessageBox.warning(
+                    self, "警告",
+                    f"文件中的打印分辨率为 {saved_dpi}，与设置的 {self.dpi} DPI 不一致，"
+                    "打印时可能被重新缩放。"
+                )
+            self.output_cache.put_file(output_key, file_path)
+            if layout_info['cuts']:
+                self.save_cut_sidecars(layout_info, file_path)
             QMessageBox.information(self, "成功", f"证件照片排版已保存至:\n{file_path}")
     
+    def sheet_cache_key(self, layout_info, image_format):
+        """整版内容的缓存键：源照片内容、每个位置的矩形/旋转/照片和画布参数
+        
+        不含像素格式，只区分内容是否为黑白：黑白照片合成的整版无论以灰度还是RGB888
+        保存，像素都相同，换格式时只需转换格式重新编码。
+        """
+        grayscale = image_format == QImage.Format_Grayscale8 or self.photo_is_grayscale
+        return OutputCache.make_key(
+            [source["hash"] for source in self.photo_sources],
+            layout_info['canvas_size'], layout_info['dpi'],
+            self.placed_cells(layout_info), grayscale
+        )
+    
+    def export_job(self, pages):
+        """导出多页作业：PDF多页文档，或按页编号的图像文件"""
+        file_format = OUTPUT_FORMATS[self.format_combo.currentIndex()]
+        numbered_filter = f"{file_format}文件，按页编号 (*.{file_format.lower()})"
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "保存多页作业", "证件照片排版",
+            f"PDF文件 (*.pdf);;{numbered_filter}"
+        )
+        if not file_path:
+            return
+        
+        if selected_filter == numbered_filter:
+            base_path = os.path.splitext(file_path)[0]
+            saved = []
+            for number, page in enumerate(pages, 1):
+                image = self.compose_layout_image(
+                    page["layout"], self.choose_image_format(), page["count"]
+                )
+                path = f"{base_path}_{number:03d}.{file_format.lower()}"
+                if not self.save_layout_image(image, path, file_format):
+                    QMessageBox.warning(self, "错误", f"无法保存文件:\n{path}")
+                    return
+                saved.append(path)
+            message = f"共{len(saved)}页，已保存至:\n{saved[0]}\n...\n{saved[-1]}"
+        else:
+            if not file_path.lower().endswith(".pdf"):
+                file_path += ".pdf"
+            self.write_job_pdf(pages, file_path)
+            message = f"共{len(pages)}页，已保存至:\n{file_path}"
+        
+        total = sum(page["count"] for page in pages)
+        QMessageBox.information(self, "成功", f"{total}张照片{message}")
+    
+    def write_job_pdf(self, pages, file_path):
+        """将多页作业写入PDF，每页使用各自的画布尺寸"""
+        writer = QPdfWriter(file_path)
+        writer.setResolution(pages[0]["layout"]['dpi'])
+        writer.setPageMargins(QMarginsF())
+        painter = None
+        for number, page in enumerate(pages):
+            layout_info = page["layout"]
+            canvas_w, canvas_h = layout_info['used_canvas']
+            writer.setPageSize(QPageSize(QSizeF(canvas_w * 10, canvas_h * 10),
+                                         QPageSize.Millimeter))
+            if painter is None:
+                painter = QPainter(writer)
+            else:
+                writer.newPage()
+            # PDF分辨率与排版DPI一致，位置表中的像素坐标可直接使用
+            self.draw_cells(painter, layout_info, self.choose_image_format(), page["count"])
+        if painter is not None:
+            painter.end()
+    
+    def print_layout(self):
+        """将当前排版直接发送到打印机，打印分辨率尽量与排版DPI一致"""
+        if not self.photo_sources:
+            QMessageBox.warning(self, "警告", "请先上传证件照片！")
+            return
+        layout_info = self.calculate_layout()
+        canvas_w, canvas_h = layout_info['used_canvas']
+        printer = QPrinter(QPrinter.HighResolution)
+        printer.setResolution(layout_info['dpi'])
+        printer.setFullPage(True)
+        printer.setPageSize(QPageSize(QSizeF(canvas_w * 10, canvas_h * 10),
+                                      QPageSize.Millimeter))
+        if QPrintDialog(printer, self).exec_() != QDialog.Accepted:
+            return
+        with self.image_cache.pinned(self.source_cache_keys()):
+            painter = begin_print(printer, layout_info['dpi'])
+            self.draw_cells(painter, layout_info, self.choose_image_format())
+            painter.end()
+        self.update_cache_stats()
+    
+    def toggle_hot_folder(self):
+        """开始或停止热文件夹监视"""
+        if self.hot_folder is not None:
+            self.hot_folder.stop()
+            self.hot_folder = None
+            self.hot_folder_btn.setText("热文件夹自动排版")
+            self.hot_folder_label.hide()
+            return
+        defaults = {"photo": self.photo_size, "canvas": self.canvas_size, "dpi": self.dpi,
+                    "format": OUTPUT_FORMATS[self.format_combo.currentIndex()],
+                    "spacing": list(self.spacing)}
+        dialog = HotFolderDialog(self, self.size_manager, defaults)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        result = dialog.get_profile()
+        if result is None:
+            return
+        folder, profile = result
+        try:
+            os.makedirs(profile["outbox"], exist_ok=True)
+        except OSError:
+            QMessageBox.warning(self, "错误", f"无法创建输出文件夹:\n{profile['outbox']}")
+            return
+        self.size_manager.save_folder_profile(folder, profile)
+        self.hot_folder_stats = [0, 0, 0.0]
+        self.hot_folder = HotFolderWatcher(folder, profile, self)
+        self.hot_folder.sheetFinished.connect(self.hot_folder_finished)
+        self.hot_folder.sheetFailed.connect(self.hot_folder_failed)
+        self.hot_folder_btn.setText("停止热文件夹监视")
+        self.update_hot_folder_label()
+        self.hot_folder_label.show()
+    
+    def hot_folder_finished(self, path, output, elapsed):
+        self.hot_folder_stats[0] += 1
+        self.hot_folder_stats[2] += elapsed
+        self.update_hot_folder_label()
+    
+    def hot_folder_failed(self, path, message):
+        self.hot_folder_stats[1] += 1
+        self.update_hot_folder_label()
+    
+    def update_hot_folder_label(self):
+        done, failed, total_time = self.hot_folder_stats
+        text = f"监视中: {self.hot_folder.folder}\n已完成 {done} 张"
+        if done:
+            text += f"，平均 {total_time / done * 1000:.0f} ms/张"
+        if failed:
+            text += f"，失败 {failed} 张"
+        self.hot_folder_label.setText(text)
+    
+    def save_cut_sidecars(self, layout_info, file_path):
+        """保存裁切顺序文件（JSON和SVG），与排版图像同名"""
+        base_path = os.path.splitext(file_path)[0]
+        canvas_w, canvas_h = layout_info['used_canvas']
+        cuts = layout_info['cuts']
+        dpi = layout_info['dpi']
+        
+        cut_list = [
+            {"order": order, "direction": "垂直" if axis == "v" else "水平",
+             "position_cm": round(pos, 3), "from_cm": round(start, 3), "to_cm": round(end, 3)}
+            for order, (axis, pos, start, end) in enumerate(cuts, 1)
+        ]
+        with open(f"{base_path}_裁切.json", 'w', encoding='utf-8') as f:
+            json.dump({"canvas_cm": [canvas_w, canvas_h], "cuts": cut_list},
+                      f, ensure_ascii=False, indent=2)
+        
+        # SVG以厘米为用户单位，照片位置由像素位置换算
+        px_to_cm = 2.54 / dpi
+        lines = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{canvas_w}cm" height="{canvas_h}cm" '
+            f'viewBox="0 0 {canvas_w} {canvas_h}">',
+            f'<rect width="{canvas_w}" height="{canvas_h}" fill="white" stroke="#999" stroke-width="0.02"/>'
+        ]
+        for x, y, w, h, _ in layout_info['cells']:
+            lines.append(
+                f'<rect x="{x * px_to_cm:.3f}" y="{y * px_to_cm:.3f}" '
+                f'width="{w * px_to_cm:.3f}" height="{h * px_to_cm:.3f}" fill="#d9ecff"/>'
+            )
+        for order, (axis, pos, start, end) in enumerate(cuts, 1):
+            if axis == "v":
+                x1, y1, x2, y2 = pos, start, pos, end
+            else:
+                x1, y1, x2, y2 = start, pos, end, pos
+            lines.append(f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" '
+                         f'stroke="red" stroke-width="0.02" stroke-dasharray="0.1,0.05"/>')
+            lines.append(f'<text x="{x1 + 0.05}" y="{y1 + 0.3}" font-size="0.25" fill="red">{order}</text>')
+        lines.append('</svg>')
+        with open(f"{base_path}_裁切.svg", 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+    
+    def save_layout_image(self, image, file_path, file_format, quality=-1, dpi=None):
+        """写入打印分辨率后保存图像，dpi为空时使用当前设置"""
+        if dpi is None:
+            dpi = self.dpi
+        return save_image_with_dpi(image, file_path, file_format, dpi, quality)
+    
+    def jpeg_budget_bytes(self):
+        """读取JPG目标大小，未设置或无效时返回None"""
+        try:
+            kilobytes = float(self.jpeg_budget_edit.text())
+        except ValueError:
+            return None
+        return int(kilobytes * 1024) if kilobytes > 0 else None
+    
+    def save_jpeg_to_budget(self, image, file_path, max_bytes):
+        """按字节预算自动选择JPG质量并保存，返回(质量, 文件大小)，失败时质量为None"""
+        image.setDotsPerMeterX(dpi_to_dots_per_meter(self.dpi))
+        image.setDotsPerMeterY(dpi_to_dots_per_meter(self.dpi))
+        # 所有试编码都复用同一张合成图，不重新排版
+        data, quality = encode_jpeg_to_budget(image, max_bytes)
+        try:
+            with open(file_path, 'wb') as f:
+                f.write(data)
+        except IOError:
+            return None, len(data)
+        return quality, len(data)
+    
+    def export_order_sheets(self):
+        """多尺寸订单拼版：尽量少的画布容纳订单中的全部照片"""
+        dialog = OrderPackingDialog(self, self.size_manager)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        items, canvas = dialog.get_order()
+        if not items:
+            return
+        
+        # 纵向放置画布，照片可旋转，因此无需再比较画布方向
+        canvas_w = min(canvas["width"], canvas["height"])
+        canvas_h = max(canvas["width"], canvas["height"])
+        try:
+            sheets = pack_order(items, canvas_w, canvas_h, self.spacing)
+        except ValueError as e:
+            QMessageBox.warning(self, "输入错误", str(e))
+            return
+        
+        file_format = OUTPUT_FORMATS[self.format_combo.currentIndex()]
+        base_path, _ = QFileDialog.getSaveFileName(
+            self, "选择保存位置和文件名", "订单拼版", "所有文件 (*)"
+        )
+        if not base_path:
+            return
+        base_path = os.path.splitext(base_path)[0]
+        
+        sources = [read_image(item["file_path"])[0] for item in items]
+        if any(source.isNull() for source in sources):
+            QMessageBox.warning(self, "错误", "无法读取部分源照片！")
+            return
+        
+        canvas_px_w = self.cm_to_pixels(canvas_w, self.dpi)
+        canvas_px_h = self.cm_to_pixels(canvas_h, self.dpi)
+        image_format = self.choose_image_format(source_grayscale=False)
+        tiles = {}
+        saved = []
+        for number, placements in enumerate(sheets, 1):
+            # 排列区域居中
+            used_w = max(p["x"] + p["width"] for p in placements)
+            used_h = max(p["y"] + p["height"] for p in placements)
+            margin_x = (canvas_w - used_w) / 2
+            margin_y = (canvas_h - used_h) / 2
+            
+            sheet = QImage(canvas_px_w, canvas_px_h, image_format)
+            sheet.fill(Qt.white)
+            painter = QPainter(sheet)
+            for p in placements:
+                w = self.cm_to_pixels(p["width"], self.dpi)
+                h = self.cm_to_pixels(p["height"], self.dpi)
+                key = (p["item"], w, h, p["rotated"])
+                if key not in tiles:
+                    # 每个订单项每种尺寸只缩放一次
+                    source = sources[p["item"]]
+                    if p["rotated"]:
+                        tiles[key] = source.scaled(
+                            h, w, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+                        ).transformed(QTransform().rotate(90))
+                    else:
+                        tiles[key] = source.scaled(
+                            w, h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+                        )
+                    tiles[key] = tiles[key].convertToFormat(image_format)
+                painter.drawImage(self.cm_to_pixels(margin_x + p["x"], self.dpi),
+                                  self.cm_to_pixels(margin_y + p["y"], self.dpi),
+                                  tiles[key])
+            painter.end()
+            
+            file_path = f"{base_path}_{number}.{file_format.lower()}"
+            if not self.save_layout_image(sheet, file_path, file_format):
+                QMessageBox.warning(self, "错误", f"无法保存文件:\n{file_path}")
+                return
+            saved.append(file_path)
+        
+        # 每张画布的位置表（厘米），供裁切和核对使用
+        table = [
+            [dict(p, item=items[p["item"]]["size"]["name"],
+                  source=os.path.basename(items[p["item"]]["file_path"])) for p in placements]
+            for placements in sheets
+        ]
+        with open(f"{base_path}_排版表.json", 'w', encoding='utf-8') as f:
+            json.dump({"canvas": canvas, "sheets": table}, f, ensure_ascii=False, indent=2)
+        
+        total = sum(item["quantity"] for item in items)
+        QMessageBox.information(
+            self, "成功", f"{total}张照片共排入{len(sheets)}张画布，已保存至:\n" + "\n".join(saved)
+        )
+    
+    def export_poster(self):
+        """海报分页：逐张读取源图局部区域并渲染，内存中不保留整张海报"""
+        dialog = PosterDialog(self, self.size_manager)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        settings = dialog.get_settings()
+        if settings is None:
+            return
+        poster_w, poster_h = settings["poster"]
+        canvas = settings["canvas"]
+        plan = plan_poster_tiles(poster_w, poster_h, canvas["width"], canvas["height"],
+                                 settings["overlap"], settings["mark_margin"])
+        if plan is None:
+            QMessageBox.warning(self, "输入错误", "画布可打印区域小于粘贴重叠！")
+            return
+        
+        file_format = OUTPUT_FORMATS[self.format_combo.currentIndex()]
+        base_path, _ = QFileDialog.getSaveFileName(
+            self, "选择保存位置和文件名", "海报分页", "所有文件 (*)"
+        )
+        if not base_path:
+            return
+        base_path = os.path.splitext(base_path)[0]
+        
+        source_w = settings["source_size"].width()
+        source_h = settings["source_size"].height()
+        sheet_w, sheet_h = plan["canvas"]
+        margin_px = self.cm_to_pixels(settings["mark_margin"], self.dpi)
+        for row, col, x0, y0, x1, y1 in plan["tiles"]:
+            # 只解码本分片对应的源图区域，并在读取时缩放到打印尺寸
+            clip = QRect(int(x0 / poster_w * source_w), int(y0 / poster_h * source_h),
+                         max(1, math.ceil((x1 - x0) / poster_w * source_w)),
+                         max(1, math.ceil((y1 - y0) / poster_h * source_h)))
+            reader = open_image_reader(settings["file_path"])
+            set_clip_rect(reader, clip.intersected(QRect(0, 0, source_w, source_h)))
+            tile_w = self.cm_to_pixels(x1 - x0, self.dpi)
+            tile_h = self.cm_to_pixels(y1 - y0, self.dpi)
+            set_scaled_size(reader, tile_w, tile_h)
+            tile = reader.read()
+            if tile.isNull():
+                QMessageBox.warning(self, "错误", f"无法读取海报图片:\n{reader.errorString()}")
+                return
+            
+            sheet = QImage(self.cm_to_pixels(sheet_w, self.dpi),
+                           self.cm_to_pixels(sheet_h, self.dpi),
+                           self.choose_image_format(source_grayscale=False))
+            sheet.fill(Qt.white)
+            painter = QPainter(sheet)
+            painter.drawImage(margin_px, margin_px, tile)
+            self.draw_poster_marks(painter, plan, row, col, margin_px, tile_w, tile_h,
+                                   self.cm_to_pixels(settings["overlap"], self.dpi))
+            painter.end()
+            
+            file_path = f"{base_path}_{row + 1}行{col + 1}列.{file_format.lower()}"
+            if not self.save_layout_image(sheet, file_path, file_format):
+                QMessageBox.warning(self, "错误", f"无法保存文件:\n{file_path}")
+                return
+        
+        QMessageBox.information(
+            self, "成功",
+            f"海报已分为{plan['rows']}行 × {plan['cols']}列，共{len(plan['tiles'])}张，"
+            f"保存至:\n{base_path}_*.{file_format.lower()}"
+        )
+    
+    def draw_poster_marks(self, painter, plan, row, col, margin, tile_w, tile_h, overlap):
+        """在分片四周边距中绘制裁切角线、粘贴重叠标记和分片编号"""
+        left, top = margin, margin
+        right, bottom = margin + tile_w, margin + tile_h
+        mark = max(4, margin * 2 // 3)
+        painter.setPen(QPen(Qt.black, max(1, self.dpi // 150)))
+        # 四角裁切线
+        for x in (left, right):
+            painter.drawLine(x, top - mark, x, top - 2)
+            painter.drawLine(x, bottom + 2, x, bottom + mark)
+        for y in (top, bottom):
+            painter.drawLine(left - mark, y, left - 2, y)
+            painter.drawLine(right + 2, y, right + mark, y)
+        
+        # 与右侧、下方分片重叠的粘贴区边界：对齐十字标记
+        painter.setPen(QPen(QColor(245, 108, 108), max(1, self.dpi // 150), Qt.DashLine))
+        if col < plan["cols"] - 1:
+            x = right - overlap
+            painter.drawLine(x, top - mark, x, top - 2)
+            painter.drawLine(x, bottom + 2, x, bottom + mark)
+        if row < plan["rows"] - 1:
+            y = bottom - overlap
+            painter.drawLine(left - mark, y, left - 2, y)
+            painter.drawLine(right + 2, y, right + mark, y)
+        
+        font = QFont()
+        font.setPixelSize(max(8, margin // 2))
+        painter.setFont(font)
+        painter.setPen(Qt.darkGray)
+        painter.drawText(left + mark, top - 2,
+                         f"第{row + 1}行 第{col + 1}列 / 共{plan['rows']}×{plan['cols']}  "
+                         "虚线处为粘贴重叠边界")
+    
+    def export_multi_resolution(self):
+        """一次合成，导出多个分辨率/格式的文件"""
+        if not self.photo_sources:
+            QMessageBox.warning(self, "警告", "请先上传证件照片！")
+            return
+        
+        dialog = MultiExportDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        outputs = dialog.get_outputs()
+        if not outputs:
+            return
+        
+        base_path, _ = QFileDialog.getSaveFileName(
+            self, "选择保存位置和文件名", "证件照片排版", "所有文件 (*)"
+        )
+        if not base_path:
+            return
+        base_path = os.path.splitext(base_path)[0]
+        
+        # 只在最高DPI下合成一次
+        max_dpi = max(output["dpi"] for output in outputs)
+        compose_format = self.choose_image_format()
+        # 导出期间固定源照片，避免被内存预算淘汰后反复解码
+        with self.image_cache.pinned(self.source_cache_keys()):
+            sheet = self.compose_layout_image(self.calculate_layout(max_dpi), compose_format)
+            
+            tasks = []
+            for output in outputs:
+                suffix = "_样张" if output["watermark"] else ""
+                file_path = f"{base_path}_{output['dpi']}dpi{suffix}.{output['format'].lower()}"
+                canvas_size = self.calculate_layout(output["dpi"])['canvas_size']
+                tasks.append((output, canvas_size, file_path))
+            
+            # 降采样和编码在线程池中并行进行（PyQt调用期间会释放GIL）
+            with ThreadPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as executor:
+                results = list(executor.map(
+                    lambda task: self.derive_output(sheet, *task), tasks
+                ))
+        self.update_cache_stats()
+        
+        failed = [path for path, ok in results if not ok]
+        if failed:
+            QMessageBox.warning(self, "错误", "以下文件保存失败:\n" + "\n".join(failed))
+        else:
+            QMessageBox.information(
+                self, "成功", "证件照片排版已保存至:\n" + "\n".join(path for path, _ in results)
+            )
+    
+    def derive_output(self, sheet, output, canvas_size, file_path):
+        """从高分辨率合成图派生单个输出文件"""
+        image = sheet
+        if (image.width(), image.height()) != canvas_size:
+            # 平滑缩放缩小时按面积平均，不会产生锯齿
+            image = image.scaled(canvas_size[0], canvas_size[1],
+                                 Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        elif output["watermark"]:
+            image = image.copy()  # 水印不能画在共用的合成图上
+        if output["watermark"]:
+            self.draw_proof_watermark(image)
+        ok = self.save_layout_image(image, file_path, output["format"], dpi=output["dpi"])
+        return file_path, ok
+    
+    def draw_proof_watermark(self, image):
+        """在样张上绘制半透明斜向水印"""
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        font = QFont()
+        font.setPixelSize(max(12, image.width() // 12))
+        font.setBold(True)
+        painter.setFont(font)
+        painter.setPen(QColor(200, 200, 200, 140))
+        painter.translate(image.width() / 2, image.height() / 2)
+        painter.rotate(-30)
+        step = font.pixelSize() * 4
+        extent = image.width() + image.height()
+        for y in range(-extent, extent, step):
+            for x in range(-extent, extent, step * 2):
+                painter.drawText(x, y, "样张 PROOF")
+        painter.end()
+    
+    def compose_layout_image(self, layout_info, image_format, count=None):
+        """按排版信息合成最终图像，count为本页张数，为空时排满"""
+        canvas_w, canvas_h = layout_info['canvas_size']
+        
+        # 创建最终图像
+        result_img = QImage(canvas_w, canvas_h, image_format)
+        result_img.fill(Qt.white)  # 白色背景
+        
+        painter = QPainter(result_img)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        self.draw_cells(painter, layout_info, image_format, count)
+        painter.end()
+        return result_img
+    
+    def draw_cells(self, painter, layout_info, image_format, count=None):
+        """按位置表绘制照片，图像、PDF和打印机共用
+        
+        照片按源照片分组绘制，且已按画布格式缓存，绘制时无需逐像素转换。
+        """
+        persist = layout_info['dpi'] == self.dpi
+        for x, y, w, h, rotated, source in self.assigned_cells(layout_info, count):
+            painter.drawImage(x, y, self.get_photo_tile(w, h, rotated, image_format, source,
+                                                        persist))
+    
+    def get_photo_tile(self, width, height, rotated, image_format, source=0, persist=False):
+        """获取缩放到单元格尺寸的源照片，rotated为顺时针旋转90度的次数（旋转单元格为1）
+        
+        persist为真时（所选输出DPI下的照片）同时读写磁盘缓存；缩略图、卷纸预览等
+        随窗口大小变化的尺寸只保存在内存中，避免磁盘缓存被大量一次性尺寸占满。
+        """
+        rotated = int(rotated) % 4
+        stamp = self.photo_sources[source]["stamp"]
+        key = ("tile", stamp, width, height, rotated, int(image_format))
+        tile = self.image_cache.get(key)
+        if tile is not None:
+            return tile
+        # 内存中没有时先查磁盘缓存，重新打开的照片无需解码
+        name = f"tile_{width}x{height}_{rotated}_{int(image_format)}"
+        tile = self.tile_store.get_image(stamp, name) if persist else None
+        if tile is not None:
+            tile = tile.convertToFormat(image_format)
+        else:
+            # 只按单元格所需的分辨率解码，旋转时宽高互换
+            if rotated % 2:
+                image = self.source_image(source, height, width)
+            else:
+                image = self.source_image(source, width, height)
+            if image is None:
+                # 源照片读取失败时留白，不写入缓存
+                tile = QImage(width, height, image_format)
+                tile.fill(Qt.white)
+                return tile
+            tile = scale_tile(image, width, height, rotated, image_format)
+            if persist:
+                self.tile_store.put_image(stamp, name, tile)
+        self.image_cache.put(key, tile)
+        return tile
+    
     def resizeEvent(self, event):
         """窗口大小改变时更新预览"""
         super().resizeEvent(event)
         self.update_preview()
 
 if __name__ == "__main__":
+    # 命令行校验：python 照片排版工具5a.py --check-dpi 文件...
+    if len(sys.argv) > 2 and sys.argv[1] == "--check-dpi":
+        for path in sys.argv[2:]:
+            dpi = read_image_dpi(path)
+            print(f"{path}: {f'{dpi[0]}×{dpi[1]} DPI' if dpi else '未找到分辨率信息'}")
+        sys.exit(0)
+    
+    # 批量执行订单清单：python 照片排版工具5a.py --run-manifest 清单.csv [进程数]
+    if len(sys.argv) > 2 and sys.argv[1] == "--run-manifest":
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        sys.exit(run_manifest(sys.argv[2], workers))
+    
+    # 单实例：已有窗口在运行时把文件交给它后立即退出，不再创建界面
     app = QApplication(sys.argv)
+    file_args = [arg for arg in app.arguments()[1:] if os.path.exists(arg)]
+    if forward_to_running_instance(file_args):
+        sys.exit(0)
+    # 先占用服务名再创建界面；同时启动的另一个窗口已占用时把文件交给它
+    instance_server = SingleInstanceServer(app)
+    if not instance_server.listen() and forward_to_running_instance(file_args):
+        sys.exit(0)
+    
     window = EnhancedPhotoLayoutTool()
+    instance_server.filesReceived.connect(window.open_files)
     window.show()
+    if file_args:
+        window.open_files(file_args)
     sys.exit(app.exec_())
\ No newline at end of file